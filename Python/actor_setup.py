@@ -0,0 +1,88 @@
+"""
+Post-spawn actor configuration.
+
+The settings of the spawned actors are declared up front as rules keyed
+by blueprint pattern, and applied in a single pass over just the new
+actor ids: one get_actors() call for all of them and one batch for the
+commands that support batching.
+"""
+
+from __future__ import print_function
+
+import fnmatch
+
+import carla
+
+
+class ActorSetupRule(object):
+
+    """
+    Settings applied to every actor whose type id matches the pattern
+    """
+
+    def __init__(self, pattern, lights_on=None, target_speed=None):
+        self.pattern = pattern
+        self.lights_on = lights_on
+        self.target_speed = target_speed
+
+    def matches(self, type_id):
+        return fnmatch.fnmatchcase(type_id, self.pattern)
+
+
+class ActorSetup(object):
+
+    """
+    Collects the rules and applies them to a set of new actors.
+
+    Usage:
+    setup = ActorSetup()
+    setup.add_rule('vehicle.*', lights_on=True)
+    setup.add_rule('vehicle.indic.auto01', target_speed=20.0)
+    setup.apply(client, world, traffic_manager, actor_ids)
+    """
+
+    def __init__(self):
+        self._rules = []
+
+    def add_rule(self, pattern, lights_on=None, target_speed=None):
+        """
+        Declare the settings of the actors matching pattern.
+        Later rules override earlier ones for the settings they define.
+        """
+        self._rules.append(ActorSetupRule(pattern, lights_on, target_speed))
+        return self
+
+    def _settings(self, type_id):
+        settings = {'lights_on': None, 'target_speed': None}
+        for rule in self._rules:
+            if not rule.matches(type_id):
+                continue
+            if rule.lights_on is not None:
+                settings['lights_on'] = rule.lights_on
+            if rule.target_speed is not None:
+                settings['target_speed'] = rule.target_speed
+        return settings
+
+    def apply(self, client, world, traffic_manager, actor_ids):
+        """
+        Apply the rules to the given actors, returns the number of configured actors
+        """
+        if not actor_ids or not self._rules:
+            return 0
+
+        commands = []
+        configured = 0
+        for actor in world.get_actors(list(actor_ids)):
+            settings = self._settings(actor.type_id)
+            if settings['lights_on'] is not None and isinstance(actor, carla.Vehicle):
+                # Light updates are owned by the traffic manager, they have no batch command
+                traffic_manager.update_vehicle_lights(actor, settings['lights_on'])
+            if settings['target_speed'] is not None:
+                velocity = settings['target_speed'] * actor.get_transform().get_forward_vector()
+                commands.append(carla.command.ApplyTargetVelocity(actor.id, velocity))
+            if settings != {'lights_on': None, 'target_speed': None}:
+                configured += 1
+
+        if commands:
+            client.apply_batch(commands)
+        return configured
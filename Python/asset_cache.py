@@ -0,0 +1,78 @@
+"""
+Rendered assets of the launcher.
+
+The launcher background is a photo resized to the screen and blurred,
+which takes a good part of a second on the kiosk, before the window can
+appear. The rendered pixels are saved under .cache/launcher, keyed by
+the source file (path, mtime, size), the screen size and the blur
+radius, and later starts read them back in one go.
+"""
+
+from __future__ import print_function
+
+import glob
+import hashlib
+import json
+import os
+import time
+
+from PIL import Image, ImageFilter
+
+from runner_cache import cache_path, write_atomic
+
+CACHE_VERSION = 1
+
+STARTUP_FILE = 'startup_times.jsonl'
+
+
+def _key(path, size, radius):
+    stat = os.stat(path)
+    fields = (CACHE_VERSION, os.path.abspath(path), stat.st_mtime_ns, stat.st_size, tuple(size), radius)
+    return hashlib.sha1(repr(fields).encode('utf-8')).hexdigest()
+
+
+def render_background(path, size, radius):
+    """
+    The source image resized to size and blurred
+    """
+    image = Image.open(path).convert('RGB')
+    image = image.resize(size, Image.LANCZOS)
+    return image.filter(ImageFilter.GaussianBlur(radius=radius))
+
+
+def rendered_background(path, size, radius=5):
+    """
+    (image, cached) of the background, rendered only if the cache has no
+    up to date copy
+    """
+    size = tuple(int(x) for x in size)
+    cached_path = cache_path('launcher', 'background-{}.rgb'.format(_key(path, size, radius)))
+    try:
+        with open(cached_path, 'rb') as fp:
+            data = fp.read()
+        if len(data) == size[0] * size[1] * 3:
+            return Image.frombytes('RGB', size, data), True
+    except OSError:
+        pass
+
+    image = render_background(path, size, radius)
+    try:
+        # Renderings of an older source or another screen are not needed anymore
+        for stale_path in glob.glob(os.path.join(os.path.dirname(cached_path), 'background-*.rgb')):
+            os.remove(stale_path)
+        write_atomic(cached_path, image.tobytes())
+    except OSError as e:
+        print("Cannot cache the launcher background: {}".format(e))
+    return image, False
+
+
+def record_startup(seconds, **fields):
+    """
+    Append a time-to-first-frame measurement to the launcher startup log
+    """
+    record = dict(fields, time=time.time(), first_frame=seconds)
+    try:
+        with open(cache_path('launcher', STARTUP_FILE), 'a', encoding='utf-8') as fp:
+            fp.write(json.dumps(record) + '\n')
+    except OSError as e:
+        print("Cannot record the startup time: {}".format(e))
@@ -0,0 +1,371 @@
+#!/usr/bin/env python
+
+"""
+Parallel batch execution of scenario runs over several CARLA servers.
+
+Every job (one route, one scenario or one level / scene / town of a
+sweep, times the repetitions) is queued once and a pool of worker
+processes, each owning one (host, port, trafficManagerPort) endpoint,
+takes them in turn. A worker keeps its ScenarioRunner between jobs.
+
+When a run raises because the server is lost (RuntimeError of the client,
+or a server that no longer answers), the worker drops its runner, hands
+the job back to be retried by any worker and backs off. A worker whose
+endpoint keeps failing retires. Any other error (missing scenarios file,
+bad route, scenario error) fails the job only, the endpoint stays. If a worker process dies, its
+running job is handed back as well. The results of all the jobs are
+merged into <outputDir>/batch-<time>.json.
+
+    python3 batch_runner.py --endpoints 127.0.0.1:2000:8000 127.0.0.1:2002:8002 --sweep
+    python3 batch_runner.py --endpoints 127.0.0.1:2000 127.0.0.1:2002 \\
+        --route srunner/data/final_routes_loop.xml scenarios.json 0 1 2 --repetitions 3 -- --sync
+
+Arguments after "--" are passed to every run of scenario_runner.py.
+The runner module can be replaced (--runnerModule) by any module with
+the build_parser / apply_mode_defaults / ScenarioRunner interface of
+scenario_runner.py, to exercise the batch against a stand-in server.
+"""
+
+from __future__ import print_function
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import time
+import traceback
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+import difficulty_profiles
+from results_store import RESULTS_FILE
+
+
+class Endpoint(object):
+
+    """
+    One CARLA server and the port of its traffic manager
+    """
+
+    def __init__(self, host, port, tm_port=None):
+        self.host = host
+        self.port = int(port)
+        self.tm_port = int(tm_port) if tm_port is not None else self.port + 6000
+
+    @classmethod
+    def parse(cls, text):
+        """
+        host[:port[:trafficManagerPort]]
+        """
+        parts = text.split(':')
+        if not 1 <= len(parts) <= 3 or not parts[0]:
+            raise ValueError("Invalid endpoint: {}".format(text))
+        return cls(parts[0], *(parts[1:] or [2000]))
+
+    @property
+    def name(self):
+        return "{}:{}".format(self.host, self.port)
+
+    def argv(self):
+        return ['--host', self.host, '--port', str(self.port), '--trafficManagerPort', str(self.tm_port)]
+
+
+def route_ids(routes_file):
+    """
+    Ids of the routes of a routes file, in file order
+    """
+    return [route.attrib['id'] for route in ET.parse(routes_file).getroot().iter('route')]
+
+
+def route_jobs(routes_file, scenarios_file, ids=None, repetitions=1):
+    """
+    One job per route and repetition
+    """
+    ids = ids or route_ids(routes_file)
+    return [{'label': 'route {}'.format(x),
+             'argv': ['--route', routes_file, scenarios_file, str(x), '--repetitions', '1']}
+            for x in ids for _ in range(repetitions)]
+
+
+def scenario_jobs(scenarios, repetitions=1):
+    """
+    One job per scenario (or scenario group) and repetition
+    """
+    return [{'label': scenario, 'argv': ['--scenario', scenario, '--repetitions', '1']}
+            for scenario in scenarios for _ in range(repetitions)]
+
+
+def sweep_jobs(levels, scenes, towns, repetitions=1, agent=difficulty_profiles.DEFAULT_AGENT,
+               weather=difficulty_profiles.DEFAULT_WEATHER):
+    """
+    One job per level and scene offered by the launcher, town and repetition,
+    with the launcher's command line. scenes=None takes every scene of a level.
+    """
+    return [{'label': '{} scene {} {}'.format(level, scene, difficulty_profiles.TOWN_NAMES[town]),
+             'argv': difficulty_profiles.build_runner_arguments(level, scene, town, agent, weather, telemetry=None)}
+            for level, scene in difficulty_profiles.launcher_scenes(levels, scenes)
+            for town in towns for _ in range(repetitions)]
+
+
+def _destroy(runner):
+    try:
+        runner.destroy()
+    except Exception:       # pylint: disable=broad-except
+        traceback.print_exc()
+
+
+def _endpoint_lost(runner, error):
+    """
+    Whether a run raised because the server is gone, rather than because of the job
+    """
+    if isinstance(error, RuntimeError):
+        return True     # time-out or lost connection of the CARLA client
+    client = getattr(runner, 'client', None)
+    if client is None:
+        return False
+    try:
+        client.get_server_version()
+    except Exception:       # pylint: disable=broad-except
+        return True
+    return False
+
+
+def _worker(endpoint, runner_module_name, jobs, events, extra_argv, output_dir, retry_delay, max_failures):
+    """
+    Worker process: run the jobs of the queue on one endpoint until it gets None
+    """
+    runner_module = importlib.import_module(runner_module_name)
+    parser = runner_module.build_parser()
+    runner = None
+    failures = 0        # consecutive runs that raised on this endpoint
+    worker_output = os.path.join(output_dir, endpoint.name.replace(':', '_'))
+
+    try:
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            events.put(('start', endpoint.name, job))
+            record = {'job_id': job['job_id'], 'label': job['label'], 'endpoint': endpoint.name,
+                      'attempts': job['attempts'] + 1, 'started': time.time()}
+
+            # All the workers append to the same results store
+            argv = endpoint.argv() + job['argv'] + extra_argv + [
+                '--outputDir', worker_output, '--resultsDb', os.path.join(output_dir, RESULTS_FILE)]
+            try:
+                arguments = runner_module.apply_mode_defaults(parser.parse_args(argv))
+            except SystemExit:
+                record.update(result=False, error='invalid arguments: {}'.format(' '.join(argv)),
+                              finished=time.time())
+                events.put(('done', endpoint.name, record))
+                continue
+
+            try:
+                if runner is None:
+                    runner = runner_module.ScenarioRunner(arguments)
+                else:
+                    runner.reconfigure(arguments)
+                result = runner.run()
+            except Exception as e:      # pylint: disable=broad-except
+                traceback.print_exc()
+                lost = _endpoint_lost(runner, e)
+                if runner is not None:
+                    _destroy(runner)
+                    runner = None
+                if not lost:
+                    # The job is wrong, not the server: fail it here, without a retry
+                    record.update(result=False, error=str(e), finished=time.time())
+                    events.put(('done', endpoint.name, record))
+                    continue
+                # Start over with a new runner, maybe elsewhere
+                failures += 1
+                events.put(('failed', endpoint.name, job, str(e)))
+                if failures >= max_failures:
+                    events.put(('retire', endpoint.name, str(e)))
+                    break
+                time.sleep(retry_delay * failures)
+                continue
+
+            failures = 0
+            record.update(result=bool(result), error=None, finished=time.time())
+            events.put(('done', endpoint.name, record))
+            if getattr(runner, '_shutdown_requested', False):
+                break
+    finally:
+        if runner is not None:
+            _destroy(runner)
+
+
+class BatchRunner(object):
+
+    """
+    Runs a list of jobs over a pool of endpoints, one worker process each.
+
+    Usage:
+    batch = BatchRunner([Endpoint('127.0.0.1', 2000), Endpoint('127.0.0.1', 2002)])
+    results = batch.run(route_jobs(routes_file, scenarios_file))
+    """
+
+    def __init__(self, endpoints, runner_module='scenario_runner', extra_argv=None, output_dir='feedback',
+                 max_retries=2, retry_delay=5.0, max_endpoint_failures=3):
+        if not endpoints:
+            raise ValueError("At least one endpoint is required")
+        self.endpoints = list(endpoints)
+        self.runner_module = runner_module
+        self.extra_argv = list(extra_argv or [])
+        self.output_dir = output_dir
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_endpoint_failures = max_endpoint_failures
+
+    def run(self, jobs):
+        """
+        Run all the jobs and return their merged results, in job order
+        """
+        # Workers are spawned, not forked, so none of them inherits a CARLA client
+        context = multiprocessing.get_context('spawn')
+        job_queue = context.Queue()
+        events = context.Queue()
+
+        pending = {}
+        for job_id, job in enumerate(jobs):
+            job = dict(job, job_id=job_id, attempts=0)
+            pending[job_id] = job
+            job_queue.put(job)
+        results = {}
+
+        workers = {}
+        for endpoint in self.endpoints:
+            process = context.Process(
+                target=_worker, name='batch-{}'.format(endpoint.name),
+                args=(endpoint, self.runner_module, job_queue, events, self.extra_argv, self.output_dir,
+                      self.retry_delay, self.max_endpoint_failures))
+            process.start()
+            workers[endpoint.name] = process
+        running = {}        # endpoint name -> job it is running
+
+        def retry(job, error):
+            job = dict(job, attempts=job['attempts'] + 1)
+            if job['attempts'] > self.max_retries:
+                results[job['job_id']] = {'job_id': job['job_id'], 'label': job['label'], 'endpoint': None,
+                                          'attempts': job['attempts'], 'result': False, 'error': error}
+                pending.pop(job['job_id'], None)
+                print("Giving up on job {} ({}): {}".format(job['job_id'], job['label'], error))
+            else:
+                pending[job['job_id']] = job
+                job_queue.put(job)
+                print("Retrying job {} ({}): {}".format(job['job_id'], job['label'], error))
+
+        try:
+            while pending:
+                try:
+                    event = events.get(timeout=1.0)
+                except queue.Empty:
+                    event = None
+
+                if event is not None:
+                    kind, name = event[0], event[1]
+                    if kind == 'start':
+                        running[name] = event[2]
+                    elif kind == 'done':
+                        running.pop(name, None)
+                        record = event[2]
+                        results[record['job_id']] = record
+                        pending.pop(record['job_id'], None)
+                        print("[{}/{}] {} on {}: {}".format(len(results), len(results) + len(pending),
+                                                            record['label'], name,
+                                                            'passed' if record['result'] else 'failed'))
+                    elif kind == 'failed':
+                        running.pop(name, None)
+                        retry(event[2], event[3])
+                    elif kind == 'retire':
+                        print("Endpoint {} retired: {}".format(name, event[2]))
+                    continue
+
+                # A worker that died hands its running job back
+                for name, process in workers.items():
+                    if not process.is_alive() and name in running:
+                        retry(running.pop(name), 'worker exited with code {}'.format(process.exitcode))
+
+                if not any(x.is_alive() for x in workers.values()):
+                    for job in list(pending.values()):
+                        results[job['job_id']] = {'job_id': job['job_id'], 'label': job['label'],
+                                                  'endpoint': None, 'attempts': job['attempts'],
+                                                  'result': False, 'error': 'no endpoint left'}
+                    pending.clear()
+        finally:
+            for _ in workers:
+                job_queue.put(None)
+            for process in workers.values():
+                process.join(timeout=30)
+                if process.is_alive():
+                    process.terminate()
+
+        return [results[job_id] for job_id in sorted(results)]
+
+    def save(self, results):
+        """
+        Write the merged results next to the feedback files
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, 'batch-{}.json'.format(datetime.now().strftime('%Y-%m-%d-%H-%M-%S')))
+        with open(path, 'w', encoding='utf-8') as fp:
+            json.dump({'endpoints': [x.name for x in self.endpoints], 'results': results}, fp, indent=4)
+        return path
+
+
+def main():
+    """
+    Run a batch from the command line
+    """
+    argv = sys.argv[1:]
+    extra_argv = []
+    if '--' in argv:
+        extra_argv = argv[argv.index('--') + 1:]
+        argv = argv[:argv.index('--')]
+
+    parser = argparse.ArgumentParser(description="Run scenario batches over several CARLA servers",
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--endpoints', nargs='+', required=True, type=Endpoint.parse,
+                        help='CARLA servers as host[:port[:trafficManagerPort]]')
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument('--route', nargs='+', help='routes_file scenarios_file [route ids...]')
+    mode.add_argument('--scenario', nargs='+', help='Scenarios (or group:Class) to run')
+    mode.add_argument('--sweep', action='store_true', help='Every level x scene x town of the launcher')
+    parser.add_argument('--levels', nargs='+', default=['easy', 'intermediate', 'hard'])
+    parser.add_argument('--scenes', nargs='+', help='Scenes of the sweep (default: every scene of each level)')
+    parser.add_argument('--towns', nargs='+', type=int, default=sorted(difficulty_profiles.TOWN_NAMES))
+    parser.add_argument('--agent', default=difficulty_profiles.DEFAULT_AGENT, help='Agent of the sweep runs')
+    parser.add_argument('--weather', default=difficulty_profiles.DEFAULT_WEATHER, help='Weather of the sweep runs')
+    parser.add_argument('--repetitions', default=1, type=int, help='Runs of every job')
+    parser.add_argument('--outputDir', default='feedback', help='Directory for the output files')
+    parser.add_argument('--maxRetries', default=2, type=int, help='Retries of a job whose run raised')
+    parser.add_argument('--retryDelay', default=5.0, type=float, help='Back off (s) after a failed run')
+    parser.add_argument('--runnerModule', default='scenario_runner', help='Module providing the ScenarioRunner')
+    args = parser.parse_args(argv)
+
+    if args.route:
+        if len(args.route) < 2:
+            parser.error("--route needs a routes file and a scenarios file")
+        jobs = route_jobs(args.route[0], args.route[1], args.route[2:], args.repetitions)
+    elif args.scenario:
+        jobs = scenario_jobs(args.scenario, args.repetitions)
+    else:
+        jobs = sweep_jobs(args.levels, args.scenes, args.towns, args.repetitions, args.agent, args.weather)
+
+    batch = BatchRunner(args.endpoints, args.runnerModule, extra_argv, args.outputDir,
+                        args.maxRetries, args.retryDelay)
+    print("Running {} jobs on {} endpoints".format(len(jobs), len(args.endpoints)))
+    start = time.time()
+    results = batch.run(jobs)
+    passed = sum(1 for x in results if x['result'])
+    print("{} of {} jobs passed in {:.1f}s, results in {}".format(
+        passed, len(results), time.time() - start, batch.save(results)))
+    return 0 if passed == len(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
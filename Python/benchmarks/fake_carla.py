@@ -0,0 +1,1291 @@
+"""
+In-process stand-in for the `carla` module.
+
+It simulates a server with one synthetic grid town: a client, a world,
+the blueprint library, actor lists, traffic lights, the traffic manager
+and the batch commands. No GPU, no network. Every call that would be a
+round trip to the real server is counted and can be given a latency.
+Calls the real client answers locally, like blueprint filtering,
+snapshots, map queries and actor transforms, are free.
+
+Usage (before anything imports carla):
+
+    import fake_carla
+    fake_carla.install(latency=0.002)
+    import scenario_runner
+    ...
+    print(fake_carla.stats())
+
+The simulation is only as deep as the scenario runner setup needs. Actors
+do not move, collisions are a minimum distance check between actors.
+"""
+
+from __future__ import print_function
+
+import collections
+import fnmatch
+import itertools
+import math
+import random
+import sys
+import threading
+import time
+import types
+
+__version__ = '0.9.13'
+
+
+# ==============================================================================
+# -- RPC accounting ------------------------------------------------------------
+# ==============================================================================
+
+class _Stats(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = collections.Counter()
+        self.commands = collections.Counter()
+        self.latency = 0.0          # seconds per round trip
+        self.load_world_time = 0.0  # extra seconds of load_world / reload_world
+
+    def rpc(self, name, extra=0.0):
+        with self.lock:
+            self.calls[name] += 1
+        delay = self.latency + extra
+        if delay > 0:
+            time.sleep(delay)
+
+
+_STATS = _Stats()
+
+
+def stats():
+    """
+    Round trips per method name, and the commands sent in batches
+    """
+    with _STATS.lock:
+        return {'rpc': dict(_STATS.calls), 'rpc_total': sum(_STATS.calls.values()),
+                'commands': dict(_STATS.commands), 'commands_total': sum(_STATS.commands.values())}
+
+
+def reset_stats():
+    with _STATS.lock:
+        _STATS.calls.clear()
+        _STATS.commands.clear()
+
+
+def configure(latency=None, load_world_time=None):
+    """
+    Seconds added to every round trip, and to every map load
+    """
+    if latency is not None:
+        _STATS.latency = float(latency)
+    if load_world_time is not None:
+        _STATS.load_world_time = float(load_world_time)
+
+
+def install(latency=None, load_world_time=None):
+    """
+    Make `import carla` return this module
+    """
+    configure(latency, load_world_time)
+    module = sys.modules[__name__]
+    sys.modules['carla'] = module
+    sys.modules['carla.command'] = command
+    return module
+
+
+# ==============================================================================
+# -- Geometry ------------------------------------------------------------------
+# ==============================================================================
+
+class Vector3D(object):
+
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x = float(x)
+        self.y = float(y)
+        self.z = float(z)
+
+    def length(self):
+        return math.sqrt(self.x ** 2 + self.y ** 2 + self.z ** 2)
+
+    def make_unit_vector(self):
+        length = self.length() or 1.0
+        return type(self)(self.x / length, self.y / length, self.z / length)
+
+    def __add__(self, other):
+        return type(self)(self.x + other.x, self.y + other.y, self.z + other.z)
+
+    def __sub__(self, other):
+        return type(self)(self.x - other.x, self.y - other.y, self.z - other.z)
+
+    def __mul__(self, scalar):
+        return type(self)(self.x * scalar, self.y * scalar, self.z * scalar)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, scalar):
+        return type(self)(self.x / scalar, self.y / scalar, self.z / scalar)
+
+    def __eq__(self, other):
+        return isinstance(other, Vector3D) and (self.x, self.y, self.z) == (other.x, other.y, other.z)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = object.__hash__
+
+    def __repr__(self):
+        return "{}(x={:.6f}, y={:.6f}, z={:.6f})".format(type(self).__name__, self.x, self.y, self.z)
+
+
+class Vector2D(object):
+
+    def __init__(self, x=0.0, y=0.0):
+        self.x = float(x)
+        self.y = float(y)
+
+
+class Location(Vector3D):
+
+    def distance(self, other):
+        return (self - other).length()
+
+
+class Rotation(object):
+
+    def __init__(self, pitch=0.0, yaw=0.0, roll=0.0):
+        self.pitch = float(pitch)
+        self.yaw = float(yaw)
+        self.roll = float(roll)
+
+    def get_forward_vector(self):
+        pitch, yaw = math.radians(self.pitch), math.radians(self.yaw)
+        return Vector3D(math.cos(pitch) * math.cos(yaw), math.cos(pitch) * math.sin(yaw), math.sin(pitch))
+
+    def get_right_vector(self):
+        yaw = math.radians(self.yaw)
+        return Vector3D(-math.sin(yaw), math.cos(yaw), 0.0)
+
+    def get_up_vector(self):
+        return Vector3D(0.0, 0.0, 1.0)
+
+    def __eq__(self, other):
+        return isinstance(other, Rotation) and (self.pitch, self.yaw, self.roll) == (other.pitch, other.yaw, other.roll)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = object.__hash__
+
+    def __repr__(self):
+        return "Rotation(pitch={:.6f}, yaw={:.6f}, roll={:.6f})".format(self.pitch, self.yaw, self.roll)
+
+
+class Transform(object):
+
+    def __init__(self, location=None, rotation=None):
+        self.location = location if location is not None else Location()
+        self.rotation = rotation if rotation is not None else Rotation()
+
+    def transform(self, point):
+        """
+        Local -> world coordinates (yaw only)
+        """
+        yaw = math.radians(self.rotation.yaw)
+        x = point.x * math.cos(yaw) - point.y * math.sin(yaw)
+        y = point.x * math.sin(yaw) + point.y * math.cos(yaw)
+        return Location(self.location.x + x, self.location.y + y, self.location.z + point.z)
+
+    def get_forward_vector(self):
+        return self.rotation.get_forward_vector()
+
+    def get_right_vector(self):
+        return self.rotation.get_right_vector()
+
+    def get_up_vector(self):
+        return self.rotation.get_up_vector()
+
+    def __eq__(self, other):
+        return isinstance(other, Transform) and self.location == other.location and self.rotation == other.rotation
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = object.__hash__
+
+    def __repr__(self):
+        return "Transform({}, {})".format(self.location, self.rotation)
+
+
+class BoundingBox(object):
+
+    def __init__(self, location=None, extent=None):
+        self.location = location if location is not None else Location()
+        self.extent = extent if extent is not None else Vector3D(1.0, 1.0, 1.0)
+        self.rotation = Rotation()
+
+
+class GeoLocation(object):
+
+    def __init__(self, latitude=0.0, longitude=0.0, altitude=0.0):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.altitude = altitude
+
+
+class Color(object):
+
+    def __init__(self, r=0, g=0, b=0, a=255):
+        self.r = r
+        self.g = g
+        self.b = b
+        self.a = a
+
+
+# ==============================================================================
+# -- Enums and controls --------------------------------------------------------
+# ==============================================================================
+
+class LaneType(object):
+    NONE = 1
+    Driving = 2
+    Stop = 4
+    Shoulder = 8
+    Biking = 16
+    Sidewalk = 32
+    Border = 64
+    Parking = 1024
+    Any = -2
+
+
+class LaneChange(object):
+    NONE = 0
+    Right = 1
+    Left = 2
+    Both = 3
+
+
+class TrafficLightState(object):
+    Red = 0
+    Yellow = 1
+    Green = 2
+    Off = 3
+    Unknown = 4
+
+
+class VehicleLightState(object):
+    NONE = 0
+    Position = 1
+    LowBeam = 2
+    HighBeam = 4
+    Brake = 8
+    RightBlinker = 16
+    LeftBlinker = 32
+    Reverse = 64
+    Fog = 128
+    Interior = 256
+    Special1 = 512
+    Special2 = 1024
+    All = 0xFFFFFFFF
+
+
+class AttachmentType(object):
+    Rigid = 0
+    SpringArm = 1
+
+
+class ActorAttributeType(object):
+    Bool = 0
+    Int = 1
+    Float = 2
+    String = 3
+    RGBColor = 4
+
+
+class VehicleControl(object):
+
+    def __init__(self, throttle=0.0, steer=0.0, brake=0.0, hand_brake=False, reverse=False,
+                 manual_gear_shift=False, gear=0):
+        self.throttle = throttle
+        self.steer = steer
+        self.brake = brake
+        self.hand_brake = hand_brake
+        self.reverse = reverse
+        self.manual_gear_shift = manual_gear_shift
+        self.gear = gear
+
+
+class WalkerControl(object):
+
+    def __init__(self, direction=None, speed=0.0, jump=False):
+        self.direction = direction if direction is not None else Vector3D(1.0, 0.0, 0.0)
+        self.speed = speed
+        self.jump = jump
+
+
+class WeatherParameters(object):
+
+    def __init__(self, cloudiness=0.0, precipitation=0.0, precipitation_deposits=0.0, wind_intensity=0.0,
+                 sun_azimuth_angle=0.0, sun_altitude_angle=0.0, fog_density=0.0, fog_distance=0.0,
+                 wetness=0.0, fog_falloff=0.0):
+        self.cloudiness = cloudiness
+        self.precipitation = precipitation
+        self.precipitation_deposits = precipitation_deposits
+        self.wind_intensity = wind_intensity
+        self.sun_azimuth_angle = sun_azimuth_angle
+        self.sun_altitude_angle = sun_altitude_angle
+        self.fog_density = fog_density
+        self.fog_distance = fog_distance
+        self.wetness = wetness
+        self.fog_falloff = fog_falloff
+
+    def __repr__(self):
+        return "WeatherParameters(cloudiness={}, precipitation={}, sun_altitude_angle={})".format(
+            self.cloudiness, self.precipitation, self.sun_altitude_angle)
+
+
+def _weather_presets():
+    skies = {'Clear': (5.0, 0.0), 'Cloudy': (60.0, 0.0), 'Wet': (5.0, 0.0), 'WetCloudy': (60.0, 0.0),
+             'SoftRain': (20.0, 30.0), 'MidRainy': (60.0, 60.0), 'MidRain': (60.0, 60.0),
+             'HardRain': (100.0, 100.0)}
+    suns = {'Noon': 75.0, 'Sunset': 15.0, 'Night': -90.0}
+    for (sky, (clouds, rain)), (time_of_day, altitude) in itertools.product(skies.items(), suns.items()):
+        setattr(WeatherParameters, sky + time_of_day,
+                WeatherParameters(cloudiness=clouds, precipitation=rain, sun_altitude_angle=altitude))
+    WeatherParameters.Default = WeatherParameters.ClearNoon     # pylint: disable=no-member
+
+
+_weather_presets()
+
+
+# ==============================================================================
+# -- Blueprints ----------------------------------------------------------------
+# ==============================================================================
+
+class ActorAttribute(object):
+
+    def __init__(self, attribute_id, value, recommended_values=(), modifiable=True):
+        self.id = attribute_id
+        self.value = str(value)
+        self.recommended_values = list(recommended_values)
+        self.is_modifiable = modifiable
+        self.type = ActorAttributeType.String
+
+    def as_bool(self):
+        return self.value.lower() == 'true'
+
+    def as_int(self):
+        return int(self.value)
+
+    def as_float(self):
+        return float(self.value)
+
+    def as_str(self):
+        return self.value
+
+    def as_color(self):
+        r, g, b = (int(x) for x in self.value.split(','))
+        return Color(r, g, b)
+
+    def __int__(self):
+        return self.as_int()
+
+    def __float__(self):
+        return self.as_float()
+
+    def __str__(self):
+        return self.value
+
+    def __bool__(self):
+        return self.as_bool()
+
+    def __eq__(self, other):
+        return self.value == str(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = object.__hash__
+
+
+class ActorBlueprint(object):
+
+    def __init__(self, blueprint_id, tags, attributes):
+        self.id = blueprint_id
+        self.tags = list(tags)
+        self._attributes = {key: attribute for key, attribute in attributes.items()}
+
+    def copy(self):
+        attributes = {key: ActorAttribute(x.id, x.value, x.recommended_values, x.is_modifiable)
+                      for key, x in self._attributes.items()}
+        return ActorBlueprint(self.id, self.tags, attributes)
+
+    def has_tag(self, tag):
+        return tag in self.tags
+
+    def match_tags(self, pattern):
+        return any(fnmatch.fnmatchcase(tag, pattern) for tag in self.tags)
+
+    def has_attribute(self, attribute_id):
+        return attribute_id in self._attributes
+
+    def get_attribute(self, attribute_id):
+        try:
+            return self._attributes[attribute_id]
+        except KeyError:
+            raise IndexError("no attribute '{}' in {}".format(attribute_id, self.id))
+
+    def set_attribute(self, attribute_id, value):
+        attribute = self.get_attribute(attribute_id)
+        if not attribute.is_modifiable:
+            raise IndexError("attribute '{}' is not modifiable".format(attribute_id))
+        attribute.value = str(value)
+
+    def __iter__(self):
+        return iter(self._attributes.values())
+
+    def __len__(self):
+        return len(self._attributes)
+
+    def __repr__(self):
+        return "ActorBlueprint(id={},tags={})".format(self.id, self.tags)
+
+
+class BlueprintLibrary(object):
+
+    def __init__(self, blueprints):
+        self._blueprints = list(blueprints)
+
+    def filter(self, pattern):
+        return BlueprintLibrary(x for x in self._blueprints
+                                if fnmatch.fnmatchcase(x.id, pattern) or x.match_tags(pattern))
+
+    def find(self, blueprint_id):
+        for blueprint in self._blueprints:
+            if blueprint.id == blueprint_id:
+                return blueprint
+        raise IndexError("blueprint '{}' not found".format(blueprint_id))
+
+    def __getitem__(self, index):
+        return self._blueprints[index]
+
+    def __len__(self):
+        return len(self._blueprints)
+
+    def __iter__(self):
+        return iter(self._blueprints)
+
+
+# Blueprint ids of the Indic traffic plus a few stock ones the runner asks for
+VEHICLE_BLUEPRINTS = (
+    ['vehicle.lincoln.mkz_2017', 'vehicle.tesla.model3', 'vehicle.audi.a2', 'vehicle.nissan.micra',
+     'vehicle.indic.auto01', 'vehicle.auto02.auto02'] +
+    ['vehicle.indic_twowheeler.bike{:02d}'.format(i) for i in range(1, 7)] +
+    ['vehicle.indic_threewheeler.auto{:02d}'.format(i) for i in range(1, 4)] +
+    ['vehicle.indic_fourwheeler.nano{:02d}'.format(i) for i in range(1, 4)] +
+    ['vehicle.indic_heavyvehicle.bus{:02d}'.format(i) for i in range(1, 3)])
+WALKER_BLUEPRINTS = ['walker.pedestrian.{:04d}'.format(i) for i in range(1, 31)]
+
+
+def _build_library():
+    blueprints = []
+    for blueprint_id in VEHICLE_BLUEPRINTS:
+        _, make, model = blueprint_id.split('.')
+        blueprints.append(ActorBlueprint(blueprint_id, [make, model], {
+            'role_name': ActorAttribute('role_name', 'autopilot'),
+            'color': ActorAttribute('color', '255,255,255', ['255,255,255', '0,0,0', '200,20,20', '20,20,200']),
+            'driver_id': ActorAttribute('driver_id', '0', ['0', '1', '2']),
+            'number_of_wheels': ActorAttribute('number_of_wheels',
+                                               '2' if 'twowheeler' in blueprint_id else '4', modifiable=False),
+            'generation': ActorAttribute('generation', '2', modifiable=False),
+        }))
+    for blueprint_id in WALKER_BLUEPRINTS:
+        blueprints.append(ActorBlueprint(blueprint_id, ['pedestrian', blueprint_id.split('.')[-1]], {
+            'role_name': ActorAttribute('role_name', 'pedestrian'),
+            'is_invincible': ActorAttribute('is_invincible', 'true'),
+            'speed': ActorAttribute('speed', '1.4', ['0.0', '1.4', '3.0'], modifiable=False),
+            'generation': ActorAttribute('generation', '2', modifiable=False),
+        }))
+    for blueprint_id in ('controller.ai.walker', 'traffic.traffic_light', 'spectator'):
+        blueprints.append(ActorBlueprint(blueprint_id, blueprint_id.split('.')[1:], {
+            'role_name': ActorAttribute('role_name', '')}))
+    return blueprints
+
+
+# ==============================================================================
+# -- Actors --------------------------------------------------------------------
+# ==============================================================================
+
+class Actor(object):
+
+    def __init__(self, world, actor_id, type_id, attributes, transform, parent=None):
+        self._world = world
+        self.id = actor_id
+        self.type_id = type_id
+        self.attributes = attributes
+        self.parent = parent
+        self.semantic_tags = []
+        self.bounding_box = BoundingBox(extent=Vector3D(2.0, 1.0, 0.8))
+        self._transform = transform
+        self._velocity = Vector3D()
+        self._alive = True
+
+    @property
+    def is_alive(self):
+        return self._alive
+
+    def get_world(self):
+        return self._world
+
+    # Transforms and velocities come with the snapshots, they cost no round trip
+    def get_location(self):
+        return self._transform.location
+
+    def get_transform(self):
+        return self._transform
+
+    def get_velocity(self):
+        return self._velocity
+
+    def get_angular_velocity(self):
+        return Vector3D()
+
+    def get_acceleration(self):
+        return Vector3D()
+
+    def set_location(self, location):
+        _STATS.rpc('Actor.set_location')
+        self._transform = Transform(location, self._transform.rotation)
+
+    def set_transform(self, transform):
+        _STATS.rpc('Actor.set_transform')
+        self._transform = transform
+
+    def set_target_velocity(self, velocity):
+        _STATS.rpc('Actor.set_target_velocity')
+        self._velocity = velocity
+
+    def set_simulate_physics(self, enabled=True):
+        _STATS.rpc('Actor.set_simulate_physics')
+
+    def destroy(self):
+        _STATS.rpc('Actor.destroy')
+        return self._world._destroy(self.id)        # pylint: disable=protected-access
+
+    def __eq__(self, other):
+        return isinstance(other, Actor) and self.id == other.id
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return "Actor(id={}, type={})".format(self.id, self.type_id)
+
+
+class Vehicle(Actor):
+
+    def __init__(self, *args, **kwargs):
+        super(Vehicle, self).__init__(*args, **kwargs)
+        self._control = VehicleControl()
+        self._light_state = VehicleLightState.NONE
+
+    def apply_control(self, control):
+        _STATS.rpc('Vehicle.apply_control')
+        self._control = control
+
+    def get_control(self):
+        return self._control
+
+    def set_autopilot(self, enabled=True, tm_port=8000):
+        _STATS.rpc('Vehicle.set_autopilot')
+
+    def set_light_state(self, light_state):
+        _STATS.rpc('Vehicle.set_light_state')
+        self._light_state = light_state
+
+    def get_light_state(self):
+        return self._light_state
+
+    def get_speed_limit(self):
+        return 30.0
+
+    def get_traffic_light(self):
+        return None
+
+    def get_traffic_light_state(self):
+        return TrafficLightState.Green
+
+    def is_at_traffic_light(self):
+        return False
+
+
+class Walker(Actor):
+
+    def apply_control(self, control):
+        _STATS.rpc('Walker.apply_control')
+
+    def get_control(self):
+        return WalkerControl()
+
+
+class WalkerAIController(Actor):
+
+    def start(self):
+        _STATS.rpc('WalkerAIController.start')
+
+    def stop(self):
+        _STATS.rpc('WalkerAIController.stop')
+
+    def go_to_location(self, destination):
+        _STATS.rpc('WalkerAIController.go_to_location')
+
+    def set_max_speed(self, speed=1.4):
+        _STATS.rpc('WalkerAIController.set_max_speed')
+
+
+class TrafficLight(Actor):
+
+    def __init__(self, *args, **kwargs):
+        super(TrafficLight, self).__init__(*args, **kwargs)
+        self.state = TrafficLightState.Red
+        self.trigger_volume = BoundingBox(Location(0.0, 0.0, 0.0), Vector3D(2.0, 2.0, 1.0))
+        self.group = [self]
+        self._times = {'green': 10.0, 'yellow': 3.0, 'red': 2.0}
+        self._frozen = False
+
+    def get_state(self):
+        return self.state
+
+    def set_state(self, state):
+        _STATS.rpc('TrafficLight.set_state')
+        self.state = state
+
+    def set_green_time(self, seconds):
+        _STATS.rpc('TrafficLight.set_green_time')
+        self._times['green'] = seconds
+
+    def set_yellow_time(self, seconds):
+        _STATS.rpc('TrafficLight.set_yellow_time')
+        self._times['yellow'] = seconds
+
+    def set_red_time(self, seconds):
+        _STATS.rpc('TrafficLight.set_red_time')
+        self._times['red'] = seconds
+
+    def get_green_time(self):
+        return self._times['green']
+
+    def get_yellow_time(self):
+        return self._times['yellow']
+
+    def get_red_time(self):
+        return self._times['red']
+
+    def get_elapsed_time(self):
+        return 0.0
+
+    def freeze(self, freeze):
+        _STATS.rpc('TrafficLight.freeze')
+        self._frozen = freeze
+
+    def is_frozen(self):
+        return self._frozen
+
+    def get_pole_index(self):
+        return self.group.index(self)
+
+    def get_group_traffic_lights(self):
+        _STATS.rpc('TrafficLight.get_group_traffic_lights')
+        return list(self.group)
+
+    def reset_group(self):
+        _STATS.rpc('TrafficLight.reset_group')
+
+
+class ActorList(object):
+
+    def __init__(self, actors):
+        self._actors = list(actors)
+
+    def filter(self, pattern):
+        return ActorList(x for x in self._actors if fnmatch.fnmatchcase(x.type_id, pattern))
+
+    def find(self, actor_id):
+        for actor in self._actors:
+            if actor.id == actor_id:
+                return actor
+        return None
+
+    def __getitem__(self, index):
+        return self._actors[index]
+
+    def __len__(self):
+        return len(self._actors)
+
+    def __iter__(self):
+        return iter(self._actors)
+
+
+# ==============================================================================
+# -- Map -----------------------------------------------------------------------
+# ==============================================================================
+
+class Waypoint(object):
+
+    _ids = itertools.count(1)
+
+    def __init__(self, world_map, transform, road_id, lane_id, s, is_junction):
+        self._map = world_map
+        self.id = next(self._ids)
+        self.transform = transform
+        self.road_id = road_id
+        self.section_id = 0
+        self.lane_id = lane_id
+        self.s = s
+        self.is_junction = is_junction
+        self.junction_id = -1
+        self.lane_width = 3.5
+        self.lane_type = LaneType.Driving
+        self.lane_change = LaneChange.NONE
+
+    def next(self, distance):
+        return [self._map._advance(self, distance)]       # pylint: disable=protected-access
+
+    def previous(self, distance):
+        return [self._map._advance(self, -distance)]      # pylint: disable=protected-access
+
+    def get_left_lane(self):
+        return None
+
+    def get_right_lane(self):
+        return None
+
+    def __repr__(self):
+        return "Waypoint(road={}, lane={}, s={:.1f})".format(self.road_id, self.lane_id, self.s)
+
+
+class Map(object):
+
+    """
+    A grid town: `roads` straight two-lane roads per axis, `block` meters apart,
+    with junctions where they cross
+    """
+
+    def __init__(self, name, roads=6, block=100.0):
+        self.name = 'Carla/Maps/' + name
+        self._roads = roads
+        self._block = block
+        self.length = (roads - 1) * block
+        self.junctions = [(i * block, j * block) for i in range(roads) for j in range(roads)]
+
+    def _is_junction(self, x, y):
+        return (abs(x - round(x / self._block) * self._block) < 10.0 and
+                abs(y - round(y / self._block) * self._block) < 10.0)
+
+    def _lanes(self):
+        """
+        (road id, lane id, start location, yaw) of every lane
+        """
+        for i in range(self._roads):
+            offset = i * self._block
+            yield 2 * i, 1, (0.0, offset + 1.75), 0.0
+            yield 2 * i, -1, (self.length, offset - 1.75), 180.0
+            yield 2 * i + 1, 1, (offset - 1.75, 0.0), 90.0
+            yield 2 * i + 1, -1, (offset + 1.75, self.length), 270.0
+
+    def _waypoint(self, road_id, lane_id, start, yaw, s):
+        x = start[0] + s * math.cos(math.radians(yaw))
+        y = start[1] + s * math.sin(math.radians(yaw))
+        transform = Transform(Location(x, y, 0.0), Rotation(yaw=yaw))
+        return Waypoint(self, transform, road_id, lane_id, s, self._is_junction(x, y))
+
+    def _advance(self, waypoint, distance):
+        s = min(max(waypoint.s + distance, 0.0), self.length)
+        for road_id, lane_id, start, yaw in self._lanes():
+            if road_id == waypoint.road_id and lane_id == waypoint.lane_id:
+                return self._waypoint(road_id, lane_id, start, yaw, s)
+        return waypoint
+
+    def generate_waypoints(self, distance):
+        waypoints = []
+        for road_id, lane_id, start, yaw in self._lanes():
+            s = 0.0
+            while s <= self.length:
+                waypoints.append(self._waypoint(road_id, lane_id, start, yaw, s))
+                s += distance
+        return waypoints
+
+    def get_spawn_points(self):
+        return [x.transform for x in self.generate_waypoints(40.0) if not x.is_junction]
+
+    def get_waypoint(self, location, project_to_road=True, lane_type=LaneType.Driving):
+        best = None
+        for road_id, lane_id, start, yaw in self._lanes():
+            dx, dy = math.cos(math.radians(yaw)), math.sin(math.radians(yaw))
+            s = min(max((location.x - start[0]) * dx + (location.y - start[1]) * dy, 0.0), self.length)
+            x, y = start[0] + s * dx, start[1] + s * dy
+            distance = (x - location.x) ** 2 + (y - location.y) ** 2
+            if best is None or distance < best[0]:
+                best = (distance, road_id, lane_id, start, yaw, s)
+        if not project_to_road and best[0] > 3.5 ** 2:
+            return None
+        return self._waypoint(*best[1:])
+
+    def get_topology(self):
+        topology = []
+        for road_id, lane_id, start, yaw in self._lanes():
+            topology.append((self._waypoint(road_id, lane_id, start, yaw, 0.0),
+                             self._waypoint(road_id, lane_id, start, yaw, self.length)))
+        return topology
+
+    def transform_to_geolocation(self, location):
+        return GeoLocation(location.x * 1e-5, location.y * 1e-5, location.z)
+
+    def to_opendrive(self):
+        return '<OpenDRIVE/>'
+
+
+# ==============================================================================
+# -- World ---------------------------------------------------------------------
+# ==============================================================================
+
+class WorldSettings(object):
+
+    def __init__(self, synchronous_mode=False, no_rendering_mode=False, fixed_delta_seconds=None):
+        self.synchronous_mode = synchronous_mode
+        self.no_rendering_mode = no_rendering_mode
+        self.fixed_delta_seconds = fixed_delta_seconds
+        self.substepping = True
+        self.max_substep_delta_time = 0.01
+        self.max_substeps = 10
+        self.max_culling_distance = 0.0
+        self.deterministic_ragdolls = False
+
+    def copy(self):
+        settings = WorldSettings(self.synchronous_mode, self.no_rendering_mode, self.fixed_delta_seconds)
+        settings.__dict__.update(self.__dict__)
+        return settings
+
+
+class Timestamp(object):
+
+    def __init__(self, frame, elapsed_seconds, delta_seconds):
+        self.frame = frame
+        self.frame_count = frame
+        self.elapsed_seconds = elapsed_seconds
+        self.delta_seconds = delta_seconds
+        self.platform_timestamp = time.time()
+
+
+class WorldSnapshot(object):
+
+    def __init__(self, world):
+        self.id = world.id
+        self.frame = world._frame                   # pylint: disable=protected-access
+        self.timestamp = Timestamp(world._frame, world._elapsed, world._delta)  # pylint: disable=protected-access
+
+    def has_actor(self, actor_id):
+        return True
+
+
+class World(object):
+
+    _ids = itertools.count(1)
+    collision_radius = 2.0      # in meters, spawning closer to another actor fails
+
+    def __init__(self, server, town):
+        self._server = server
+        self.id = next(self._ids)
+        self._map = Map(town)
+        self._settings = WorldSettings()
+        self._weather = WeatherParameters.ClearNoon      # pylint: disable=no-member
+        self._frame = 0
+        self._elapsed = 0.0
+        self._delta = 0.05
+        self._actors = collections.OrderedDict()
+        self._cells = {}
+        self._on_tick = {}
+        self._rng = random.Random(self.id)
+        self._add_traffic_lights()
+
+    # -- internal ---------------------------------------------------------------
+
+    def _cell(self, location):
+        return (int(location.x // self.collision_radius), int(location.y // self.collision_radius))
+
+    def _collides(self, location):
+        cx, cy = self._cell(location)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for other in self._cells.get((cx + dx, cy + dy), ()):
+                    if other.distance(location) < self.collision_radius:
+                        return True
+        return False
+
+    def _spawn(self, blueprint, transform, parent=None):
+        """
+        Actor or an error message
+        """
+        is_vehicle = blueprint.id.startswith('vehicle.')
+        is_walker = blueprint.id.startswith('walker.')
+        if (is_vehicle or is_walker) and self._collides(transform.location):
+            return "Spawn failed because of collision at spawn position"
+        attributes = {x.id: x.value for x in blueprint}
+        actor_id = self._server.next_actor_id()
+        if is_vehicle:
+            actor = Vehicle(self, actor_id, blueprint.id, attributes, transform, parent)
+        elif is_walker:
+            actor = Walker(self, actor_id, blueprint.id, attributes, transform, parent)
+        elif blueprint.id == 'controller.ai.walker':
+            actor = WalkerAIController(self, actor_id, blueprint.id, attributes,
+                                       parent.get_transform() if parent else transform, parent)
+        else:
+            actor = Actor(self, actor_id, blueprint.id, attributes, transform, parent)
+        self._actors[actor_id] = actor
+        if is_vehicle or is_walker:
+            self._cells.setdefault(self._cell(transform.location), []).append(transform.location)
+        return actor
+
+    def _destroy(self, actor_id):
+        actor = self._actors.pop(actor_id, None)
+        if actor is None:
+            return False
+        actor._alive = False        # pylint: disable=protected-access
+        cell = self._cells.get(self._cell(actor.get_location()))
+        if cell and actor.get_location() in cell:
+            cell.remove(actor.get_location())
+        return True
+
+    def _add_traffic_lights(self):
+        for x, y in self._map.junctions:
+            group = []
+            for yaw in (0.0, 90.0, 180.0, 270.0):
+                location = Location(x + 8.0 * math.cos(math.radians(yaw)), y + 8.0 * math.sin(math.radians(yaw)))
+                light = TrafficLight(self, self._server.next_actor_id(), 'traffic.traffic_light',
+                                     {'role_name': ''}, Transform(location, Rotation(yaw=yaw + 180.0)))
+                group.append(light)
+                self._actors[light.id] = light
+            for light in group:
+                light.group = group
+
+    def _advance(self):
+        self._frame += 1
+        self._elapsed += self._settings.fixed_delta_seconds or self._delta
+        snapshot = WorldSnapshot(self)
+        for callback in list(self._on_tick.values()):
+            callback(snapshot)
+        return self._frame
+
+    # -- API --------------------------------------------------------------------
+
+    def get_map(self):
+        _STATS.rpc('World.get_map')
+        return self._map
+
+    def get_blueprint_library(self):
+        _STATS.rpc('World.get_blueprint_library')
+        return BlueprintLibrary(x.copy() for x in self._server.blueprints)
+
+    def get_actors(self, actor_ids=None):
+        _STATS.rpc('World.get_actors')
+        if actor_ids is None:
+            return ActorList(self._actors.values())
+        return ActorList(self._actors[x] for x in actor_ids if x in self._actors)
+
+    def get_actor(self, actor_id):
+        _STATS.rpc('World.get_actor')
+        return self._actors.get(actor_id)
+
+    def get_spectator(self):
+        return Actor(self, 0, 'spectator', {}, Transform())
+
+    def get_settings(self):
+        _STATS.rpc('World.get_settings')
+        return self._settings.copy()
+
+    def apply_settings(self, settings):
+        _STATS.rpc('World.apply_settings')
+        self._settings = settings.copy()
+        return self._frame
+
+    def get_weather(self):
+        _STATS.rpc('World.get_weather')
+        return self._weather
+
+    def set_weather(self, weather):
+        _STATS.rpc('World.set_weather')
+        self._weather = weather
+
+    def get_snapshot(self):
+        return WorldSnapshot(self)
+
+    def tick(self, seconds=10.0):
+        _STATS.rpc('World.tick')
+        return self._advance()
+
+    def wait_for_tick(self, seconds=10.0):
+        _STATS.rpc('World.wait_for_tick')
+        self._advance()
+        return WorldSnapshot(self)
+
+    def on_tick(self, callback):
+        callback_id = len(self._on_tick) + 1
+        self._on_tick[callback_id] = callback
+        return callback_id
+
+    def remove_on_tick(self, callback_id):
+        self._on_tick.pop(callback_id, None)
+
+    def spawn_actor(self, blueprint, transform, attach_to=None, attachment_type=AttachmentType.Rigid):
+        _STATS.rpc('World.spawn_actor')
+        actor = self._spawn(blueprint, transform, attach_to)
+        if isinstance(actor, str):
+            raise RuntimeError(actor)
+        return actor
+
+    def try_spawn_actor(self, blueprint, transform, attach_to=None, attachment_type=AttachmentType.Rigid):
+        _STATS.rpc('World.try_spawn_actor')
+        actor = self._spawn(blueprint, transform, attach_to)
+        return None if isinstance(actor, str) else actor
+
+    def get_random_location_from_navigation(self):
+        _STATS.rpc('World.get_random_location_from_navigation')
+        # On the sidewalks, 6 m on either side of the roads
+        road = self._rng.randrange(self._map._roads) * self._map._block    # pylint: disable=protected-access
+        along = self._rng.uniform(0.0, self._map.length)
+        side = self._rng.choice((-6.0, 6.0))
+        if self._rng.random() < 0.5:
+            return Location(along, road + side, 0.2)
+        return Location(road + side, along, 0.2)
+
+    def set_pedestrians_cross_factor(self, percentage):
+        _STATS.rpc('World.set_pedestrians_cross_factor')
+
+    def set_pedestrians_seed(self, seed):
+        _STATS.rpc('World.set_pedestrians_seed')
+        self._rng.seed(seed)
+
+    def freeze_all_traffic_lights(self, frozen):
+        _STATS.rpc('World.freeze_all_traffic_lights')
+        for actor in self._actors.values():
+            if isinstance(actor, TrafficLight):
+                actor._frozen = frozen      # pylint: disable=protected-access
+
+    def reset_all_traffic_lights(self):
+        _STATS.rpc('World.reset_all_traffic_lights')
+
+    def get_traffic_light(self, landmark):
+        return None
+
+    def get_traffic_lights_from_waypoint(self, waypoint, distance):
+        return []
+
+    def get_environment_objects(self, object_type=None):
+        return []
+
+    def __repr__(self):
+        return "World(id={})".format(self.id)
+
+
+# ==============================================================================
+# -- Batch commands ------------------------------------------------------------
+# ==============================================================================
+
+class _Command(object):
+
+    def __init__(self, *args):
+        self.args = args
+        self.followers = []
+
+    def then(self, command_):
+        self.followers.append(command_)
+        return self
+
+
+def _command_type(name):
+    return type(name, (_Command,), {})
+
+
+class _Response(object):
+
+    def __init__(self, actor_id=0, error=''):
+        self.actor_id = actor_id
+        self.error = error
+
+    def has_error(self):
+        return bool(self.error)
+
+
+class _FutureActor(object):
+    pass
+
+
+command = types.ModuleType('carla.command')
+command.FutureActor = _FutureActor()
+command.Response = _Response
+for _name in ('SpawnActor', 'DestroyActor', 'SetAutopilot', 'ApplyTargetVelocity', 'ApplyTargetAngularVelocity',
+              'ApplyVehicleControl', 'ApplyWalkerControl', 'ApplyTransform', 'ApplyImpulse',
+              'SetSimulatePhysics', 'SetVehicleLightState', 'SetEnableGravity', 'ShowDebugTelemetry'):
+    setattr(command, _name, _command_type(_name))
+
+
+def _actor_id(actor):
+    return actor.id if isinstance(actor, Actor) else actor
+
+
+def _execute(world, command_, parent_id=None):
+    """
+    Run one command and its followers, returns (actor id, error)
+    """
+    name = type(command_).__name__
+    with _STATS.lock:
+        _STATS.commands[name] += 1
+    if name == 'SpawnActor':
+        blueprint, transform = command_.args[0], command_.args[1]
+        parent = world._actors.get(command_.args[2]) if len(command_.args) > 2 else None  # pylint: disable=protected-access
+        actor = world._spawn(blueprint, transform, parent)        # pylint: disable=protected-access
+        if isinstance(actor, str):
+            return 0, actor
+        for follower in command_.followers:
+            _execute(world, follower, actor.id)
+        return actor.id, ''
+
+    target = command_.args[0] if command_.args else None
+    actor_id = parent_id if target is command.FutureActor else _actor_id(target)
+    if name == 'DestroyActor':
+        if not world._destroy(actor_id):                          # pylint: disable=protected-access
+            return actor_id, 'actor {} not found'.format(actor_id)
+    elif actor_id not in world._actors:                           # pylint: disable=protected-access
+        return actor_id, 'actor {} not found'.format(actor_id)
+    elif name == 'ApplyTransform':
+        world._actors[actor_id]._transform = command_.args[1]     # pylint: disable=protected-access
+    for follower in command_.followers:
+        _execute(world, follower, actor_id)
+    return actor_id, ''
+
+
+# ==============================================================================
+# -- Traffic manager and client ------------------------------------------------
+# ==============================================================================
+
+class TrafficManager(object):
+
+    """
+    Every setter is one round trip to the traffic manager and has no other effect
+    """
+
+    def __init__(self, port):
+        self._port = port
+
+    def get_port(self):
+        return self._port
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            _STATS.rpc('TrafficManager.' + name)
+        return call
+
+
+class _Server(object):
+
+    """
+    State shared by all the clients, as a real server would hold it
+    """
+
+    def __init__(self, town='Town04'):
+        self._actor_ids = itertools.count(1)
+        self.blueprints = _build_library()
+        self.world = World(self, town)
+        self.recording = None
+
+    def next_actor_id(self):
+        return next(self._actor_ids)
+
+
+_SERVER = None
+
+
+def server(town='Town04', reset=False):
+    """
+    The simulated server, created on first use
+    """
+    global _SERVER      # pylint: disable=global-statement
+    if _SERVER is None or reset:
+        _SERVER = _Server(town)
+    return _SERVER
+
+
+class Client(object):
+
+    def __init__(self, host='127.0.0.1', port=2000, worker_threads=0):
+        self.host = host
+        self.port = port
+        self._timeout = 5.0
+        self._server = server()
+
+    def set_timeout(self, seconds):
+        self._timeout = seconds
+
+    def get_client_version(self):
+        return __version__
+
+    def get_server_version(self):
+        _STATS.rpc('Client.get_server_version')
+        return __version__
+
+    def get_world(self):
+        _STATS.rpc('Client.get_world')
+        return self._server.world
+
+    def get_available_maps(self):
+        _STATS.rpc('Client.get_available_maps')
+        return ['/Game/Carla/Maps/Town{:02d}'.format(i) for i in (1, 2, 3, 4, 5, 6)]
+
+    def load_world(self, map_name, reset_settings=True, map_layers=None):
+        _STATS.rpc('Client.load_world', _STATS.load_world_time)
+        settings = self._server.world._settings                   # pylint: disable=protected-access
+        self._server.world = World(self._server, map_name.split('/')[-1])
+        if not reset_settings:
+            self._server.world._settings = settings                # pylint: disable=protected-access
+        return self._server.world
+
+    def reload_world(self, reset_settings=True):
+        return self.load_world(self._server.world._map.name, reset_settings)  # pylint: disable=protected-access
+
+    def get_trafficmanager(self, port=8000):
+        return TrafficManager(port)
+
+    def apply_batch(self, commands, do_tick=False):
+        _STATS.rpc('Client.apply_batch')
+        for command_ in commands:
+            _execute(self._server.world, command_)
+        if do_tick:
+            self._server.world._advance()                          # pylint: disable=protected-access
+
+    def apply_batch_sync(self, commands, do_tick=False):
+        _STATS.rpc('Client.apply_batch_sync')
+        responses = [_Response(*_execute(self._server.world, x)) for x in commands]
+        if do_tick:
+            self._server.world._advance()                          # pylint: disable=protected-access
+        return responses
+
+    def start_recorder(self, filename, additional_data=False):
+        _STATS.rpc('Client.start_recorder')
+        self._server.recording = filename
+        return filename
+
+    def stop_recorder(self):
+        _STATS.rpc('Client.stop_recorder')
+        self._server.recording = None
+
+    def show_recorder_file_info(self, filename, show_all=False):
+        _STATS.rpc('Client.show_recorder_file_info')
+        return "Version: 1\nMap: {}\nDate: -\n\nFrame 1 at 0 seconds\nFrames: 1\nDuration: 0 seconds\n".format(
+            self._server.world._map.name)                          # pylint: disable=protected-access
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+"""
+Cold start benchmark of scenario_runner.py.
+
+Every mode is measured in a fresh interpreter, as the launchers do:
+`--help` and `--list` run the real command line, the other modes import
+scenario_runner.py plus the modules that mode loads on selection.
+
+Run it from the scenario runner root (where srunner/ lives):
+
+    python3 benchmarks/import_time.py --repetitions 5 --json import_times.json
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# mode -> command run by the interpreter
+MODES = {
+    'help': ['scenario_runner.py', '--help'],
+    'list': ['scenario_runner.py', '--list'],
+    'route': ['-c', 'import scenario_runner\n'
+                    'from srunner.tools.route_parser import RouteParser\n'
+                    'from srunner.scenarios.route_scenario import RouteScenario'],
+    'scenario': ['-c', 'import scenario_runner\n'
+                       'from srunner.tools.scenario_parser import ScenarioConfigurationParser'],
+    'openscenario': ['-c', 'import scenario_runner\n'
+                           'from srunner.scenarioconfigs.openscenario_configuration import OpenScenarioConfiguration\n'
+                           'from srunner.scenarios.open_scenario import OpenScenario'],
+    'osc2': ['-c', 'import scenario_runner\n'
+                   'from srunner.scenarioconfigs.osc2_scenario_configuration import OSC2ScenarioConfiguration\n'
+                   'from srunner.scenarios.osc2_scenario import OSC2Scenario'],
+}
+
+
+def measure(command, repetitions):
+    """
+    Wall clock times (s) of `repetitions` fresh interpreters running the command,
+    and the slowest top level imports of the last one
+    """
+    times = []
+    stderr = ''
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, '-X', 'importtime'] + command, cwd=ROOT,
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                 universal_newlines=True, check=False)
+        times.append(time.perf_counter() - start)
+        stderr = process.stderr
+        if 'Traceback' in stderr:
+            raise RuntimeError("'{}' failed:\n{}".format(' '.join(command), stderr.splitlines()[-1]))
+
+    # "import time: self [us] | cumulative | imported package", top level imports are not indented
+    top_level = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or parts[2].startswith('  ') or not parts[1].strip().isdigit():
+            continue
+        top_level.append((int(parts[1]) / 1e6, parts[2].strip()))
+    top_level.sort(reverse=True)
+    return times, top_level[:5]
+
+
+def main():
+    """
+    Run the benchmark
+    """
+    parser = argparse.ArgumentParser(description="Cold start time of scenario_runner.py per mode")
+    parser.add_argument('--repetitions', default=5, type=int, help='Fresh interpreters per mode')
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES), help='Modes to measure')
+    parser.add_argument('--json', help='Append the results as one JSON record to this file')
+    args = parser.parse_args()
+
+    record = {'time': time.time(), 'python': sys.version.split()[0], 'modes': {}}
+    print("{:<14}{:>10}{:>10}   slowest imports".format("mode", "median", "min"))
+    for mode in args.modes:
+        times, slowest = measure(MODES[mode], args.repetitions)
+        record['modes'][mode] = {'median': statistics.median(times), 'min': min(times), 'runs': times}
+        print("{:<14}{:>9.3f}s{:>9.3f}s   {}".format(
+            mode, statistics.median(times), min(times),
+            ", ".join("{} {:.3f}s".format(name, seconds) for seconds, name in slowest)))
+
+    if args.json:
+        with open(args.json, 'a', encoding='utf-8') as fp:
+            fp.write(json.dumps(record) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+"""
+Headless benchmark of the scenario setup paths.
+
+The ScenarioRunner code runs against fake_carla, an in-process stand-in
+server, for every difficulty profile of the launcher. For each setup
+step the benchmark reports the wall clock time and the number of round
+trips the real server would have served. A regression in either shows
+up on any Linux box, without a GPU or a CARLA server.
+
+The steps follow _run_phases(): connect, load the world, traffic manager,
+ego vehicle, traffic population (which also turns the vehicle lights on),
+weather, traffic lights, criteria recording and cleanup.
+
+Run it from the scenario runner root (where srunner/ lives):
+
+    python3 benchmarks/setup_time.py --latency 0.002 --repetitions 3 --json setup_times.json
+
+By default every run starts cold, with empty process and disk caches, the
+way the launcher starts scenario_runner.py. --warm keeps the caches
+between runs, the way the runner daemon does.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import fake_carla                                   # pylint: disable=wrong-import-position
+
+fake_carla.install()
+
+# pylint: disable=wrong-import-position
+import difficulty_profiles
+import navigation_pool
+import scenario_runner
+import spawn_allocator
+from srunner.scenariomanager.carla_data_provider import CarlaDataProvider
+# pylint: enable=wrong-import-position
+
+TOWN = 2    # Town04, the route the launcher uses by default
+
+STEPS = ['connect', 'load_world', 'traffic_manager', 'ego_spawn', 'population', 'weather',
+         'traffic_lights', 'record_criteria', 'cleanup']
+
+
+class _Criterion(object):
+
+    """
+    Stand-in criterion, with serializable and non serializable attributes
+    """
+
+    def __init__(self, name, actor):
+        self.name = name
+        self.actor = actor
+        self.test_status = "SUCCESS"
+        self.expected_value_success = 0
+        self.actual_value = 0
+        self.optional = False
+        self.list_traffic_events = []
+
+
+def profiles():
+    """
+    (level, scene) of every profile the launchers offer
+    """
+    return difficulty_profiles.launcher_scenes()
+
+
+def make_config(town):
+    """
+    Route configuration of the launcher's route, with its ego vehicle
+    """
+    ego = types.SimpleNamespace(model='vehicle.lincoln.mkz_2017', rolename='hero', random_location=False,
+                                color=None, category='car',
+                                transform=fake_carla.Transform(fake_carla.Location(201.75, 30.0, 0.5),
+                                                               fake_carla.Rotation(yaw=90.0)))
+    trajectory = [fake_carla.Location(201.75, 10.0 * i, 0.0) for i in range(40)]
+    return types.SimpleNamespace(name='RouteScenario_{}'.format(TOWN), town=town, ego_vehicles=[ego],
+                                 trajectory=trajectory, agent=None)
+
+
+def run_once(level, scene, output_dir, warm):
+    """
+    Seconds and round trips of every setup step of one launch
+    """
+    argv = difficulty_profiles.build_runner_arguments(level, scene, TOWN, agent=None, telemetry=None)
+    argv += ['--outputDir', output_dir]
+    if not warm:
+        argv.append('--replanPopulation')
+        navigation_pool._POOLS.clear()              # pylint: disable=protected-access
+        spawn_allocator._LANE_WAYPOINTS.clear()     # pylint: disable=protected-access
+        fake_carla.server(reset=True)
+    args = scenario_runner.apply_mode_defaults(scenario_runner.build_parser().parse_args(argv))
+    config = make_config(difficulty_profiles.TOWN_NAMES[TOWN])
+
+    timings = {}
+    state = {}
+
+    def step(name, function):
+        fake_carla.reset_stats()
+        start = time.perf_counter()
+        state[name] = function()
+        timings[name] = {'seconds': time.perf_counter() - start, 'rpc': fake_carla.stats()['rpc_total'],
+                         'commands': fake_carla.stats()['commands_total']}
+
+    # pylint: disable=protected-access
+    step('connect', lambda: scenario_runner.ScenarioRunner(args))
+    runner = state['connect']
+    try:
+        step('load_world', lambda: runner._load_and_wait_for_world(config.town, config.ego_vehicles))
+        step('traffic_manager', runner._setup_traffic_manager)
+        tm, synchronous_master = state['traffic_manager']
+        step('ego_spawn', lambda: runner._prepare_ego_vehicles(config.ego_vehicles))
+        step('population', lambda: runner._spawn_population(config, tm, synchronous_master))
+        step('weather', lambda: runner.set_weather_preset(args.weather))
+        step('traffic_lights', lambda: runner.set_traffic_light_policy(config))
+        criteria = [_Criterion('Criterion{}'.format(i), runner.ego_vehicles[0]) for i in range(8)]
+        step('record_criteria', lambda: runner._record_criteria(criteria, os.path.join(output_dir, 'record.log')))
+        step('cleanup', runner._cleanup)
+    finally:
+        runner.destroy()
+    # pylint: enable=protected-access
+    return timings
+
+
+def main():
+    """
+    Run the benchmark
+    """
+    parser = argparse.ArgumentParser(description="Setup time and round trips of every launcher profile")
+    parser.add_argument('--latency', default=0.0, type=float, help='Seconds per simulated round trip')
+    parser.add_argument('--loadWorldTime', default=0.0, type=float, help='Extra seconds of a simulated map load')
+    parser.add_argument('--repetitions', default=3, type=int, help='Runs per profile')
+    parser.add_argument('--warm', action='store_true', help='Keep the process and disk caches between runs')
+    parser.add_argument('--json', help='Append the results as one JSON record to this file')
+    parser.add_argument('--verbose', action='store_true', help='Show the output of the runner')
+    args = parser.parse_args()
+
+    fake_carla.configure(args.latency, args.loadWorldTime)
+    record = {'time': time.time(), 'latency': args.latency, 'warm': args.warm, 'profiles': {}}
+
+    print("{:<16}{:>10}{:>8}  slowest steps".format("profile", "setup", "rpc"))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for level, scene in profiles():
+            runs = []
+            for repetition in range(args.repetitions):
+                if not args.warm:
+                    os.environ['DRIVESIM_CACHE_DIR'] = os.path.join(temp_dir, 'cache-{}-{}'.format(level, scene),
+                                                                    str(repetition))
+                else:
+                    os.environ['DRIVESIM_CACHE_DIR'] = os.path.join(temp_dir, 'cache')
+                stdout = sys.stdout
+                if not args.verbose:
+                    sys.stdout = open(os.devnull, 'w', encoding='utf-8')
+                try:
+                    runs.append(run_once(level, scene, temp_dir, args.warm))
+                finally:
+                    if sys.stdout is not stdout:
+                        sys.stdout.close()
+                        sys.stdout = stdout
+                CarlaDataProvider.cleanup()
+
+            steps = {name: {'seconds': statistics.median(x[name]['seconds'] for x in runs),
+                            'rpc': statistics.median(x[name]['rpc'] for x in runs),
+                            'commands': statistics.median(x[name]['commands'] for x in runs)}
+                     for name in STEPS}
+            total = sum(x['seconds'] for x in steps.values())
+            rpc = sum(x['rpc'] for x in steps.values())
+            key = '{}-{}'.format(level, scene)
+            record['profiles'][key] = {'seconds': total, 'rpc': rpc, 'steps': steps}
+            slowest = sorted(steps.items(), key=lambda x: x[1]['seconds'], reverse=True)[:3]
+            print("{:<16}{:>9.3f}s{:>8g}  {}".format(
+                key, total, rpc, ", ".join("{} {:.3f}s/{:g} rpc".format(name, x['seconds'], x['rpc'])
+                                           for name, x in slowest)))
+
+    if args.json:
+        with open(args.json, 'a', encoding='utf-8') as fp:
+            fp.write(json.dumps(record) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""
+Indexed blueprint catalog.
+
+The blueprint library is transferred at most once per process: the copy
+CarlaDataProvider already holds is reused, and it is only fetched when a
+blueprint is actually needed. Every filter pattern is resolved only once. The pattern index and the parsed
+generations are persisted in a manifest keyed by the server version, so
+later processes only need to look the ids up instead of re-listing and
+re-matching the whole library.
+"""
+
+from __future__ import print_function
+
+import fnmatch
+import json
+import os
+
+from runner_cache import cache_path, write_atomic
+
+MANIFEST_VERSION = 1
+
+
+def _generation(blueprint):
+    try:
+        return int(blueprint.get_attribute('generation'))
+    except (IndexError, ValueError):
+        return None
+
+
+class BlueprintCatalog(object):
+
+    """
+    Blueprint lookups by wildcard pattern and generation.
+
+    Usage:
+    catalog = BlueprintCatalog(client)
+    blueprints = catalog.filter("vehicle.indic_twowheeler.*")
+    """
+
+    def __init__(self, client, manifest_file=None, shared_library=None):
+        self._client = client
+        self._shared_library = shared_library     # returns a library fetched elsewhere, or None
+        self._server_version = client.get_server_version()
+        self._manifest_file = manifest_file or cache_path(
+            'blueprints', 'manifest-{}.json'.format(self._server_version))
+
+        self._library = None
+        self._indexed = False
+        self._by_id = {}
+        self._generations = {}
+        self._patterns = {}
+        self._results = {}
+        self._manifest_dirty = False
+        self._load_manifest()
+
+    @property
+    def library(self):
+        """
+        The blueprint library, shared or fetched from the server on first use
+        """
+        if self._library is None and self._shared_library is not None:
+            self._library = self._shared_library()
+        if self._library is None:
+            self._library = self._client.get_world().get_blueprint_library()
+        return self._library
+
+    def _load_manifest(self):
+        if not os.path.isfile(self._manifest_file):
+            return
+        try:
+            with open(self._manifest_file, 'r', encoding='utf-8') as fp:
+                manifest = json.load(fp)
+        except (OSError, ValueError):
+            return
+        if manifest.get('version') != MANIFEST_VERSION or \
+                manifest.get('server_version') != self._server_version:
+            return
+        self._patterns = manifest['patterns']
+        self._generations = manifest['generations']
+
+    def _save_manifest(self):
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'server_version': self._server_version,
+            'patterns': self._patterns,
+            'generations': self._generations,
+        }
+        write_atomic(self._manifest_file, json.dumps(manifest).encode('utf-8'))
+        self._manifest_dirty = False
+
+    def _index_library(self):
+        if self._indexed:
+            return
+        self._indexed = True
+        for blueprint in self.library:
+            self._by_id[blueprint.id] = blueprint
+            if blueprint.id not in self._generations:
+                self._generations[blueprint.id] = _generation(blueprint) \
+                    if blueprint.has_attribute('generation') else None
+
+    def _match(self, pattern):
+        """
+        Same semantics as BlueprintLibrary.filter(): the pattern is
+        matched against the blueprint id and each of its tags
+        """
+        self._index_library()
+        return [blueprint.id for blueprint in self._by_id.values()
+                if fnmatch.fnmatchcase(blueprint.id, pattern) or
+                any(fnmatch.fnmatchcase(tag, pattern) for tag in blueprint.tags)]
+
+    def find(self, blueprint_id):
+        """
+        Blueprint with the exact id
+        """
+        if blueprint_id in self._by_id:
+            return self._by_id[blueprint_id]
+        blueprint = self.library.find(blueprint_id)
+        self._by_id[blueprint_id] = blueprint
+        return blueprint
+
+    def _resolve(self, pattern):
+        ids = self._patterns.get(pattern)
+        if ids is not None:
+            try:
+                return [self.find(x) for x in ids]
+            except IndexError:
+                # Stale manifest, the server does not know one of the ids anymore
+                print("Blueprint manifest is outdated, rebuilding it")
+                self._patterns = {}
+                self._generations = {}
+                self._by_id = {}
+                self._indexed = False
+                self._results = {}
+
+        ids = self._match(pattern)
+        self._patterns[pattern] = ids
+        self._manifest_dirty = True
+        return [self._by_id[x] for x in ids]
+
+    def filter(self, pattern, generation="All"):
+        """
+        Blueprints of a library filter pattern, of one generation ("All", 1 or 2)
+        """
+        key = (pattern, str(generation).lower())
+        if key in self._results:
+            return self._results[key]
+
+        blueprints = self._resolve(pattern)
+        if self._manifest_dirty:
+            self._save_manifest()
+
+        if key[1] != "all" and len(blueprints) != 1:
+            # If the filter returns only one bp, we assume that this one needed
+            # and therefore, we ignore the generation
+            try:
+                int_generation = int(generation)
+            except ValueError:
+                int_generation = None
+            if int_generation in [1, 2]:
+                blueprints = [x for x in blueprints if self._generations.get(x.id) == int_generation]
+            else:
+                print("   Warning! Actor Generation is not valid. No actor will be spawned.")
+                blueprints = []
+
+        self._results[key] = blueprints
+        return blueprints
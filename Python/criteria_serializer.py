@@ -0,0 +1,144 @@
+"""
+Serializer of the scenario criteria.
+
+The attributes of every criterion are walked once: values that have a
+JSON representation are kept (numpy scalars and arrays included), the
+others (actors, behaviours, events...) are dropped, as the metrics
+manager only reads plain values. The file is streamed to a temporary
+file and renamed, so a reader never sees it half written.
+
+Two formats:
+
+- json: {criterion name: {attribute: value}}, what the metrics manager reads
+- npz: the same, with the long numeric attributes (per-frame histories)
+  stored as compressed arrays under "<criterion>/<attribute>" and the
+  rest as JSON under "__meta__"
+"""
+
+import json
+import numbers
+
+import numpy as np
+
+from runner_cache import open_atomic
+
+FORMATS = ('json', 'npz')
+
+# Numeric sequences at least this long are stored as arrays in the npz format
+ARRAY_THRESHOLD = 64
+
+_SKIP = object()
+
+
+def encode(value):
+    """
+    JSON representation of a value, or _SKIP if it has none.
+    A container with one value that has no representation is skipped as a whole.
+    """
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    if isinstance(value, numbers.Real):
+        return float(value)
+    if isinstance(value, (np.ndarray, np.generic)):
+        return encode(value.tolist())
+    if isinstance(value, (list, tuple)):
+        return _encode_sequence(value)
+    if isinstance(value, dict):
+        encoded = {}
+        for key, item in value.items():
+            if isinstance(key, (bool, numbers.Real)) or key is None:
+                key = json.dumps(key)
+            elif not isinstance(key, str):
+                return _SKIP
+            item = encode(item)
+            if item is _SKIP:
+                return _SKIP
+            encoded[key] = item
+        return encoded
+    return _SKIP
+
+
+def _encode_sequence(values):
+    encoded = []
+    for item in values:
+        item = encode(item)
+        if item is _SKIP:
+            return _SKIP
+        encoded.append(item)
+    return encoded
+
+
+def criteria_dict(criteria):
+    """
+    {criterion name: {attribute: value}} of the representable attributes
+    """
+    criteria_dict = {}
+    for criterion in criteria:
+        attributes = {}
+        for key, value in criterion.__dict__.items():
+            if key == "name":
+                continue
+            value = encode(value)
+            if value is not _SKIP:
+                attributes[key] = value
+        criteria_dict[criterion.name] = attributes
+    return criteria_dict
+
+
+def _as_array(value):
+    """
+    Numeric array of a long sequence, None if it is not one
+    """
+    if not isinstance(value, list) or len(value) < ARRAY_THRESHOLD:
+        return None
+    try:
+        array = np.asarray(value)
+    except ValueError:
+        return None
+    if array.dtype.kind not in 'biuf' or array.ndim > 2:
+        return None
+    return array
+
+
+def write_criteria(criteria, path, file_format='json'):
+    """
+    Serialize the criteria to path, atomically
+    """
+    data = criteria_dict(criteria)
+    if file_format == 'json':
+        with open_atomic(path, 'w', encoding='utf-8') as fp:
+            json.dump(data, fp, sort_keys=False, indent=4)
+    elif file_format == 'npz':
+        arrays = {}
+        for criterion_name, attributes in data.items():
+            for key in list(attributes):
+                array = _as_array(attributes[key])
+                if array is not None:
+                    arrays['{}/{}'.format(criterion_name, key)] = array
+                    attributes[key] = None
+        meta = np.frombuffer(json.dumps(data).encode('utf-8'), dtype=np.uint8)
+        with open_atomic(path, 'wb') as fp:
+            np.savez_compressed(fp, __meta__=meta, **arrays)
+    else:
+        raise ValueError("Unknown criteria format: {}".format(file_format))
+    return path
+
+
+def load_criteria(path):
+    """
+    Criteria dictionary of a file written by write_criteria, in either format
+    (arrays come back as numpy arrays)
+    """
+    if not path.endswith('.npz'):
+        with open(path, 'r', encoding='utf-8') as fp:
+            return json.load(fp)
+    with np.load(path) as archive:
+        data = json.loads(archive['__meta__'].tobytes().decode('utf-8'))
+        for key in archive.files:
+            if key == '__meta__':
+                continue
+            criterion_name, attribute = key.rsplit('/', 1)
+            data[criterion_name][attribute] = archive[key]
+    return data
@@ -0,0 +1,169 @@
+"""
+Difficulty profiles shared by the launchers.
+
+Every (level, scene) pair maps to the traffic population that
+scenario_runner.py spawns for it, so the Tk launcher, the runner daemon
+and any other front end build the exact same command line.
+
+The web launcher used to spawn denser traffic than the Tk launcher (its
+own copy of the counts lived in PHP/run_script.php), those counts are
+kept as the "web" profile set.
+"""
+
+import os
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+ROUTES_FILE = "srunner/data/final_routes_loop.xml"
+SCENARIOS_FILE = "srunner/data/final_all_towns_traffic_scenarios_loop_{level}{scene}.json"
+DEFAULT_AGENT = "srunner/autoagents/steering_agent.py"
+HUMAN_AGENT = "srunner/autoagents/human_agent.py"
+# The only agents a launcher may ask for, by name or by path
+AGENTS = {"steering_agent": DEFAULT_AGENT, "human_agent": HUMAN_AGENT,
+          "npc_agent": "srunner/autoagents/npc_agent.py"}
+DEFAULT_WEATHER = "Wet Cloudy Noon"
+# WebSocket port of the ego telemetry, the feed of the right screen (right-screen.js)
+TELEMETRY_PORT = 2102
+
+SCENE_IDS = {"Scene 1": "1", "Scene 2": "2", "Scene 3": "3"}
+TOWN_IDS = {"Town 02": 0, "Town 03": 1, "Town 04": 2, "Town 05": 3, "Town 06": 4}
+TOWN_NAMES = {0: "Town02", 1: "Town03", 2: "Town04", 3: "Town05", 4: "Town06"}
+# Scenes the launchers offer for each level, there is no easy scene 3
+LEVEL_SCENES = {"Easy": ["Scene 1", "Scene 2"], "Intermediate": ["Scene 1", "Scene 2", "Scene 3"],
+                "Hard": ["Scene 1", "Scene 2", "Scene 3"]}
+
+# Vehicle categories, in the order scenario_runner.py spawns them
+VEHICLE_CATEGORIES = ["Indic_HeavyVehicle", "Indic_ThreeWheeler", "Indic_FourWheeler", "Indic_TwoWheeler"]
+
+EASY_PROFILE = {"repetitions": 1}
+
+PROFILES = {
+    ("intermediate", "1"): {"num_walkers": 15, "Indic_TwoWheeler": 10},
+    ("intermediate", "2"): {"num_walkers": 15, "Indic_TwoWheeler": 5, "Indic_ThreeWheeler": 5},
+    ("intermediate", "3"): {"num_walkers": 15, "Indic_TwoWheeler": 5, "Indic_ThreeWheeler": 5},
+    ("hard", "1"): {"num_walkers": 150, "Indic_TwoWheeler": 15, "Indic_HeavyVehicle": 10,
+                    "Indic_ThreeWheeler": 10},
+    ("hard", "2"): {"Indic_TwoWheeler": 10, "Indic_HeavyVehicle": 10, "Indic_ThreeWheeler": 10,
+                    "Indic_FourWheeler": 5},
+    ("hard", "3"): {"Indic_TwoWheeler": 10, "Indic_HeavyVehicle": 10, "Indic_ThreeWheeler": 10,
+                    "Indic_FourWheeler": 5},
+}
+
+WEB_PROFILES = {
+    ("intermediate", "1"): {"num_walkers": 15, "Indic_TwoWheeler": 10},
+    ("intermediate", "2"): {"num_walkers": 20, "Indic_TwoWheeler": 15, "Indic_ThreeWheeler": 5},
+    ("intermediate", "3"): {"num_walkers": 25, "Indic_TwoWheeler": 25, "Indic_ThreeWheeler": 10},
+    ("hard", "1"): {"num_walkers": 150, "Indic_TwoWheeler": 15, "Indic_HeavyVehicle": 15,
+                    "Indic_ThreeWheeler": 15},
+    ("hard", "2"): {"Indic_TwoWheeler": 25, "Indic_HeavyVehicle": 10, "Indic_ThreeWheeler": 15,
+                    "Indic_FourWheeler": 5},
+    ("hard", "3"): {"Indic_TwoWheeler": 100, "Indic_HeavyVehicle": 20, "Indic_ThreeWheeler": 1000,
+                    "Indic_FourWheeler": 15},
+}
+
+PROFILE_SETS = {"launcher": PROFILES, "web": WEB_PROFILES}
+
+
+def scene_id(scene):
+    """
+    Accept either a scene label ("Scene 2") or its id ("2")
+    """
+    scene = str(scene)
+    if scene in SCENE_IDS:
+        return SCENE_IDS[scene]
+    if scene in SCENE_IDS.values():
+        return scene
+    raise ValueError("Unknown scene: {}".format(scene))
+
+
+def town_id(town):
+    """
+    Accept either a town label ("Town 04") or its route id (2)
+    """
+    if town in TOWN_IDS:
+        return TOWN_IDS[town]
+    try:
+        town = int(town)
+    except (TypeError, ValueError):
+        raise ValueError("Unknown town: {}".format(town))
+    if town not in TOWN_NAMES:
+        raise ValueError("Unknown town: {}".format(town))
+    return town
+
+
+def launcher_scenes(levels=None, scenes=None):
+    """
+    (level, scene id) pairs the launchers offer, in launcher order,
+    optionally restricted to some levels and scenes
+    """
+    levels = None if levels is None else {x.lower() for x in levels}
+    scenes = None if scenes is None else {scene_id(x) for x in scenes}
+    return [(level.lower(), scene_id(scene)) for level, level_scenes in LEVEL_SCENES.items()
+            for scene in level_scenes
+            if (levels is None or level.lower() in levels) and (scenes is None or scene_id(scene) in scenes)]
+
+
+def agent_path(agent):
+    """
+    Accept either a known agent name ("human_agent") or its path, relative
+    to the scenario runner root or absolute. Any other agent is refused.
+    """
+    if agent in AGENTS:
+        return AGENTS[agent]
+    path = os.path.normpath(os.path.join(ROOT, str(agent)))
+    for known in AGENTS.values():
+        if path == os.path.join(ROOT, os.path.normpath(known)):
+            return known
+    raise ValueError("Unknown agent: {}".format(agent))
+
+
+def get_profile(level, scene, profile_set="launcher"):
+    """
+    Return the population profile of a level and scene
+    """
+    level = level.lower()
+    if profile_set not in PROFILE_SETS:
+        raise ValueError("Unknown profile set: {}".format(profile_set))
+    if level == "easy":
+        return dict(EASY_PROFILE)
+    try:
+        return dict(PROFILE_SETS[profile_set][(level, scene_id(scene))])
+    except KeyError:
+        raise ValueError("Unknown level: {}".format(level))
+
+
+def profile_arguments(level, scene, profile_set="launcher"):
+    """
+    Translate a profile into scenario_runner.py arguments
+    """
+    profile = get_profile(level, scene, profile_set)
+    arguments = []
+    if "repetitions" in profile:
+        arguments += ["--repetitions", str(profile["repetitions"])]
+    if profile.get("num_walkers"):
+        arguments += ["--spawn_pedestrians", "--num_walkers", str(profile["num_walkers"])]
+    categories = [category for category in VEHICLE_CATEGORIES if profile.get(category)]
+    if categories:
+        arguments.append("--spawn_vehicle")
+    for category in categories:
+        arguments += ["--spawn_vehicle_{}".format(category),
+                      "--num_vehicles_{}".format(category), str(profile[category])]
+    return arguments
+
+
+def build_runner_arguments(level, scene, town, agent=DEFAULT_AGENT, weather=DEFAULT_WEATHER,
+                           profile_set="launcher", telemetry=TELEMETRY_PORT):
+    """
+    Full scenario_runner.py argument list (without the interpreter and script).
+    The telemetry is streamed on the telemetry port, unless it is None.
+    """
+    level = level.lower()
+    arguments = ["--route", ROUTES_FILE,
+                 SCENARIOS_FILE.format(level=level, scene=scene_id(scene)),
+                 str(town_id(town))]
+    if agent:
+        arguments += ["--agent", agent]
+    arguments += ["--output", "--weather", weather, "--level", level, "--scene", scene_id(scene)]
+    if telemetry:
+        arguments += ["--telemetry", str(telemetry)]
+    return arguments + profile_arguments(level, scene, profile_set)
@@ -0,0 +1,151 @@
+"""
+Discovery of the ego vehicles spawned by another client (--waitForEgo).
+
+Instead of listing every vehicle of the world over and over, the actor
+ids of each world snapshot (world.on_tick) are compared with the previous
+ones. Only the new actors are looked up, in one batch, and the vehicles
+are indexed by role name, so checking for the ego vehicles is a
+dictionary lookup.
+
+When the world does not tick (synchronous mode, nobody ticking yet),
+the actor list is scanned instead, with an exponential backoff.
+"""
+
+from __future__ import print_function
+
+import threading
+import time
+
+
+class EgoDiscovery(object):
+
+    """
+    Role name index of the vehicles of a world.
+
+    Usage:
+    discovery = EgoDiscovery(world)
+    actors = discovery.wait(['hero'], timeout=60.0)     # None on timeout
+    discovery.stop()
+    """
+
+    def __init__(self, world, min_delay=0.05, max_delay=2.0):
+        self.world = world
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self._condition = threading.Condition()
+        self._snapshot_ids = set()  # actors of the last snapshot
+        self._resolved = set()      # actors already looked up
+        self._pending = set()       # new actors, not looked up yet
+        self._roles = {}            # role name -> vehicle
+        self._role_of = {}          # vehicle id -> role name
+        self._last_tick = None
+        self._callback_id = None
+        self.rescans = 0
+
+    def start(self):
+        """
+        Index the current vehicles and follow the world ticks
+        """
+        if self._callback_id is None:
+            self._rescan()
+            self._callback_id = self.world.on_tick(self._on_tick)
+
+    def stop(self):
+        """
+        Stop following the world ticks, the index is dropped
+        """
+        if self._callback_id is not None:
+            self.world.remove_on_tick(self._callback_id)
+            self._callback_id = None
+        with self._condition:
+            self._snapshot_ids = set()
+            self._resolved = set()
+            self._pending = set()
+            self._roles = {}
+            self._role_of = {}
+
+    def _on_tick(self, snapshot):
+        # Runs on the CARLA client thread, without any request to the server
+        actor_ids = {actor.id for actor in snapshot}
+        with self._condition:
+            self._last_tick = time.monotonic()
+            new_ids = actor_ids - self._snapshot_ids
+            gone_ids = self._snapshot_ids - actor_ids
+            self._snapshot_ids = actor_ids
+            for actor_id in gone_ids:
+                self._forget(actor_id)
+            new_ids -= self._resolved
+            if new_ids:
+                self._pending |= new_ids
+                self._condition.notify_all()
+
+    def _forget(self, actor_id):
+        self._resolved.discard(actor_id)
+        self._pending.discard(actor_id)
+        role = self._role_of.pop(actor_id, None)
+        if role is not None and getattr(self._roles.get(role), 'id', None) == actor_id:
+            del self._roles[role]
+
+    def _index(self, actors):
+        with self._condition:
+            for actor in actors:
+                self._resolved.add(actor.id)
+                self._pending.discard(actor.id)
+                if actor.type_id.startswith('vehicle.'):
+                    role = actor.attributes.get('role_name')
+                    if role:
+                        self._roles[role] = actor
+                        self._role_of[actor.id] = role
+
+    def _rescan(self):
+        self.rescans += 1
+        self._index(self.world.get_actors())
+
+    def find(self, role_names):
+        """
+        Vehicle of each role name, None for the missing ones
+        """
+        with self._condition:
+            pending = list(self._pending)
+        if pending:
+            # One request for all the actors spawned since the last check
+            actors = self.world.get_actors(pending)
+            with self._condition:
+                # The ones the server did not return are gone already, do not look them up again
+                self._resolved.update(pending)
+                self._pending.difference_update(pending)
+            self._index(actors)
+        with self._condition:
+            return [self._roles.get(role) for role in role_names]
+
+    def wait(self, role_names, timeout=None, should_stop=None):
+        """
+        Wait until there is a vehicle of every role name, and return them.
+        Returns None after timeout seconds, or once should_stop() is true.
+        """
+        self.start()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        delay = self.min_delay
+        announced = False
+        while True:
+            actors = self.find(role_names)
+            if all(actor is not None for actor in actors):
+                return actors
+            if should_stop is not None and should_stop():
+                return None
+            remaining = self.max_delay if deadline is None else deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            if not announced:
+                print("Not all ego vehicles ready. Waiting for: {}".format(
+                    ", ".join(role for role, actor in zip(role_names, actors) if actor is None)))
+                announced = True
+
+            with self._condition:
+                woken = bool(self._pending) or self._condition.wait(min(delay, remaining))
+                ticking = self._last_tick is not None and time.monotonic() - self._last_tick < delay
+            if not woken:
+                if not ticking:
+                    # No snapshots to follow, the actor list is the only way to see new vehicles
+                    self._rescan()
+                delay = min(delay * 2, self.max_delay)
@@ -1,6 +1,30 @@
+import time
+
+# Start of the time-to-first-frame measurement, before anything is imported
+STARTED = time.perf_counter()
+
+import os
 import tkinter as tk
-from PIL import Image, ImageTk, ImageFilter
-import subprocess
+from PIL import ImageTk
+
+import difficulty_profiles
+import open_terminals as session_launcher
+from asset_cache import record_startup, rendered_background
+from launch_supervisor import LaunchSupervisor
+from runner_daemon import RunnerClient, TownPreloader
+
+# Lines of child process output kept in the session log
+MAX_LOG_LINES = 200
+
+# Milliseconds a town button must stay hovered before its town is preloaded
+PRELOAD_HOVER_DELAY = 250
+
+BACKGROUND_IMAGE = "/home/cvit-car-simulator/Downloads/images.jpeg"
+BACKGROUND_BLUR = 5
+
+LEVELS = ["Easy", "Intermediate", "Hard"]
+LEVEL_SCENES = difficulty_profiles.LEVEL_SCENES
+TOWNS = ["Town 02", "Town 03", "Town 04", "Town 05", "Town 06"]
 
 def show_frame(frame):
     frame.tkraise()
@@ -20,42 +44,132 @@ def open_levels_page():
 
 def open_terminals(level, scene, town):
     print_button_info("Open Terminals", level, scene, town)
-    import open_terminals
     scene_map = {"Scene 1": "1", "Scene 2": "2", "Scene 3": "3"}
     town_map = {"Town 02": 0, "Town 03": 1, "Town 04": 2, "Town 05": 3, "Town 06": 4}
-    open_terminals.open_terminals(level, scene_map.get(scene, "Scene 1"), town_map.get(town, 0))
-
-def open_scenes_page(level):
-    print_button_info("Scenes Page", level)
-    show_frame(scenes_frame)
-    for widget in scenes_frame.winfo_children():
-        widget.destroy()
-
-    if level == "Easy":
-        scenes = ["Scene 1", "Scene 2"]
+    # Through the runner daemon when it runs, it may have loaded the town already
+    launch_session(session_launcher.session_commands(level, scene_map.get(scene, "Scene 1"), town_map.get(town, 0),
+                                                     daemon=preloader.available),
+                   "{} / {} / {}".format(level, scene, town))
+
+def bind_preload(button, town):
+    # Hovering a town button for a moment preloads it, the latest hover wins
+    def enter(_):
+        global preload_timer
+        leave(None)
+        preload_timer = root.after(PRELOAD_HOVER_DELAY, lambda: preloader.request(town))
+
+    def leave(_):
+        global preload_timer
+        if preload_timer is not None:
+            root.after_cancel(preload_timer)
+            preload_timer = None
+
+    button.bind("<Enter>", enter)
+    button.bind("<Leave>", leave)
+
+def leave_town_page(show):
+    # The town choice is abandoned, so is its preload
+    preloader.request(None)
+    show()
+
+def launch_session(commands, title):
+    # The supervisor refuses a second session, the buttons only tell why
+    if supervisor.running:
+        session_status.set("A session is already running: " + session_title.get())
+        return
+    session_log.configure(state='normal')
+    session_log.delete('1.0', 'end')
+    session_log.configure(state='disabled')
+    session_title.set(title)
+    supervisor.start(commands)
+
+def append_session_log(name, line):
+    session_log.configure(state='normal')
+    session_log.insert('end', "[{}] {}\n".format(name, line))
+    lines = int(session_log.index('end-1c').split('.')[0])
+    if lines > MAX_LOG_LINES:
+        session_log.delete('1.0', '{}.0'.format(lines - MAX_LOG_LINES))
+    session_log.see('end')
+    session_log.configure(state='disabled')
+
+def session_exited(name, returncode):
+    append_session_log(name, "exited with code {}".format(returncode))
+
+def session_state_changed(running):
+    if running:
+        prefix = "Stopping: " if supervisor.stopping else "Running: "
+        session_status.set(prefix + session_title.get())
     else:
-        scenes = ["Scene 1", "Scene 2", "Scene 3"]
+        session_status.set("No session running")
+    cancel_button.configure(state='normal' if running else 'disabled')
+    restart_button.configure(state='normal' if session_title.get() else 'disabled')
 
-    for i, scene in enumerate(scenes):
-        tk.Button(scenes_frame, text=scene, command=lambda s=scene: open_town_page(level, s), width=20, height=3, font=("Helvetica", 16), bg=button_color, fg="white", borderwidth=0, relief="flat").grid(row=i, column=0, padx=10, pady=10)
+def cancel_session():
+    print_button_info("Cancel Session")
+    supervisor.cancel()
 
-    tk.Button(scenes_frame, text="Back", command=lambda: show_frame(level_frame), width=15, height=2, font=("Helvetica", 10), bg=button_color, fg="white", borderwidth=0, relief="flat").grid(row=len(scenes), column=0, pady=20)
+def restart_session():
+    print_button_info("Restart Session")
+    supervisor.restart()
+
+def open_scenes_page(level):
+    print_button_info("Scenes Page", level)
+    show_frame(scenes_page(level))
 
 def open_town_page(level, scene):
     print_button_info("Town Page", level, scene)
-    show_frame(town_frame)
-    for widget in town_frame.winfo_children():
-        widget.destroy()
-
-    towns = ["Town 02", "Town 03", "Town 04", "Town 05", "Town 06"]
-    for i, town in enumerate(towns):
-        tk.Button(town_frame, text=town, command=lambda t=town: open_terminals(level, scene, t), width=20, height=3, font=("Helvetica", 16), bg=button_color, fg="white", borderwidth=0, relief="flat").grid(row=i, column=0, padx=10, pady=10)
+    show_frame(town_page(level, scene))
 
-    tk.Button(town_frame, text="Back", command=lambda: open_scenes_page(level), width=15, height=2, font=("Helvetica", 10), bg=button_color, fg="white", borderwidth=0, relief="flat").grid(row=len(towns), column=0, pady=20)
+def new_page():
+    frame = tk.Frame(root, bg=bg_color)
+    frame.grid(row=0, column=0, sticky='nsew')
+    # Built pages stay below the current one until they are raised
+    frame.lower()
+    return frame
+
+def scenes_page(level):
+    # Pages are built once and only raised afterwards
+    if level not in scenes_frames:
+        frame = new_page()
+        scenes = LEVEL_SCENES[level]
+        for i, scene in enumerate(scenes):
+            tk.Button(frame, text=scene, command=lambda s=scene: open_town_page(level, s), width=20, height=3, font=("Helvetica", 16), bg=button_color, fg="white", borderwidth=0, relief="flat").grid(row=i, column=0, padx=10, pady=10)
+
+        tk.Button(frame, text="Back", command=lambda: show_frame(level_frame), width=15, height=2, font=("Helvetica", 10), bg=button_color, fg="white", borderwidth=0, relief="flat").grid(row=len(scenes), column=0, pady=20)
+        scenes_frames[level] = frame
+    return scenes_frames[level]
+
+def town_page(level, scene):
+    if (level, scene) not in town_frames:
+        frame = new_page()
+        for i, town in enumerate(TOWNS):
+            button = tk.Button(frame, text=town, command=lambda t=town: open_terminals(level, scene, t), width=20, height=3, font=("Helvetica", 16), bg=button_color, fg="white", borderwidth=0, relief="flat")
+            button.grid(row=i, column=0, padx=10, pady=10)
+            bind_preload(button, town)
+
+        tk.Button(frame, text="Back", command=lambda: leave_town_page(lambda: open_scenes_page(level)), width=15, height=2, font=("Helvetica", 10), bg=button_color, fg="white", borderwidth=0, relief="flat").grid(row=len(TOWNS), column=0, pady=20)
+        town_frames[(level, scene)] = frame
+    return town_frames[(level, scene)]
+
+def prebuild_pages():
+    for level in LEVELS:
+        scenes_page(level)
+        for scene in LEVEL_SCENES[level]:
+            town_page(level, scene)
+
+def first_frame_shown(_event):
+    # First expose of the background, the other pages are built afterwards
+    bg_label.unbind("<Expose>", first_frame_binding)
+    # Draw what is pending (the background itself), so the measurement covers it
+    root.update_idletasks()
+    first_frame = time.perf_counter() - STARTED
+    print("First frame after {:.0f} ms (background {})".format(first_frame * 1000.0, "cached" if bg_cached else "rendered"))
+    record_startup(first_frame, background_cached=bg_cached, screen=[root.winfo_screenwidth(), root.winfo_screenheight()])
+    root.after_idle(prebuild_pages)
 
 def run_practice_command():
     print_button_info("Practice Command")
-    subprocess.run("python3 scenario_runner.py --route srunner/data/final_routes.xml srunner/data/practice_all_towns_traffic_scenarios.json 0 --agent srunner/autoagents/human_agent.py --output", shell=True)
+    launch_session(session_launcher.practice_commands(), "Practice")
 
 def open_settings():
     print_button_info("Settings")
@@ -63,15 +177,15 @@ def open_settings():
 
 def close_app():
     print_button_info("Exit")
+    supervisor.shutdown()
     root.destroy()
 
 root = tk.Tk()
 root.title("Main Window")
 root.attributes('-fullscreen', True)
 
-bg_image = Image.open("/home/cvit-car-simulator/Downloads/images.jpeg")
-bg_image = bg_image.resize((root.winfo_screenwidth(), root.winfo_screenheight()), Image.LANCZOS)
-blurred_bg_image = bg_image.filter(ImageFilter.GaussianBlur(radius=5))
+# Resized and blurred once, later starts read the rendered pixels from the cache
+blurred_bg_image, bg_cached = rendered_background(BACKGROUND_IMAGE, (root.winfo_screenwidth(), root.winfo_screenheight()), BACKGROUND_BLUR)
 
 bg_photo = ImageTk.PhotoImage(blurred_bg_image)
 bg_label = tk.Label(root, image=bg_photo)
@@ -80,18 +194,24 @@ bg_label.place(x=0, y=0, relwidth=1, relheight=1)
 button_color = "#4d4d4d"
 bg_color = "#000000"
 
+# Preloads go to the runner daemon, if one runs (it also preloads the last town at startup)
+preloader = TownPreloader(RunnerClient())
+preload_timer = None
+
 # Create frames for each page
 landing_frame = tk.Frame(root, bg=bg_color)
 landing_frame.pack(fill='both', expand=True)
 
 level_frame = tk.Frame(root, bg=bg_color)
-scenes_frame = tk.Frame(root, bg=bg_color)
-town_frame = tk.Frame(root, bg=bg_color)
 settings_frame = tk.Frame(root, bg=bg_color)
 
-for frame in (landing_frame, level_frame, scenes_frame, town_frame, settings_frame):
+for frame in (landing_frame, level_frame, settings_frame):
     frame.grid(row=0, column=0, sticky='nsew')
 
+# Scenes page of every level and towns page of every (level, scene), see scenes_page() and town_page()
+scenes_frames = {}
+town_frames = {}
+
 # Landing Page
 tk.Button(landing_frame, text="Practice", command=run_practice_command, width=15, height=2, font=("Helvetica", 10), bg=button_color, fg="white", borderwidth=0, relief="flat").grid(row=0, column=0, pady=10)
 tk.Button(landing_frame, text="Play", command=open_play_window, width=15, height=2, font=("Helvetica", 10), bg=button_color, fg="white", borderwidth=0, relief="flat").grid(row=1, column=0, pady=10)
@@ -99,23 +219,10 @@ tk.Button(landing_frame, text="Settings", command=open_settings, width=15, heigh
 tk.Button(landing_frame, text="Exit", command=close_app, width=15, height=2, font=("Helvetica", 10), bg=button_color, fg="white", borderwidth=0, relief="flat").grid(row=3, column=0, pady=10)
 
 # Levels Page
-for i, level in enumerate(["Easy", "Intermediate", "Hard"]):
+for i, level in enumerate(LEVELS):
     tk.Button(level_frame, text=level, command=lambda l=level: open_scenes_page(l), width=20, height=3, font=("Helvetica", 16), bg=button_color, fg="white", borderwidth=0, relief="flat").grid(row=i, column=0, padx=10, pady=10)
 
-tk.Button(level_frame, text="Back", command=lambda: show_frame(landing_frame), width=15, height=2, font=("Helvetica", 10), bg=button_color, fg="white", borderwidth=0, relief="flat").grid(row=len(["Easy", "Intermediate", "Hard"]), column=0, pady=20)
-
-# Scenes Page
-tk.Button(scenes_frame, text="Back", command=lambda: show_frame(level_frame), width=15, height=2, font=("Helvetica", 10), bg=button_color, fg="white", borderwidth=0, relief="flat").grid(row=0, column=0, pady=20)
-
-# Towns Page
-town_frame_inner = tk.Frame(town_frame, bg=bg_color)
-town_frame_inner.place(relx=0.5, rely=0.5, anchor='center')
-
-tk.Button(town_frame_inner, text="Back", command=lambda: show_frame(scenes_frame), width=15, height=2, font=("Helvetica", 10), bg=button_color, fg="white", borderwidth=0, relief="flat").grid(row=0, column=0, pady=20)
-
-# Add buttons for towns to the inner town frame
-for i, town in enumerate(["Town 02", "Town 03", "Town 04", "Town 05", "Town 06"]):
-    tk.Button(town_frame_inner, text=town, command=lambda t=town: open_terminals("Easy", "Scene 1", t), width=20, height=3, font=("Helvetica", 16), bg=button_color, fg="white", borderwidth=0, relief="flat").grid(row=i+1, column=0, padx=10, pady=10)
+tk.Button(level_frame, text="Back", command=lambda: show_frame(landing_frame), width=15, height=2, font=("Helvetica", 10), bg=button_color, fg="white", borderwidth=0, relief="flat").grid(row=len(LEVELS), column=0, pady=20)
 
 # Settings Frame
 settings_frame_town = tk.Frame(root, bg=bg_color)
@@ -123,5 +230,26 @@ settings_frame_town.place(relx=1.0, y=0, anchor='ne')
 
 tk.Button(settings_frame_town, text="Settings", command=open_settings, width=15, height=2, font=("Helvetica", 10), bg=button_color, fg="white", borderwidth=0, relief="flat").pack(pady=20)
 
+# Session bar: state, output and controls of the running session
+session_frame = tk.Frame(root, bg=bg_color)
+session_frame.place(relx=0.5, rely=1.0, anchor='s', relwidth=0.8)
+
+session_title = tk.StringVar(value="")
+session_status = tk.StringVar(value="No session running")
+tk.Label(session_frame, textvariable=session_status, font=("Helvetica", 12), bg=bg_color, fg="white", anchor='w').grid(row=0, column=0, sticky='we', padx=10)
+cancel_button = tk.Button(session_frame, text="Cancel", command=cancel_session, state='disabled', width=10, font=("Helvetica", 10), bg=button_color, fg="white", borderwidth=0, relief="flat")
+cancel_button.grid(row=0, column=1, padx=5, pady=5)
+restart_button = tk.Button(session_frame, text="Restart", command=restart_session, state='disabled', width=10, font=("Helvetica", 10), bg=button_color, fg="white", borderwidth=0, relief="flat")
+restart_button.grid(row=0, column=2, padx=5, pady=5)
+session_log = tk.Text(session_frame, height=8, state='disabled', font=("Courier", 9), bg=bg_color, fg="white", borderwidth=0)
+session_log.grid(row=1, column=0, columnspan=3, sticky='we', padx=10, pady=(0, 10))
+session_frame.columnconfigure(0, weight=1)
+
+supervisor = LaunchSupervisor(cwd=os.path.dirname(os.path.abspath(__file__)), on_output=append_session_log,
+                              on_exit=session_exited, on_state=session_state_changed)
+supervisor.attach(root)
+root.protocol("WM_DELETE_WINDOW", close_app)
+
 show_frame(landing_frame)
+first_frame_binding = bg_label.bind("<Expose>", first_frame_shown, add="+")
 root.mainloop()
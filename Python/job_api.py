@@ -0,0 +1,423 @@
+#!/usr/bin/env python
+
+"""
+Local HTTP job API of the launchers.
+
+The web launcher (scripts.js) used to POST every click to a PHP script
+that rebuilt the scenario_runner.py command line from its own copy of
+the difficulty profiles and blocked in shell_exec on gnome-terminal.
+This service is the single entry point of both front ends: one warm
+process, an asyncio HTTP server on the loopback, a bounded job queue and
+a limit on the jobs running at the same time. The command lines come
+from difficulty_profiles, like the Tk launcher and the runner daemon.
+
+    POST   /jobs              {"level": "Hard", "scene": "Scene 1", "town": "Town 04"}
+    POST   /jobs              {"practice": true}
+    GET    /jobs              every known job
+    GET    /jobs/<id>         state of one job
+    DELETE /jobs/<id>         cancel it (POST /jobs/<id>/cancel works too)
+    GET    /profiles          levels, scenes and towns the launchers offer
+
+Jobs run scenario_runner.py as a child process (its output goes to
+<logDir>/<job id>.log), or on the runner daemon with --daemon, which
+keeps CARLA connected between jobs.
+
+Only the launcher pages may call it from a browser: a request carrying
+an Origin header that is not allowed is refused, and job submissions must
+be sent as application/json, which a cross origin page cannot do without
+a CORS preflight. The agent of a job is one of the known agents.
+
+The allowed origins are the Electron file:// pages and the web launcher
+served from this machine (http://localhost or http://127.0.0.1, on any
+port). A launcher served from elsewhere needs its origin on the command
+line, each --allowOrigin replacing the defaults:
+
+    python3 job_api.py --allowOrigin http://kiosk.local:8000 --allowOrigin null
+
+    python3 job_api.py --port 2101 --maxQueued 8 --concurrency 1
+"""
+
+from __future__ import print_function
+
+import argparse
+import asyncio
+import collections
+import json
+import os
+import signal
+import sys
+import time
+import traceback
+
+import difficulty_profiles
+from open_terminals import PRACTICE_ARGUMENTS
+from runner_daemon import RunnerClient, RunnerJob
+
+DEFAULT_LISTEN_HOST = '127.0.0.1'
+DEFAULT_LISTEN_PORT = 2101
+
+# Seconds between SIGTERM and SIGKILL when a running job is cancelled
+STOP_GRACE = 10.0
+
+MAX_BODY = 64 * 1024
+
+# Origin sent by the launcher pages, loaded from files by Electron or a browser,
+# or served from this machine. An origin without a port allows every port.
+DEFAULT_ALLOWED_ORIGINS = ('null', 'file://', 'http://localhost', 'http://127.0.0.1')
+
+REASONS = {200: 'OK', 202: 'Accepted', 204: 'No Content', 400: 'Bad Request', 403: 'Forbidden',
+           404: 'Not Found', 405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large',
+           415: 'Unsupported Media Type', 503: 'Service Unavailable'}
+
+
+class PracticeJob(RunnerJob):
+
+    """
+    The practice drive, on the practice routes of all towns
+    """
+
+    def __init__(self):
+        RunnerJob.__init__(self, 'easy', '1', 0, None, difficulty_profiles.DEFAULT_WEATHER)
+        self.level = self.scene = self.town = None
+        self.argv = list(PRACTICE_ARGUMENTS)
+
+    def to_dict(self):
+        return dict(RunnerJob.to_dict(self), practice=True)
+
+
+class HttpError(Exception):
+
+    """
+    Error answered with an HTTP status
+    """
+
+    def __init__(self, status, message):
+        super(HttpError, self).__init__(message)
+        self.status = status
+
+
+class JobApi(object):
+
+    """
+    Queue and runners of the submitted jobs.
+
+    Usage:
+    api = JobApi(max_queued=8, concurrency=1)
+    asyncio.run(api.serve('127.0.0.1', 2101))
+    """
+
+    history_size = 100  # finished jobs kept for status queries
+
+    def __init__(self, max_queued=8, concurrency=1, runner_script='scenario_runner.py', runner_argv=None,
+                 log_dir='feedback/jobs', daemon=None, allowed_origins=DEFAULT_ALLOWED_ORIGINS):
+        self.max_queued = max_queued
+        self.concurrency = concurrency
+        self.runner_script = runner_script
+        self.runner_argv = list(runner_argv or [])
+        self.log_dir = log_dir
+        self.daemon = daemon
+        self.allowed_origins = set(allowed_origins)
+        self._jobs = collections.OrderedDict()
+        self._processes = {}
+        self._daemon_jobs = {}
+        self._queue = None
+        self._server = None
+
+    # Jobs
+
+    def submit(self, request):
+        """
+        Queue a job from a decoded request body
+        """
+        if request.get('practice'):
+            job = PracticeJob()
+        else:
+            try:
+                job = RunnerJob(request['level'], request['scene'], request['town'],
+                                request.get('agent', difficulty_profiles.DEFAULT_AGENT),
+                                request.get('weather', difficulty_profiles.DEFAULT_WEATHER),
+                                profile_set='web')
+            except KeyError as e:
+                raise HttpError(400, 'missing field: {}'.format(e))
+            except ValueError as e:
+                raise HttpError(400, 'invalid job: {}'.format(e))
+        # Cancelled jobs stay in the queue until a worker skips them, they take no slot
+        if sum(1 for x in self._jobs.values() if x.state == RunnerJob.QUEUED) >= self.max_queued:
+            raise HttpError(503, 'job queue is full')
+        job.returncode = None
+        self._jobs[job.job_id] = job
+        self._queue.put_nowait(job)
+        self._trim_history()
+        return job
+
+    def job(self, job_id):
+        """
+        Job with this id, HttpError 404 if it is unknown
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise HttpError(404, 'unknown job: {}'.format(job_id))
+        return job
+
+    def cancel(self, job_id):
+        """
+        Drop a queued job or stop the running one. A running job stays
+        running until its runner returned, and is cancelled then.
+        """
+        job = self.job(job_id)
+        if job.state == RunnerJob.QUEUED:
+            job.state = RunnerJob.CANCELLED
+            job.finished = time.time()
+        elif job.state == RunnerJob.RUNNING:
+            if job.cancel_event.is_set():
+                return job
+            job.cancel_event.set()
+            process = self._processes.get(job_id)
+            if process is not None and process.returncode is None:
+                process.send_signal(signal.SIGTERM)
+                asyncio.get_running_loop().call_later(STOP_GRACE, self._kill, process)
+            if job_id in self._daemon_jobs:
+                asyncio.get_running_loop().run_in_executor(None, self.daemon.cancel, self._daemon_jobs[job_id])
+        else:
+            raise HttpError(409, 'job is {}'.format(job.state))
+        return job
+
+    def origin_allowed(self, origin):
+        """
+        Whether a browser page of this origin may call the API
+        """
+        if origin in self.allowed_origins:
+            return True
+        host, _, port = origin.rpartition(':')
+        return port.isdigit() and host in self.allowed_origins
+
+    @staticmethod
+    def _kill(process):
+        if process.returncode is None:
+            process.kill()
+
+    def describe(self, job):
+        """
+        JSON friendly state of a job, with its position in the queue
+        """
+        description = dict(job.to_dict(), returncode=job.returncode)
+        if job.state == RunnerJob.QUEUED:
+            queued = [x for x in self._jobs.values() if x.state == RunnerJob.QUEUED]
+            description['position'] = queued.index(job)
+        return description
+
+    def _trim_history(self):
+        finished = [job_id for job_id, job in self._jobs.items()
+                    if job.state not in (RunnerJob.QUEUED, RunnerJob.RUNNING)]
+        for job_id in finished[:max(0, len(finished) - self.history_size)]:
+            del self._jobs[job_id]
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.state != RunnerJob.QUEUED:
+                    continue
+                job.state = RunnerJob.RUNNING
+                job.started = time.time()
+                print("Running job {}: {}".format(job.job_id, ' '.join(job.argv)))
+                try:
+                    if self.daemon is not None:
+                        await self._run_on_daemon(job)
+                    else:
+                        await self._run_process(job)
+                except Exception as e:      # pylint: disable=broad-except
+                    job.error = str(e)
+                job.result = job.returncode == 0
+                if job.cancel_event.is_set():
+                    job.state = RunnerJob.CANCELLED
+                else:
+                    job.state = RunnerJob.DONE if job.result else RunnerJob.FAILED
+                job.finished = time.time()
+                print("Job {} {}".format(job.job_id, job.state))
+            finally:
+                self._queue.task_done()
+
+    async def _run_process(self, job):
+        if job.cancel_event.is_set():
+            return
+        os.makedirs(self.log_dir, exist_ok=True)
+        with open(os.path.join(self.log_dir, job.job_id + '.log'), 'wb') as log:
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, self.runner_script, *(self.runner_argv + job.argv),
+                stdin=asyncio.subprocess.DEVNULL, stdout=log, stderr=asyncio.subprocess.STDOUT)
+            self._processes[job.job_id] = process
+            if job.cancel_event.is_set():
+                # Cancelled while the process was starting
+                process.send_signal(signal.SIGTERM)
+                asyncio.get_running_loop().call_later(STOP_GRACE, self._kill, process)
+            try:
+                job.returncode = await process.wait()
+            finally:
+                del self._processes[job.job_id]
+
+    async def _run_on_daemon(self, job):
+        loop = asyncio.get_running_loop()
+        if isinstance(job, PracticeJob):
+            raise ValueError('the runner daemon only runs launcher profiles')
+        if job.cancel_event.is_set():
+            return
+        response = await loop.run_in_executor(None, lambda: self.daemon.submit(
+            job.level, job.scene, job.town, agent=job.agent, weather=job.weather, profile_set=job.profile_set))
+        if not response.get('ok'):
+            raise RuntimeError(response.get('error'))
+        daemon_job_id = self._daemon_jobs[job.job_id] = response['job']['job_id']
+        if job.cancel_event.is_set():
+            await loop.run_in_executor(None, self.daemon.cancel, daemon_job_id)
+        try:
+            while True:
+                await asyncio.sleep(1.0)
+                state = (await loop.run_in_executor(None, self.daemon.status, daemon_job_id)).get('job') or {}
+                if state.get('state') not in (RunnerJob.QUEUED, RunnerJob.RUNNING):
+                    job.returncode = 0 if state.get('result') else 1
+                    job.error = job.error or state.get('error')
+                    return
+        finally:
+            del self._daemon_jobs[job.job_id]
+
+    # HTTP
+
+    def route(self, method, path, body, content_type='application/json'):
+        """
+        (status, payload) of a request
+        """
+        parts = [x for x in path.split('?', 1)[0].split('/') if x]
+        if parts == ['profiles'] and method == 'GET':
+            return 200, {'levels': ['Easy', 'Intermediate', 'Hard'], 'scenes': sorted(difficulty_profiles.SCENE_IDS),
+                         'towns': sorted(difficulty_profiles.TOWN_IDS, key=difficulty_profiles.TOWN_IDS.get)}
+        if not parts or parts[0] != 'jobs' or len(parts) > 3:
+            raise HttpError(404, 'unknown path: {}'.format(path))
+        if len(parts) == 1:
+            if method == 'GET':
+                return 200, {'jobs': [self.describe(x) for x in self._jobs.values()]}
+            if method == 'POST':
+                if content_type.split(';', 1)[0].strip().lower() != 'application/json':
+                    raise HttpError(415, 'body must be application/json')
+                try:
+                    request = json.loads(body.decode('utf-8') or '{}')
+                except ValueError:
+                    raise HttpError(400, 'body is not JSON')
+                if not isinstance(request, dict):
+                    raise HttpError(400, 'body is not a JSON object')
+                return 202, {'job': self.describe(self.submit(request))}
+        elif len(parts) == 2:
+            if method == 'GET':
+                return 200, {'job': self.describe(self.job(parts[1]))}
+            if method == 'DELETE':
+                return 200, {'job': self.describe(self.cancel(parts[1]))}
+        elif parts[2] == 'cancel' and method == 'POST':
+            return 200, {'job': self.describe(self.cancel(parts[1]))}
+        raise HttpError(405, '{} not allowed on {}'.format(method, path))
+
+    async def _handle(self, reader, writer):
+        status, payload, origin = 500, None, None
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1').strip()
+                if not line:
+                    break
+                key, _, value = line.partition(':')
+                headers[key.strip().lower()] = value.strip()
+            if len(request_line) < 2:
+                raise HttpError(400, 'bad request line')
+            method, path = request_line[0].upper(), request_line[1]
+            origin = headers.get('origin')
+            if origin is not None and not self.origin_allowed(origin):
+                origin = None
+                raise HttpError(403, 'origin not allowed')
+            length = int(headers.get('content-length') or 0)
+            if length > MAX_BODY:
+                raise HttpError(413, 'body too large')
+            body = await reader.readexactly(length) if length else b''
+            if method == 'OPTIONS':
+                status, payload = 204, None     # CORS preflight of the browser launcher
+            else:
+                status, payload = self.route(method, path, body, headers.get('content-type', ''))
+        except HttpError as e:
+            status, payload = e.status, {'error': str(e)}
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            status, payload = 400, {'error': str(e)}
+        except Exception as e:      # pylint: disable=broad-except
+            traceback.print_exc()
+            status, payload = 500, {'error': str(e)}
+
+        data = b'' if payload is None else json.dumps(payload).encode('utf-8')
+        head = ['HTTP/1.1 {} {}'.format(status, REASONS.get(status, 'Error')),
+                'Content-Type: application/json',
+                'Content-Length: {}'.format(len(data)),
+                'Connection: close']
+        if origin is not None:
+            head[-1:-1] = ['Access-Control-Allow-Origin: {}'.format(origin),
+                           'Access-Control-Allow-Methods: GET, POST, DELETE, OPTIONS',
+                           'Access-Control-Allow-Headers: Content-Type',
+                           'Vary: Origin']
+        try:
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + data)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=DEFAULT_LISTEN_HOST, port=DEFAULT_LISTEN_PORT, ready=None):
+        """
+        Serve until cancelled
+        """
+        self._queue = asyncio.Queue()
+        workers = [asyncio.ensure_future(self._worker()) for _ in range(self.concurrency)]
+        self._server = await asyncio.start_server(self._handle, host, port)
+        print("Job API listening on {}:{}".format(*self._server.sockets[0].getsockname()[:2]))
+        if ready is not None:
+            ready(self._server.sockets[0].getsockname()[:2])
+        try:
+            async with self._server:
+                await self._server.serve_forever()
+        finally:
+            for job_id in list(self._processes):
+                self.cancel(job_id)
+            for worker in workers:
+                worker.cancel()
+
+
+def main():
+    """
+    Start the job API
+    """
+    parser = argparse.ArgumentParser(description="Local HTTP job API of the launchers")
+    parser.add_argument('--host', default=DEFAULT_LISTEN_HOST, help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', default=DEFAULT_LISTEN_PORT, type=int,
+                        help='Port to listen on (default: {})'.format(DEFAULT_LISTEN_PORT))
+    parser.add_argument('--maxQueued', default=8, type=int, help='Maximum number of waiting jobs')
+    parser.add_argument('--concurrency', default=1, type=int, help='Jobs running at the same time')
+    parser.add_argument('--logDir', default=os.path.join('feedback', 'jobs'), help='Output of the job processes')
+    parser.add_argument('--daemon', metavar='HOST:PORT', help='Run the jobs on this runner daemon instead')
+    parser.add_argument('--allowOrigin', action='append', metavar='ORIGIN',
+                        help='Browser origin allowed to call the API, may be repeated, without a port '
+                             'for every port (default: {})'.format(', '.join(DEFAULT_ALLOWED_ORIGINS)))
+    parser.add_argument('runner_argv', nargs=argparse.REMAINDER,
+                        help='Arguments after -- are passed to every scenario_runner.py run')
+    args = parser.parse_args()
+
+    runner_argv = args.runner_argv[1:] if args.runner_argv[:1] == ['--'] else args.runner_argv
+    daemon = None
+    if args.daemon:
+        host, _, port = args.daemon.rpartition(':')
+        daemon = RunnerClient(host or DEFAULT_LISTEN_HOST, int(port), timeout=5.0)
+    api = JobApi(args.maxQueued, args.concurrency, runner_argv=runner_argv, log_dir=args.logDir,
+                 daemon=daemon, allowed_origins=args.allowOrigin or DEFAULT_ALLOWED_ORIGINS)
+    try:
+        asyncio.run(api.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
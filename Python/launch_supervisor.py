@@ -0,0 +1,221 @@
+"""
+Supervisor of the processes of a driving session.
+
+A session is the scenario runner and the steering wheel client. They run
+as child processes in their own process groups; one reader thread per
+child pushes its output lines and exit status on a queue, and the UI
+drains the queue from its own thread with poll(), e.g. from root.after,
+so nothing ever blocks the UI.
+
+The first command of a session is the primary one: when it exits the
+session is over and the other processes are stopped. Only one session
+runs at a time.
+"""
+
+from __future__ import print_function
+
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+# Seconds between SIGTERM and SIGKILL when a session is cancelled
+STOP_GRACE = 5.0
+
+# Lines handed to the UI per poll, so a chatty child cannot stall it
+MAX_LINES_PER_POLL = 200
+
+
+class _Child(object):
+
+    """
+    One supervised process and its reader thread
+    """
+
+    def __init__(self, name, argv, cwd, events):
+        self.name = name
+        self.argv = argv
+        env = dict(os.environ, PYTHONUNBUFFERED='1')
+        self.process = subprocess.Popen(argv, cwd=cwd, env=env, stdin=subprocess.DEVNULL,
+                                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                        text=True, errors='replace', bufsize=1, start_new_session=True)
+        self.returncode = None
+        self._events = events
+        self._thread = threading.Thread(target=self._read, name='supervisor-' + name, daemon=True)
+        self._thread.start()
+
+    def _read(self):
+        for line in self.process.stdout:
+            self._events.put(('output', self.name, line.rstrip('\n')))
+        self.process.stdout.close()
+        self._events.put(('exit', self.name, self.process.wait()))
+
+    def signal(self, signum):
+        """
+        Send a signal to the process group of the child
+        """
+        try:
+            os.killpg(self.process.pid, signum)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+class LaunchSupervisor(object):
+
+    """
+    Starts, streams, cancels and restarts the processes of a session.
+
+    Usage:
+    supervisor = LaunchSupervisor(on_output=log, on_exit=exited, on_state=update_buttons)
+    supervisor.attach(root)     # polls the events from root.after
+    supervisor.start([('scenario_runner', argv), ('steering_wheel', argv)])
+    ...
+    supervisor.cancel()
+    """
+
+    def __init__(self, cwd=None, on_output=None, on_exit=None, on_state=None):
+        self.cwd = cwd
+        self.on_output = on_output
+        self.on_exit = on_exit
+        self.on_state = on_state
+        self._events = queue.Queue()
+        self._children = {}
+        self._commands = None
+        self._primary = None
+        self._restart = False
+        self._stopping = False
+        self.started = None
+
+    @property
+    def running(self):
+        """
+        Whether a session is running (or still stopping)
+        """
+        return bool(self._children)
+
+    def start(self, commands):
+        """
+        Start a session from (name, argv) pairs, the first one being the primary.
+        Returns False if a session is already running.
+        """
+        if self.running:
+            return False
+        self._commands = list(commands)
+        self._primary = self._commands[0][0]
+        self._stopping = False
+        self.started = time.time()
+        try:
+            for name, argv in self._commands:
+                self._children[name] = _Child(name, argv, self.cwd, self._events)
+        except OSError as e:
+            self._events.put(('output', name, "Cannot start {}: {}".format(name, e)))
+            self.cancel()
+            if not self._children:
+                self._notify_state()
+            return False
+        self._notify_state()
+        return True
+
+    def cancel(self):
+        """
+        Stop every process of the session, without waiting for them
+        """
+        if not self._children or self._stopping:
+            return
+        self._stopping = True
+        children = list(self._children.values())
+        for child in children:
+            child.signal(signal.SIGTERM)
+        threading.Thread(target=self._kill_after, args=(children,), name='supervisor-stop', daemon=True).start()
+        self._notify_state()
+
+    @staticmethod
+    def _kill_after(children):
+        deadline = time.monotonic() + STOP_GRACE
+        for child in children:
+            try:
+                child.process.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                child.signal(signal.SIGKILL)
+
+    def restart(self):
+        """
+        Stop the session and start it again with the same commands
+        """
+        if self._commands is None:
+            return
+        if not self.running:
+            self.start(self._commands)
+            return
+        self._restart = True
+        self.cancel()
+
+    @property
+    def stopping(self):
+        """
+        Whether the running session is being stopped
+        """
+        return self._stopping
+
+    def poll(self):
+        """
+        Dispatch the pending events to the callbacks, from the caller's thread
+        """
+        for _ in range(MAX_LINES_PER_POLL):
+            try:
+                kind, name, value = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'output':
+                if self.on_output:
+                    self.on_output(name, value)
+                continue
+
+            child = self._children.pop(name, None)
+            if child is not None:
+                child.returncode = value
+            if self.on_exit:
+                self.on_exit(name, value)
+            if name == self._primary and self._children:
+                self.cancel()
+            if not self._children:
+                self._stopping = False
+                self._notify_state()
+                if self._restart:
+                    self._restart = False
+                    self.start(self._commands)
+
+    def attach(self, root, interval=100):
+        """
+        Poll from the Tk event loop every interval milliseconds
+        """
+        def tick():
+            self.poll()
+            root.after(interval, tick)
+        root.after(interval, tick)
+
+    def shutdown(self, timeout=STOP_GRACE):
+        """
+        Stop the session and wait for it, when the UI closes
+        """
+        children = list(self._children.values())
+        self.cancel()
+        for child in children:
+            try:
+                child.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                child.signal(signal.SIGKILL)
+
+    def _notify_state(self):
+        if self.on_state:
+            self.on_state(self.running)
+
+
+def python_command(script, *args):
+    """
+    argv running a script of this directory with the current interpreter
+    """
+    return [sys.executable, script] + list(args)
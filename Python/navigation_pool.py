@@ -0,0 +1,161 @@
+"""
+Prefetched pool of navigation locations for the pedestrians.
+
+Asking the server for world.get_random_location_from_navigation() once
+per walker spawn and once per walker target means hundreds of blocking
+calls for the dense scenes, and nothing keeps two walkers from being
+spawned on top of each other. The pool samples the navigation mesh once
+per town, keeps the samples on disk, and hands out spawn points that are
+at least `min_separation` meters apart from each other.
+"""
+
+from __future__ import print_function
+
+import io
+import os
+import random
+
+import numpy as np
+
+import carla
+
+import difficulty_profiles
+from runner_cache import cache_path, write_atomic
+
+_POOLS = {}
+
+
+def separated_indices(points, min_separation):
+    """
+    Indices of a subset of points (in their order) whose pairwise distances
+    are all at least min_separation. Greedy, vectorized per accepted point.
+    """
+    if len(points) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    # Cheap first pass: keep one point per grid cell small enough to only
+    # hold points closer than min_separation
+    cells = np.floor(points / (min_separation / np.sqrt(3.0))).astype(np.int64)
+    _, first = np.unique(cells, axis=0, return_index=True)
+    candidates = np.sort(first)
+
+    # Exact greedy pass over the remaining candidates
+    subset = points[candidates].astype(np.float64)
+    norms = np.sum(subset ** 2, axis=1)
+    squared = norms[:, None] + norms[None, :] - 2.0 * subset.dot(subset.T)
+    too_close = squared < min_separation ** 2
+    blocked = np.zeros(len(subset), dtype=bool)
+    keep = []
+    for i in range(len(subset)):
+        if blocked[i]:
+            continue
+        keep.append(i)
+        blocked |= too_close[i]
+    return candidates[np.array(keep, dtype=np.int64)]
+
+
+def _max_walkers():
+    return max(profile.get("num_walkers", 0) for profiles in difficulty_profiles.PROFILE_SETS.values()
+               for profile in profiles.values())
+
+
+class NavigationPool(object):
+
+    """
+    Navigation samples of one town.
+
+    Usage:
+    pool = NavigationPool.for_world(world, town)
+    spawn_locations = pool.spawn_locations(150)
+    targets = pool.targets(150)
+    """
+
+    # Samples fetched for a town: twice the densest profile, for the separation and the retries.
+    # A larger custom population fetches more samples once.
+    pool_size = 2 * _max_walkers()
+    min_separation = 2.0   # in meters, between two walker spawn points
+
+    def __init__(self, world, town, cache_file=None):
+        self._world = world
+        self._town = town
+        self._cache_file = cache_file or cache_path('navigation', '{}.npy'.format(town))
+        self._points = self._load()
+        self._used = set()
+
+    @classmethod
+    def for_world(cls, world, town):
+        """
+        Pool of the town, shared by all the runs of this process
+        """
+        pool = _POOLS.get(town)
+        if pool is None:
+            pool = _POOLS[town] = cls(world, town)
+        pool._world = world     # pylint: disable=protected-access
+        pool.release()
+        return pool
+
+    def _load(self):
+        if os.path.isfile(self._cache_file):
+            try:
+                points = np.load(self._cache_file)
+                if points.ndim == 2 and points.shape[1] == 3 and len(points):
+                    return points
+            except (OSError, ValueError):
+                pass
+        return self._fetch(self.pool_size, np.zeros((0, 3), dtype=np.float32))
+
+    def _fetch(self, number, points):
+        print("Sampling {} navigation locations of {}".format(number, self._town))
+        samples = []
+        for _ in range(number):
+            location = self._world.get_random_location_from_navigation()
+            if location is not None:
+                samples.append((location.x, location.y, location.z))
+        points = np.concatenate([points, np.array(samples, dtype=np.float32).reshape(-1, 3)])
+        stream = io.BytesIO()
+        np.save(stream, points)
+        write_atomic(self._cache_file, stream.getvalue())
+        return points
+
+    def release(self):
+        """
+        Make every sample available again (new run)
+        """
+        self._used = set()
+
+    def _rng(self):
+        # Follows the global seed, set by the runner from --trafficManagerSeed
+        return np.random.RandomState(random.getrandbits(32))
+
+    def _choose(self, rng, number):
+        order = rng.permutation(len(self._points))
+        order = np.array([x for x in order if x not in self._used], dtype=np.int64)
+        if self._used and len(order):
+            # Away from the walkers placed already, the retries spawn next to them
+            used = self._points[sorted(self._used)].astype(np.float64)
+            squared = np.sum((self._points[order, None, :] - used[None, :, :]) ** 2, axis=-1)
+            order = order[np.all(squared >= self.min_separation ** 2, axis=1)]
+        return order[separated_indices(self._points[order], self.min_separation)][:number]
+
+    def spawn_locations(self, number):
+        """
+        Up to `number` unused locations, all min_separation apart and from
+        the locations handed out before in this run
+        """
+        rng = self._rng()
+        chosen = self._choose(rng, number)
+        if len(chosen) < number:
+            # Not enough well separated samples, get some more once
+            self._points = self._fetch(max(number * 2, self.pool_size // 2), self._points)
+            chosen = self._choose(rng, number)
+
+        self._used.update(int(x) for x in chosen)
+        return [carla.Location(float(x), float(y), float(z)) for x, y, z in self._points[chosen]]
+
+    def targets(self, number):
+        """
+        `number` random destinations (they do not need to be separated)
+        """
+        chosen = self._rng().randint(0, len(self._points), size=number)
+        return [carla.Location(float(x), float(y), float(z)) for x, y, z in self._points[chosen]]
+
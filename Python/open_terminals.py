@@ -1,91 +1,60 @@
+import shlex
 import subprocess
+import sys
 
-def open_terminals(level, scene, town):
-    scene_map = {
-        "Scene 1": "1",
-        "Scene 2": "2",
-        "Scene 3": "3"
-    }
-    town_map = {
-        "Town 02": 0,
-        "Town 03": 1,
-        "Town 04": 2,
-        "Town 05": 3,
-        "Town 06": 4
-    }
-    print(scene)
-    print(town)
-    print(level)
+import difficulty_profiles
+
+STEERING_WHEEL_SCRIPT = 'manual_control_steeringwheel_trials_copy.py'
 
-    # Validate scene and town
-    # scene_id = scene_map.get(scene)
-    # town_id = town_map.get(town)
+PRACTICE_ARGUMENTS = ['--route', 'srunner/data/final_routes.xml',
+                      'srunner/data/practice_all_towns_traffic_scenarios.json', '0',
+                      '--agent', 'srunner/autoagents/human_agent.py', '--output',
+                      '--telemetry', str(difficulty_profiles.TELEMETRY_PORT)]
 
-    scene_id = scene
-    town_id = town
 
-    print(scene_id)
-    if scene_id is None:
-        raise ValueError("Unknown scene")
-    if town_id is None:
-        raise ValueError("Unknown town")
+def session_commands(level, scene, town, daemon=False):
+    """
+    (name, argv) of the processes of a session, the scenario runner first.
+    With daemon=True the scenario runs on the runner daemon, which may
+    have preloaded the town already.
+    """
+    # Validate scene and town (labels such as "Scene 1" / "Town 02" or their ids)
+    scene_id = difficulty_profiles.scene_id(scene)
+    town_id = difficulty_profiles.town_id(town)
 
     level = level.lower()
 
     # Default parameters
-    weather_param = '\'Wet Cloudy Noon\''
     display_caution_param = '--display_caution'
 
-    # Initialize other_params
-    other_params = ''
+    if daemon:
+        runner = [sys.executable, 'runner_daemon.py', '--submit', level, scene_id, str(town_id)]
+    else:
+        runner = [sys.executable, 'scenario_runner.py'] + \
+            difficulty_profiles.build_runner_arguments(level, scene_id, town_id)
 
-    if level == 'easy':
-        repetitions = 1
-        other_params = f'--repetitions {repetitions}'
-    elif level == 'intermediate':
-        if scene_id == '1':
-            num_walkers = 15
-            num_vehicles_Indic_TwoWheeler = 10
-            other_params = f'--spawn_pedestrian --num_walkers {num_walkers} --spawn_vehicle --spawn_vehicle_Indic_TwoWheeler --num_vehicles_Indic_TwoWheeler {num_vehicles_Indic_TwoWheeler}'
-        elif scene_id == '2':
-            num_walkers = 15
-            num_vehicles_Indic_TwoWheeler = 5
-            num_vehicles_Indic_ThreeWheeler = 5
-            other_params = f'--spawn_pedestrian --num_walkers {num_walkers} --spawn_vehicle --spawn_vehicle_Indic_TwoWheeler --num_vehicles_Indic_TwoWheeler {num_vehicles_Indic_TwoWheeler} --spawn_vehicle_Indic_ThreeWheeler --num_vehicles_Indic_ThreeWheeler {num_vehicles_Indic_ThreeWheeler}'
-        elif scene_id == '3':
-            num_walkers = 15
-            num_vehicles_Indic_TwoWheeler = 5
-            num_vehicles_Indic_ThreeWheeler = 5
-            other_params = f'--spawn_pedestrian --num_walkers {num_walkers} --spawn_vehicle --spawn_vehicle_Indic_TwoWheeler --num_vehicles_Indic_TwoWheeler {num_vehicles_Indic_TwoWheeler} --spawn_vehicle_Indic_ThreeWheeler --num_vehicles_Indic_ThreeWheeler {num_vehicles_Indic_ThreeWheeler}'
-    elif level == 'hard':
-        if scene_id == '1':
-            num_walkers = 150
-            num_vehicles_Indic_TwoWheeler = 15
-            num_vehicles_Indic_HeavyVehicle = 10
-            num_vehicles_Indic_ThreeWheeler = 10
-            other_params = f'--spawn_pedestrian --num_walkers {num_walkers} --spawn_vehicle --spawn_vehicle_Indic_TwoWheeler --num_vehicles_Indic_TwoWheeler {num_vehicles_Indic_TwoWheeler} --spawn_vehicle_Indic_HeavyVehicle --num_vehicles_Indic_HeavyVehicle {num_vehicles_Indic_HeavyVehicle} --spawn_vehicle_Indic_ThreeWheeler --num_vehicles_Indic_ThreeWheeler {num_vehicles_Indic_ThreeWheeler}'
-        elif scene_id == '2':
-            num_vehicles_Indic_TwoWheeler = 10
-            num_vehicles_Indic_HeavyVehicle = 10
-            num_vehicles_Indic_ThreeWheeler = 10
-            num_vehicles_Indic_FourWheeler = 5
-            other_params = f'--spawn_vehicle --spawn_vehicle_Indic_TwoWheeler --num_vehicles_Indic_TwoWheeler {num_vehicles_Indic_TwoWheeler} --spawn_vehicle_Indic_HeavyVehicle --num_vehicles_Indic_HeavyVehicle {num_vehicles_Indic_HeavyVehicle} --spawn_vehicle_Indic_ThreeWheeler --num_vehicles_Indic_ThreeWheeler {num_vehicles_Indic_ThreeWheeler} --spawn_vehicle_Indic_FourWheeler --num_vehicles_Indic_FourWheeler {num_vehicles_Indic_FourWheeler}'
-        elif scene_id == '3':
-            num_vehicles_Indic_TwoWheeler = 10
-            num_vehicles_Indic_HeavyVehicle = 10
-            num_vehicles_Indic_ThreeWheeler = 10
-            num_vehicles_Indic_FourWheeler = 5
-            other_params = f'--spawn_vehicle --spawn_vehicle_Indic_TwoWheeler --num_vehicles_Indic_TwoWheeler {num_vehicles_Indic_TwoWheeler} --spawn_vehicle_Indic_HeavyVehicle --num_vehicles_Indic_HeavyVehicle {num_vehicles_Indic_HeavyVehicle} --spawn_vehicle_Indic_ThreeWheeler --num_vehicles_Indic_ThreeWheeler {num_vehicles_Indic_ThreeWheeler} --spawn_vehicle_Indic_FourWheeler --num_vehicles_Indic_FourWheeler {num_vehicles_Indic_FourWheeler}'
+    return [
+        ('scenario_runner', runner),
+        ('steering_wheel', [sys.executable, STEERING_WHEEL_SCRIPT, display_caution_param]),
+    ]
 
-    # Construct the command
-    # command = (f"python3 scenario_runner.py --route srunner/data/final_routes_loop.xml srunner/data/final_all_towns_traffic_scenarios_loop_{level}{scene_id}.json {town_id} --agent srunner/autoagents/human_agent.py --output --weather {weather_param} {other_params}")
-    command = (f"python3 scenario_runner.py --route srunner/data/final_routes_loop.xml srunner/data/final_all_towns_traffic_scenarios_loop_{level}{scene_id}.json {town_id} --agent srunner/autoagents/steering_agent.py --output --weather {weather_param} {other_params}")
-    # command = (f"python3 scenario_runner.py --route srunner/data/final_routes_loop.xml srunner/data/final_all_towns_traffic_scenarios_loop_{level}{scene_id}.json {town_id} --output --weather {weather_param} {other_params}")
 
+def practice_commands():
+    """
+    (name, argv) of the practice drive, on the practice routes of all towns
+    """
+    return [('scenario_runner', [sys.executable, 'scenario_runner.py'] + PRACTICE_ARGUMENTS)]
 
-    print(command)
 
-    # Open terminals
-    subprocess.Popen(['gnome-terminal', '--', 'bash', '-c', f'{command}; exec bash'])
-    subprocess.Popen(['gnome-terminal', '--', 'bash', '-c', f'python3 manual_control_steeringwheel_trials_copy.py {display_caution_param}; exec bash'])
+def open_terminals(level, scene, town):
+    print(scene)
+    print(town)
+    print(level)
+
+    commands = session_commands(level, scene, town)
+    for _, argv in commands:
+        print(shlex.join(argv))
 
+    # Open terminals
+    for _, argv in commands:
+        subprocess.Popen(['gnome-terminal', '--', 'bash', '-c', f'{shlex.join(argv)}; exec bash'])
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+
+"""
+Per-phase timings of the scenario launches.
+
+Every run of scenario_runner.py is split into sequential phases (connect,
+load_world, ego_spawn, npc_spawn, ..., cleanup). Each phase records its
+wall clock time and, when a world is loaded, the simulation frames and
+seconds it spanned. One JSON record per run is appended to
+<outputDir>/phase_timings.jsonl, next to the other feedback files.
+
+Run as a script to aggregate the records of many runs:
+
+    python3 phase_timer.py feedback/phase_timings.jsonl --group-by level
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+TIMINGS_FILE = 'phase_timings.jsonl'
+
+
+class PhaseTimer(object):
+
+    """
+    Sequential phases of one run. Starting a phase ends the previous one.
+
+    Usage:
+    timer = PhaseTimer(sim_clock)
+    timer.start('load_world')
+    ...
+    timer.start('run')
+    ...
+    timer.stop()
+    timer.save(output_dir, scenario=config.name)
+
+    sim_clock is a callable returning (frame, elapsed simulation seconds),
+    or None while no world is available.
+    """
+
+    def __init__(self, sim_clock=None):
+        self._sim_clock = sim_clock
+        self.started = datetime.now()
+        self.phases = []
+        self._current = None
+
+    def _clock(self):
+        if self._sim_clock is None:
+            return None
+        return self._sim_clock()
+
+    def add(self, name, wall):
+        """
+        Record a phase measured elsewhere (e.g. connecting before the run started)
+        """
+        self.phases.append({'phase': name, 'wall': round(wall, 6), 'frames': None, 'sim_time': None})
+
+    def start(self, name):
+        """
+        End the current phase, if any, and start a new one
+        """
+        self.stop()
+        self._current = (name, time.perf_counter(), self._clock())
+
+    def stop(self):
+        """
+        End the current phase
+        """
+        if self._current is None:
+            return
+        name, start, sim_start = self._current
+        wall = time.perf_counter() - start
+        sim_end = self._clock()
+        self._current = None
+
+        frames = sim_time = None
+        # Frames are only comparable inside the same episode (no map load in between)
+        if sim_start is not None and sim_end is not None and sim_end[0] >= sim_start[0]:
+            frames = sim_end[0] - sim_start[0]
+            sim_time = round(sim_end[1] - sim_start[1], 6)
+        self.phases.append({'phase': name, 'wall': round(wall, 6), 'frames': frames, 'sim_time': sim_time})
+
+    @property
+    def total(self):
+        return sum(x['wall'] for x in self.phases)
+
+    def record(self, **fields):
+        """
+        JSON serializable record of the run
+        """
+        record = {'time': self.started.isoformat(timespec='seconds')}
+        record.update(fields)
+        record['total'] = round(self.total, 6)
+        record['phases'] = self.phases
+        return record
+
+    def save(self, output_dir, **fields):
+        """
+        Append the record of the run to the timings file of the output directory
+        """
+        output_dir = output_dir or '.'
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, TIMINGS_FILE)
+        with open(path, 'a', encoding='utf-8') as fp:
+            fp.write(json.dumps(self.record(**fields), separators=(',', ':')) + '\n')
+        return path
+
+    def __str__(self):
+        lines = ["Phase timings:"]
+        for phase in self.phases:
+            frames = "" if phase['frames'] is None else "  ({} frames, {:.2f}s simulated)".format(
+                phase['frames'], phase['sim_time'])
+            lines.append("  {:<16}{:>9.3f}s{}".format(phase['phase'], phase['wall'], frames))
+        lines.append("  {:<16}{:>9.3f}s".format("total", self.total))
+        return "\n".join(lines)
+
+
+def load_records(paths):
+    """
+    Records of one or more timings files, skipping the lines that do not parse
+    """
+    records = []
+    for path in paths:
+        if os.path.isdir(path):
+            path = os.path.join(path, TIMINGS_FILE)
+        with open(path, 'r', encoding='utf-8') as fp:
+            for line in fp:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    return records
+
+
+def percentile(values, q):
+    """
+    Nearest rank percentile of a sorted list
+    """
+    index = max(0, min(len(values) - 1, int(math.ceil(q / 100.0 * len(values))) - 1))
+    return values[index]
+
+
+def summarize(records):
+    """
+    Per phase statistics, in the order the phases first appear
+    """
+    walls = {}
+    frames = {}
+    for record in records:
+        for phase in record.get('phases', []):
+            walls.setdefault(phase['phase'], []).append(phase['wall'])
+            if phase.get('frames') is not None:
+                frames.setdefault(phase['phase'], []).append(phase['frames'])
+    totals = sum(sum(x) for x in walls.values()) or 1.0
+
+    summary = []
+    for name, values in walls.items():
+        values = sorted(values)
+        summary.append({
+            'phase': name,
+            'runs': len(values),
+            'median': statistics.median(values),
+            'p95': percentile(values, 95),
+            'max': values[-1],
+            'share': sum(values) / totals,
+            'frames': statistics.median(frames[name]) if name in frames else None,
+        })
+    return summary
+
+
+def print_summary(title, records):
+    print("{} ({} runs, {} failed)".format(title, len(records), sum(1 for x in records if not x.get('result'))))
+    print("  {:<16}{:>6}{:>10}{:>10}{:>10}{:>8}{:>10}".format(
+        "phase", "runs", "median", "p95", "max", "share", "frames"))
+    for row in summarize(records):
+        print("  {:<16}{:>6}{:>9.3f}s{:>9.3f}s{:>9.3f}s{:>7.1%}{:>10}".format(
+            row['phase'], row['runs'], row['median'], row['p95'], row['max'], row['share'],
+            "" if row['frames'] is None else "{:g}".format(row['frames'])))
+    totals = sorted(x.get('total', 0.0) for x in records)
+    if totals:
+        print("  {:<16}{:>6}{:>9.3f}s{:>9.3f}s{:>9.3f}s".format(
+            "total", len(totals), statistics.median(totals), percentile(totals, 95), totals[-1]))
+
+
+def main():
+    """
+    Aggregate the phase timings of many runs
+    """
+    parser = argparse.ArgumentParser(description="Summary of the scenario runner phase timings")
+    parser.add_argument('files', nargs='*', default=[os.path.join('feedback', TIMINGS_FILE)],
+                        help='Timings files, or the output directories holding them')
+    parser.add_argument('--group-by', choices=['scenario', 'town', 'level', 'scene', 'result'],
+                        help='Summarize each group separately')
+    parser.add_argument('--last', type=int, help='Only the last N runs')
+    args = parser.parse_args()
+
+    try:
+        records = load_records(args.files)
+    except OSError as e:
+        print("Cannot read the timings: {}".format(e))
+        return 1
+    if args.last:
+        records = records[-args.last:]
+    if not records:
+        print("No runs recorded")
+        return 0
+
+    if not args.group_by:
+        print_summary("All runs", records)
+        return 0
+
+    groups = {}
+    for record in records:
+        groups.setdefault(str(record.get(args.group_by)), []).append(record)
+    for key in sorted(groups):
+        print_summary("{} = {}".format(args.group_by, key), groups[key])
+        print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
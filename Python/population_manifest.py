@@ -0,0 +1,105 @@
+"""
+Cached population manifests.
+
+The resolved spawn plan of a (level, scene, town, seed, route) is saved
+as a compact manifest: blueprint ids, attributes, transforms, walker speeds
+and targets. Later runs with the same key load it and skip planning,
+which also makes repeated evaluation sessions spawn exactly the same
+traffic for every driver. The plan keeps clear of the ego vehicles, so
+their spawn locations are part of the key as well: another route of the
+same town gets its own manifest.
+"""
+
+from __future__ import print_function
+
+import hashlib
+import json
+import os
+
+import carla
+
+from runner_cache import cache_path, write_atomic
+from traffic_population import SpawnPlan
+
+MANIFEST_VERSION = 1
+
+
+def _location(location):
+    return [round(location.x, 3), round(location.y, 3), round(location.z, 3)]
+
+
+def _transform(transform):
+    rotation = transform.rotation
+    return _location(transform.location) + [round(rotation.pitch, 3), round(rotation.yaw, 3), round(rotation.roll, 3)]
+
+
+def _to_location(values):
+    return carla.Location(*values)
+
+
+def _to_transform(values):
+    return carla.Transform(carla.Location(*values[:3]),
+                           carla.Rotation(pitch=values[3], yaw=values[4], roll=values[5]))
+
+
+class PopulationManifest(object):
+
+    """
+    On-disk spawn plan of one launch configuration.
+
+    Usage:
+    manifest = PopulationManifest(level, scene, town, seed, profile, config.name, ego_locations)
+    plan = manifest.load(catalog)
+    if plan is None:
+        plan = planner.plan(...)
+        manifest.save(plan)
+    """
+
+    def __init__(self, level, scene, town, seed, profile, route=None, ego_locations=()):
+        self._profile = {'vehicles': profile.vehicles, 'walkers': profile.walkers}
+        # Within a metre, so that the settling of the ego vehicle does not change the key
+        egos = [[int(round(x.x)), int(round(x.y))] for x in ego_locations]
+        key = {'profile': self._profile, 'route': route, 'egos': egos}
+        signature = hashlib.sha1(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()[:10]
+        # Without a level and scene, the profile itself identifies the population
+        name = '{}-{}-{}-{}-{}'.format(level or 'custom', scene or 'any', town, seed, signature)
+        self.path = cache_path('populations', name.lower().replace(' ', '_') + '.json')
+
+    def load(self, catalog):
+        """
+        The saved plan, or None if there is no valid manifest
+        """
+        if not os.path.isfile(self.path):
+            return None
+        try:
+            with open(self.path, 'r', encoding='utf-8') as fp:
+                manifest = json.load(fp)
+            if manifest['version'] != MANIFEST_VERSION or manifest['profile'] != self._profile:
+                return None
+
+            plan = SpawnPlan()
+            for category, blueprint_id, attributes, transform in manifest['vehicles']:
+                plan.vehicles.append((category, catalog.find(blueprint_id), attributes, _to_transform(transform)))
+            for blueprint_id, attributes, transform, speed, target in manifest['walkers']:
+                plan.walkers.append((catalog.find(blueprint_id), attributes, _to_transform(transform),
+                                     speed, _to_location(target)))
+        except (OSError, ValueError, KeyError, IndexError) as e:
+            print("Ignoring population manifest {}: {}".format(self.path, e))
+            return None
+
+        print("Loaded population manifest {}".format(self.path))
+        return plan
+
+    def save(self, plan):
+        """
+        Store a plan for the next runs
+        """
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'profile': self._profile,
+            'vehicles': [[category, blueprint.id, attributes, _transform(transform)]
+                         for category, blueprint, attributes, transform in plan.vehicles],
+            'walkers': [[blueprint.id, attributes, _transform(transform), speed, _location(target)]
+                        for blueprint, attributes, transform, speed, target in plan.walkers],
+        }
+        write_atomic(self.path, json.dumps(manifest, separators=(',', ':')).encode('utf-8'))
@@ -0,0 +1,479 @@
+#!/usr/bin/env python
+
+"""
+Columnar index of the CARLA recorder logs.
+
+With --record the runner saves the CARLA recorder log of every scenario
+(<record>/<scenario>.mp4, despite the extension it is the binary recorder
+format) next to the criteria file. Reading anything back out of it used
+to mean replaying it in a server. This module parses the log directly and
+writes its per-frame content as plain numpy columns in a directory next to
+it (<record>/<scenario>.frames/):
+
+- frame_ids.npy, elapsed.npy: simulation frame and time of every recorded frame
+- actor.npy, frame.npy: one row per actor and frame, sorted by actor then frame
+  (frame is the position in frame_ids)
+- location.npy, rotation.npy: (rows, 3) float32, meters and degrees (roll, pitch, yaw)
+- velocity.npy: (rows, 3) float32, m/s, NaN where the log has no kinematics
+- control.npy: (rows, 4) float32, steer, throttle, brake, hand brake, NaN for non vehicles
+- collisions.npy: frame, actor1, actor2 of every collision
+- index.json: map, date, and the actors (blueprint, role name, rows, lifetime)
+
+The arrays are loaded memory mapped, so a metric over hundreds of sessions
+only reads the rows it needs, without a simulator.
+
+Build the index of existing logs and query it:
+
+    python3 recorder_index.py build records/*.mp4
+    python3 recorder_index.py query records/ --role hero
+"""
+
+from __future__ import print_function
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+
+import numpy as np
+
+INDEX_FILE = 'index.json'
+INDEX_VERSION = 1
+
+# Recorder packet ids (CarlaRecorderPacketId), the others are skipped
+FRAME_START = 0
+EVENT_ADD = 2
+EVENT_DEL = 3
+EVENT_PARENT = 4
+COLLISION = 5
+POSITION = 6
+ANIM_VEHICLE = 8
+KINEMATICS = 12
+
+# The recorder stores Unreal units (centimeters)
+UNITS_TO_METERS = 0.01
+
+_POSITION = np.dtype([('id', '<u4'), ('location', '<f4', 3), ('rotation', '<f4', 3)])
+_KINEMATICS = np.dtype([('id', '<u4'), ('linear', '<f4', 3), ('angular', '<f4', 3)])
+_ANIM_VEHICLE = np.dtype([('id', '<u4'), ('steer', '<f4'), ('throttle', '<f4'), ('brake', '<f4'),
+                          ('handbrake', 'u1'), ('gear', '<i4')])
+_COLLISION = np.dtype([('id', '<u4'), ('actor1', '<u4'), ('actor2', '<u4'), ('hero1', 'u1'), ('hero2', 'u1')])
+
+COLLISIONS = np.dtype([('frame', '<u4'), ('actor1', '<u4'), ('actor2', '<u4')])
+
+
+class RecorderFormatError(Exception):
+
+    """
+    The file is not a recorder log this parser understands
+    """
+
+
+class _Reader(object):
+
+    """
+    Sequential reader of the little endian recorder values
+    """
+
+    def __init__(self, data, offset=0):
+        self.data = data
+        self.offset = offset
+
+    def unpack(self, fmt):
+        values = struct.unpack_from(fmt, self.data, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values
+
+    def string(self):
+        length, = self.unpack('<H')
+        value = bytes(self.data[self.offset:self.offset + length])
+        self.offset += length
+        return value.decode('utf-8', 'replace').rstrip('\0')
+
+
+def _records(data, start, size, dtype):
+    """
+    Array view of a packet made of a uint16 count and fixed size records
+    """
+    count, = struct.unpack_from('<H', data, start)
+    if 2 + count * dtype.itemsize != size:
+        raise RecorderFormatError("unexpected packet size {} for {} records".format(size, count))
+    return np.frombuffer(data, dtype, count, start + 2)
+
+
+def read_recording(path):
+    """
+    Parse a recorder log into (info, frames, actors, chunks) where chunks
+    maps a packet id to a list of (frame, records)
+    """
+    with open(path, 'rb') as fp:
+        data = fp.read()
+
+    reader = _Reader(data)
+    try:
+        version, = reader.unpack('<H')
+        magic = reader.string()
+        date, = reader.unpack('<q')
+        map_name = reader.string()
+    except struct.error:
+        raise RecorderFormatError("{} is too short".format(path))
+    if magic != 'CARLA_RECORDER':
+        raise RecorderFormatError("{} is not a CARLA recorder log".format(path))
+    info = {'version': version, 'date': date, 'map': map_name}
+
+    frame_ids = []
+    elapsed = []
+    actors = {}
+    chunks = {COLLISION: [], POSITION: [], KINEMATICS: [], ANIM_VEHICLE: []}
+    frame = -1
+    offset = reader.offset
+    while offset + 5 <= len(data):
+        packet_id, size = struct.unpack_from('<BI', data, offset)
+        start = offset + 5
+        offset = start + size
+        if offset > len(data):
+            print("Truncated recorder log {}, stopping at frame {}".format(path, len(frame_ids)))
+            break
+
+        if packet_id == FRAME_START:
+            frame_id, _, frame_elapsed = struct.unpack_from('<Qdd', data, start)
+            frame_ids.append(frame_id)
+            elapsed.append(frame_elapsed)
+            frame = len(frame_ids) - 1
+        elif frame < 0:
+            continue
+        elif packet_id in chunks:
+            dtype = {COLLISION: _COLLISION, POSITION: _POSITION,
+                     KINEMATICS: _KINEMATICS, ANIM_VEHICLE: _ANIM_VEHICLE}[packet_id]
+            chunks[packet_id].append((frame, _records(data, start, size, dtype)))
+        elif packet_id == EVENT_ADD:
+            event = _Reader(data, start)
+            count, = event.unpack('<H')
+            for _ in range(count):
+                actor_id, actor_type = event.unpack('<IB')
+                event.unpack('<6f')         # spawn location and rotation
+                event.unpack('<I')          # blueprint uid
+                type_id = event.string()
+                attributes = {}
+                attribute_count, = event.unpack('<H')
+                for _ in range(attribute_count):
+                    event.unpack('<B')
+                    key = event.string()
+                    attributes[key] = event.string()
+                actors[actor_id] = {'type_id': type_id, 'type': actor_type,
+                                    'role_name': attributes.get('role_name', ''),
+                                    'spawned': frame, 'destroyed': None, 'parent': None}
+        elif packet_id == EVENT_DEL:
+            count, = struct.unpack_from('<H', data, start)
+            for actor_id in struct.unpack_from('<{}I'.format(count), data, start + 2):
+                if actor_id in actors:
+                    actors[actor_id]['destroyed'] = frame
+        elif packet_id == EVENT_PARENT:
+            count, = struct.unpack_from('<H', data, start)
+            pairs = struct.unpack_from('<{}I'.format(2 * count), data, start + 2)
+            for actor_id, parent_id in zip(pairs[::2], pairs[1::2]):
+                if actor_id in actors:
+                    actors[actor_id]['parent'] = parent_id
+
+    frames = (np.array(frame_ids, dtype=np.uint64), np.array(elapsed, dtype=np.float64))
+    return info, frames, actors, chunks
+
+
+def _stack(chunks, dtype):
+    """
+    (frame, records) of all the chunks of a packet type
+    """
+    if not chunks:
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=dtype)
+    frames = np.concatenate([np.full(len(records), frame, dtype=np.uint32) for frame, records in chunks])
+    return frames, np.concatenate([records for _, records in chunks])
+
+
+def _keys(actor_ids, frames):
+    return (actor_ids.astype(np.uint64) << np.uint64(32)) | frames.astype(np.uint64)
+
+
+def _lookup(keys, other_keys):
+    """
+    Row of every key of other_keys in the sorted keys, -1 if absent
+    """
+    if not len(keys):
+        return np.full(len(other_keys), -1, dtype=np.int64)
+    rows = np.minimum(np.searchsorted(keys, other_keys), len(keys) - 1)
+    return np.where(keys[rows] == other_keys, rows, -1)
+
+
+def recording_dir(log_path):
+    """
+    Index directory of a recorder log
+    """
+    return os.path.splitext(log_path)[0] + '.frames'
+
+
+def index_recording(log_path, output_dir=None):
+    """
+    Parse a recorder log and write its columns, returns the index directory
+    """
+    output_dir = output_dir or recording_dir(log_path)
+    info, (frame_ids, elapsed), actors, chunks = read_recording(log_path)
+
+    frames, positions = _stack(chunks[POSITION], _POSITION)
+    order = np.lexsort((frames, positions['id']))
+    frames, positions = frames[order], positions[order]
+    actor_column = positions['id'].copy()
+    keys = _keys(actor_column, frames)
+
+    velocity = np.full((len(keys), 3), np.nan, dtype=np.float32)
+    kinematics_frames, kinematics = _stack(chunks[KINEMATICS], _KINEMATICS)
+    rows = _lookup(keys, _keys(kinematics['id'], kinematics_frames))
+    velocity[rows[rows >= 0]] = kinematics['linear'][rows >= 0] * UNITS_TO_METERS
+
+    control = np.full((len(keys), 4), np.nan, dtype=np.float32)
+    control_frames, controls = _stack(chunks[ANIM_VEHICLE], _ANIM_VEHICLE)
+    rows = _lookup(keys, _keys(controls['id'], control_frames))
+    control[rows[rows >= 0]] = np.stack([controls['steer'], controls['throttle'], controls['brake'],
+                                         controls['handbrake'].astype(np.float32)], axis=1)[rows >= 0]
+
+    collision_frames, collision_records = _stack(chunks[COLLISION], _COLLISION)
+    collisions = np.zeros(len(collision_records), dtype=COLLISIONS)
+    collisions['frame'] = collision_frames
+    collisions['actor1'] = collision_records['actor1']
+    collisions['actor2'] = collision_records['actor2']
+
+    starts = np.searchsorted(actor_column, np.array(sorted(actors), dtype=np.uint32), side='left')
+    stops = np.searchsorted(actor_column, np.array(sorted(actors), dtype=np.uint32), side='right')
+    for (actor_id, start, stop) in zip(sorted(actors), starts, stops):
+        actors[actor_id]['rows'] = [int(start), int(stop)]
+
+    columns = {
+        'frame_ids': frame_ids,
+        'elapsed': elapsed,
+        'actor': actor_column,
+        'frame': frames,
+        'location': (positions['location'] * UNITS_TO_METERS).astype(np.float32),
+        'rotation': positions['rotation'].astype(np.float32),
+        'velocity': velocity,
+        'control': control,
+        'collisions': collisions,
+    }
+    index = dict(info, index_version=INDEX_VERSION, source=os.path.basename(log_path),
+                 frames=len(frame_ids), rows=len(keys),
+                 actors={str(actor_id): actors[actor_id] for actor_id in sorted(actors)})
+
+    # Written next to the target and renamed, a reader never sees half an index
+    parent = os.path.dirname(os.path.abspath(output_dir))
+    os.makedirs(parent, exist_ok=True)
+    temp_dir = tempfile.mkdtemp(dir=parent, prefix='.frames-')
+    try:
+        for name, column in columns.items():
+            np.save(os.path.join(temp_dir, name + '.npy'), column)
+        with open(os.path.join(temp_dir, INDEX_FILE), 'w', encoding='utf-8') as fp:
+            json.dump(index, fp)
+        if os.path.isdir(output_dir):
+            shutil.rmtree(output_dir)
+        os.replace(temp_dir, output_dir)
+    except BaseException:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+    return output_dir
+
+
+class RecordingIndex(object):
+
+    """
+    Read only, memory mapped view of an indexed recording.
+
+    Usage:
+    index = RecordingIndex("records/RouteScenario_2.frames")
+    hero = index.find(role_name='hero')[0]
+    times, speeds = index.speed_profile(hero)
+    distance, time, walker = index.closest_approach(hero, 'walker.')
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE), 'r', encoding='utf-8') as fp:
+            self.info = json.load(fp)
+        self.actors = {int(actor_id): actor for actor_id, actor in self.info.pop('actors').items()}
+
+    def __getattr__(self, name):
+        # Columns are mapped on first use
+        if name.startswith('_'):
+            raise AttributeError(name)
+        path = os.path.join(self.__dict__['path'], name + '.npy')
+        if not os.path.isfile(path):
+            raise AttributeError(name)
+        column = np.load(path, mmap_mode='r')
+        setattr(self, name, column)
+        return column
+
+    @property
+    def duration(self):
+        """
+        Simulation seconds covered by the recording
+        """
+        return float(self.elapsed[-1] - self.elapsed[0]) if len(self.elapsed) else 0.0
+
+    def find(self, role_name=None, type_prefix=None):
+        """
+        Ids of the actors with this role name and/or blueprint prefix
+        """
+        return [actor_id for actor_id, actor in sorted(self.actors.items())
+                if (role_name is None or actor['role_name'] == role_name)
+                and (type_prefix is None or actor['type_id'].startswith(type_prefix))]
+
+    def track(self, actor_id):
+        """
+        Columns of one actor, one row per recorded frame
+        """
+        start, stop = self.actors[actor_id]['rows']
+        frames = self.frame[start:stop]
+        return {
+            'frame': frames,
+            'time': self.elapsed[frames],
+            'location': self.location[start:stop],
+            'rotation': self.rotation[start:stop],
+            'velocity': self.velocity[start:stop],
+            'control': self.control[start:stop],
+        }
+
+    def speed_profile(self, actor_id):
+        """
+        (times, speeds in m/s) of an actor, from the recorded velocity, or
+        from its positions when the log has no kinematics for it
+        """
+        track = self.track(actor_id)
+        times = np.asarray(track['time'])
+        speeds = np.linalg.norm(track['velocity'], axis=1)
+        missing = np.isnan(speeds)
+        if missing.any() and len(times) > 1:
+            steps = np.linalg.norm(np.diff(track['location'], axis=0), axis=1)
+            intervals = np.diff(times)
+            derived = np.concatenate([[0.0], np.divide(steps, intervals, out=np.zeros_like(steps, dtype=np.float64),
+                                                       where=intervals > 0)])
+            speeds = np.where(missing, derived, speeds)
+        return times, speeds
+
+    def closest_approach(self, actor_id, type_prefix='walker.', max_distance=None):
+        """
+        (distance, time, other actor id) of the closest approach of an actor
+        to the actors of this blueprint prefix, None if they never coexist
+        """
+        track = self.track(actor_id)
+        frames = np.asarray(track['frame'])
+        location = np.asarray(track['location'])
+        best = None
+        for other_id in self.find(type_prefix=type_prefix):
+            if other_id == actor_id:
+                continue
+            other = self.track(other_id)
+            _, rows, other_rows = np.intersect1d(frames, other['frame'], assume_unique=True, return_indices=True)
+            if not len(rows):
+                continue
+            distances = np.linalg.norm(location[rows] - other['location'][other_rows], axis=1)
+            closest = int(np.argmin(distances))
+            if best is None or distances[closest] < best[0]:
+                best = (float(distances[closest]), float(self.elapsed[frames[rows[closest]]]), other_id)
+        if best is not None and max_distance is not None and best[0] > max_distance:
+            return None
+        return best
+
+    def collisions_of(self, actor_id):
+        """
+        (time, other actor id) of the collisions of an actor
+        """
+        collisions = self.collisions
+        mine = (collisions['actor1'] == actor_id) | (collisions['actor2'] == actor_id)
+        return [(float(self.elapsed[x['frame']]), int(x['actor2'] if x['actor1'] == actor_id else x['actor1']))
+                for x in collisions[mine]]
+
+    def summary(self, role_name='hero'):
+        """
+        Driving metrics of the actor with this role name
+        """
+        summary = {'recording': self.info.get('source'), 'map': self.info.get('map'), 'duration': self.duration}
+        actors = self.find(role_name=role_name)
+        if not actors:
+            return summary
+        actor_id = actors[0]
+        _, speeds = self.speed_profile(actor_id)
+        closest = self.closest_approach(actor_id, 'walker.')
+        summary.update(
+            mean_speed=float(np.mean(speeds)) if len(speeds) else None,
+            max_speed=float(np.max(speeds)) if len(speeds) else None,
+            closest_walker=closest[0] if closest else None,
+            collisions=len(self.collisions_of(actor_id)))
+        return summary
+
+
+def find_indexes(paths):
+    """
+    Index directories found in the given directories and globs
+    """
+    found = []
+    for path in paths:
+        if os.path.isfile(os.path.join(path, INDEX_FILE)):
+            found.append(path)
+            continue
+        pattern = os.path.join(path, '**', '*.frames') if os.path.isdir(path) else path
+        found.extend(x for x in sorted(glob.glob(pattern, recursive=True))
+                     if os.path.isfile(os.path.join(x, INDEX_FILE)))
+    return found
+
+
+def main():
+    """
+    Build or query the recording indexes
+    """
+    parser = argparse.ArgumentParser(description="Columnar index of the CARLA recorder logs")
+    commands = parser.add_subparsers(dest='command')
+    build = commands.add_parser('build', help='Index recorder logs')
+    build.add_argument('logs', nargs='+', help='Recorder logs')
+    build.add_argument('--force', action='store_true', help='Rebuild the indexes that already exist')
+    query = commands.add_parser('query', help='Driving metrics of indexed recordings')
+    query.add_argument('paths', nargs='+', help='Index directories, or directories holding them')
+    query.add_argument('--role', default='hero', help='Role name of the driven vehicle (default: hero)')
+    query.add_argument('--json', action='store_true', help='Print JSON instead of a table')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        failures = 0
+        for log in args.logs:
+            if not args.force and os.path.isdir(recording_dir(log)) and \
+                    os.path.getmtime(recording_dir(log)) >= os.path.getmtime(log):
+                continue
+            try:
+                print("Indexed {}".format(index_recording(log)))
+            except (OSError, RecorderFormatError) as e:
+                print("Cannot index {}: {}".format(log, e))
+                failures += 1
+        return 1 if failures else 0
+
+    if args.command == 'query':
+        summaries = [RecordingIndex(path).summary(args.role) for path in find_indexes(args.paths)]
+        if args.json:
+            print(json.dumps(summaries, indent=2))
+            return 0
+        if not summaries:
+            print("No indexed recordings")
+            return 0
+        print("{:<36}{:>10}{:>12}{:>12}{:>16}{:>12}".format(
+            "recording", "duration", "mean speed", "max speed", "closest walker", "collisions"))
+        for summary in summaries:
+            print("{:<36}{:>9.1f}s{:>10.1f}m/s{:>10.1f}m/s{:>16}{:>12}".format(
+                summary['recording'], summary['duration'], summary.get('mean_speed') or 0.0,
+                summary.get('max_speed') or 0.0,
+                '-' if summary.get('closest_walker') is None else '{:.1f}m'.format(summary['closest_walker']),
+                summary.get('collisions', '-')))
+        return 0
+
+    parser.print_help()
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+
+"""
+Append-only store of the scenario results.
+
+Every analyzed run is one row of an SQLite database (<outputDir>/results.sqlite
+by default), with one row per criterion. The columns the sessions are
+searched by (route, level, scene, town, agent, driver, date) are indexed,
+so the aggregates over months of sessions come back in milliseconds
+instead of globbing the feedback files.
+
+The runner appends through a background thread, the scenario never waits
+on the disk. The database is in WAL mode, it can be queried while runs
+are appended, and several runners can share it.
+
+Run as a script to query it:
+
+    python3 results_store.py feedback/results.sqlite --level hard --scene 2 --town Town04 --group-by driver
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import pathlib
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+RESULTS_FILE = 'results.sqlite'
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started TEXT NOT NULL,
+    date TEXT NOT NULL,
+    scenario TEXT,
+    route TEXT,
+    level TEXT,
+    scene TEXT,
+    town TEXT,
+    agent TEXT,
+    driver TEXT,
+    weather TEXT,
+    passed INTEGER NOT NULL,
+    timed_out INTEGER NOT NULL DEFAULT 0,
+    failed_criteria INTEGER NOT NULL DEFAULT 0,
+    duration_system REAL,
+    duration_game REAL
+);
+CREATE TABLE IF NOT EXISTS criteria (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    name TEXT NOT NULL,
+    status TEXT,
+    actual,
+    expected,
+    optional INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS runs_profile ON runs (level, scene, town, date);
+CREATE INDEX IF NOT EXISTS runs_route ON runs (route, date);
+CREATE INDEX IF NOT EXISTS runs_agent ON runs (agent, date);
+CREATE INDEX IF NOT EXISTS runs_driver ON runs (driver, date);
+CREATE INDEX IF NOT EXISTS runs_date ON runs (date);
+CREATE INDEX IF NOT EXISTS criteria_run ON criteria (run_id);
+CREATE INDEX IF NOT EXISTS criteria_name ON criteria (name, status);
+"""
+
+RUN_COLUMNS = ('started', 'date', 'scenario', 'route', 'level', 'scene', 'town', 'agent', 'driver', 'weather',
+               'passed', 'timed_out', 'failed_criteria', 'duration_system', 'duration_game')
+
+# Columns the query CLI can filter and group by
+FILTERS = ('route', 'level', 'scene', 'town', 'agent', 'driver', 'weather', 'scenario')
+
+
+def connect(path):
+    """
+    Open (and create if needed) a results database
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30.0)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    if connection.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+        connection.executescript(SCHEMA)
+        connection.execute('PRAGMA user_version={}'.format(SCHEMA_VERSION))
+        connection.commit()
+    return connection
+
+
+def _scalar(value):
+    """
+    SQLite friendly criterion value
+    """
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    return str(value)
+
+
+def route_id(scenario_name):
+    """
+    Route id of a route scenario name ("RouteScenario_2" -> "2")
+    """
+    match = re.match(r'RouteScenario_(.+)$', scenario_name or '')
+    return match.group(1) if match else None
+
+
+def scenario_record(manager, config, args, passed):
+    """
+    Record of an analyzed scenario, from the manager that ran it
+    """
+    scenario = manager.scenario
+    criteria = []
+    for criterion in scenario.get_criteria() if scenario else []:
+        criteria.append({
+            'name': criterion.name,
+            'status': getattr(criterion, 'test_status', None),
+            'actual': _scalar(getattr(criterion, 'actual_value', None)),
+            'expected': _scalar(getattr(criterion, 'expected_value_success', None)),
+            'optional': bool(getattr(criterion, 'optional', False)),
+        })
+    timeout_node = getattr(scenario, 'timeout_node', None)
+    now = datetime.now()
+    return {
+        'started': now.isoformat(timespec='seconds'),
+        'date': now.strftime('%Y-%m-%d'),
+        'scenario': config.name,
+        'route': route_id(config.name),
+        'level': args.level,
+        'scene': args.scene,
+        'town': config.town,
+        'agent': os.path.basename(args.agent) if args.agent else None,
+        'driver': args.driver or None,
+        'weather': args.weather,
+        'passed': bool(passed),
+        'timed_out': bool(getattr(timeout_node, 'timeout', False)),
+        'failed_criteria': sum(1 for x in criteria if x['status'] == 'FAILURE' and not x['optional']),
+        'duration_system': getattr(manager, 'scenario_duration_system', None),
+        'duration_game': getattr(manager, 'scenario_duration_game', None),
+        'criteria': criteria,
+    }
+
+
+def insert(connection, record):
+    """
+    Insert one record (runs row and criteria rows) in the current transaction
+    """
+    cursor = connection.execute(
+        'INSERT INTO runs ({}) VALUES ({})'.format(', '.join(RUN_COLUMNS), ', '.join('?' * len(RUN_COLUMNS))),
+        [record.get(x) for x in RUN_COLUMNS])
+    run_id = cursor.lastrowid
+    connection.executemany(
+        'INSERT INTO criteria (run_id, name, status, actual, expected, optional) VALUES (?, ?, ?, ?, ?, ?)',
+        [(run_id, x['name'], x['status'], x['actual'], x['expected'], x['optional'])
+         for x in record.get('criteria', [])])
+    return run_id
+
+
+class ResultsStore(object):
+
+    """
+    Appends records from a background thread.
+
+    Usage:
+    store = ResultsStore("feedback/results.sqlite")
+    store.append(scenario_record(manager, config, args, passed))
+    ...
+    store.close()   # waits for the pending records
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def append(self, record):
+        """
+        Queue a record, returns immediately
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._write, name='results-store', daemon=True)
+                self._thread.start()
+        self._queue.put(record)
+
+    def _write(self):
+        try:
+            connection = connect(self.path)
+        except sqlite3.Error as e:
+            print("Cannot open the results store {}: {}".format(self.path, e))
+            connection = None
+
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            # Whatever else is waiting goes in the same transaction
+            records = [record]
+            while True:
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    self._queue.put(None)
+                    break
+                records.append(record)
+            if connection is None:
+                continue
+            try:
+                with connection:
+                    for record in records:
+                        insert(connection, record)
+            except sqlite3.Error as e:
+                print("Cannot store {} results: {}".format(len(records), e))
+        if connection is not None:
+            connection.close()
+
+    def close(self, timeout=10.0):
+        """
+        Write the pending records and stop the writer thread
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+
+def query(connection, filters=None, since=None, until=None, group_by=()):
+    """
+    Aggregates of the matching runs, one row per group
+    """
+    where = []
+    params = []
+    for column, value in (filters or {}).items():
+        if value is not None:
+            where.append('{} = ?'.format(column))
+            params.append(value)
+    if since:
+        where.append('date >= ?')
+        params.append(since)
+    if until:
+        where.append('date <= ?')
+        params.append(until)
+
+    columns = list(group_by)
+    sql = ('SELECT {}COUNT(*), SUM(passed), SUM(timed_out), AVG(failed_criteria), AVG(duration_system), '
+           'AVG(duration_game), MIN(date), MAX(date) FROM runs').format(
+               ''.join('{}, '.format(x) for x in columns))
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    if columns:
+        sql += ' GROUP BY {} ORDER BY {}'.format(', '.join(columns), ', '.join(columns))
+
+    rows = []
+    for row in connection.execute(sql, params):
+        group = dict(zip(columns, row[:len(columns)]))
+        runs, passed, timed_out, failed, duration_system, duration_game, first, last = row[len(columns):]
+        if not runs:
+            continue
+        group.update(runs=runs, pass_rate=(passed or 0) / runs, timeouts=timed_out or 0,
+                     failed_criteria=failed, duration_system=duration_system, duration_game=duration_game,
+                     first=first, last=last)
+        rows.append(group)
+    return rows, where, params
+
+
+def criteria_failures(connection, where, params, limit=10):
+    """
+    Criteria failing most often among the matching runs
+    """
+    sql = ('SELECT criteria.name, COUNT(*), SUM(criteria.status = \'FAILURE\') FROM criteria '
+           'JOIN runs ON runs.id = criteria.run_id')
+    if where:
+        sql += ' WHERE ' + ' AND '.join('runs.' + x for x in where)
+    sql += ' GROUP BY criteria.name ORDER BY 3 DESC LIMIT ?'
+    return [{'criterion': name, 'runs': runs, 'failures': failures or 0}
+            for name, runs, failures in connection.execute(sql, params + [limit])]
+
+
+def main():
+    """
+    Query the results store
+    """
+    parser = argparse.ArgumentParser(description="Aggregates of the stored scenario results")
+    parser.add_argument('database', nargs='?', default=os.path.join('feedback', RESULTS_FILE),
+                        help='Results database (default: feedback/{})'.format(RESULTS_FILE))
+    for column in FILTERS:
+        parser.add_argument('--' + column, help='Only the runs with this {}'.format(column))
+    parser.add_argument('--since', help='First date (YYYY-MM-DD)')
+    parser.add_argument('--until', help='Last date (YYYY-MM-DD)')
+    parser.add_argument('--group-by', default='', help='Comma separated columns, e.g. level,scene')
+    parser.add_argument('--criteria', action='store_true', help='Also list the criteria failing most often')
+    parser.add_argument('--json', action='store_true', help='Print JSON instead of a table')
+    args = parser.parse_args()
+
+    group_by = [x.strip() for x in args.group_by.split(',') if x.strip()]
+    for column in group_by:
+        if column not in FILTERS + ('date',):
+            parser.error("cannot group by {}".format(column))
+    if not os.path.isfile(args.database):
+        print("No results store at {}".format(args.database))
+        return 1
+
+    start = time.perf_counter()
+    connection = sqlite3.connect(pathlib.Path(args.database).resolve().as_uri() + '?mode=ro', uri=True, timeout=30.0)
+    filters = {column: getattr(args, column) for column in FILTERS}
+    rows, where, params = query(connection, filters, args.since, args.until, group_by)
+    failures = criteria_failures(connection, where, params) if args.criteria else []
+    elapsed = time.perf_counter() - start
+    connection.close()
+
+    if args.json:
+        print(json.dumps({'groups': rows, 'criteria': failures, 'query_ms': elapsed * 1000.0}, indent=2))
+        return 0
+
+    if not rows:
+        print("No matching runs")
+        return 0
+    header = group_by + ['runs', 'passed', 'timeouts', 'failed crit.', 'duration', 'game time', 'dates']
+    print("  ".join("{:<12}".format(x) for x in header))
+    for row in rows:
+        values = [str(row[x]) for x in group_by] + [
+            str(row['runs']), "{:.1%}".format(row['pass_rate']), str(row['timeouts']),
+            "{:.2f}".format(row['failed_criteria'] or 0.0),
+            "{:.1f}s".format(row['duration_system'] or 0.0), "{:.1f}s".format(row['duration_game'] or 0.0),
+            "{} - {}".format(row['first'], row['last'])]
+        print("  ".join("{:<12}".format(x) for x in values))
+    if failures:
+        print("\nMost failed criteria:")
+        for failure in failures:
+            print("  {:<32}{:>6} / {:<6}".format(failure['criterion'], failure['failures'], failure['runs']))
+    print("\n({:.1f} ms)".format(elapsed * 1000.0))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""
+On-disk cache of the parsed route configurations.
+
+Every route launch parses the same routes XML and scenario annotations
+JSON through RouteParser, and RouteScenario scans the route for the
+trigger points of its scenarios. All of it only depends on the content
+of these files (and on the route, for the scan). The results are pickled
+under .cache/routes, keyed by a hash of the file contents and of the
+other arguments, and a later call loads them back in one read.
+
+carla types are made picklable with copyreg, as the client library does
+not support pickle itself.
+"""
+
+from __future__ import print_function
+
+import copyreg
+import functools
+import hashlib
+import os
+import pickle
+
+import carla
+
+from runner_cache import cache_path, write_atomic
+
+CACHE_VERSION = 1
+
+# RouteParser methods whose results only depend on their arguments
+CACHED_METHODS = ('parse_routes_file', 'parse_annotations_file', 'scan_route_for_scenarios')
+
+WEATHER_FIELDS = ('cloudiness', 'precipitation', 'precipitation_deposits', 'wind_intensity',
+                  'sun_azimuth_angle', 'sun_altitude_angle', 'fog_density', 'fog_distance', 'wetness',
+                  'fog_falloff', 'scattering_intensity', 'mie_scattering_scale', 'rayleigh_scattering_scale')
+
+
+def _make_weather(fields):
+    weather = carla.WeatherParameters()
+    for key, value in fields.items():
+        setattr(weather, key, value)
+    return weather
+
+
+def register_carla_types():
+    """
+    Teach pickle to save and rebuild the carla value types found in configurations
+    """
+    copyreg.pickle(carla.Location, lambda x: (carla.Location, (x.x, x.y, x.z)))
+    copyreg.pickle(carla.Vector3D, lambda x: (carla.Vector3D, (x.x, x.y, x.z)))
+    copyreg.pickle(carla.Rotation, lambda x: (carla.Rotation, (x.pitch, x.yaw, x.roll)))
+    copyreg.pickle(carla.Transform, lambda x: (carla.Transform, (x.location, x.rotation)))
+    copyreg.pickle(carla.WeatherParameters,
+                   lambda x: (_make_weather, ({key: getattr(x, key) for key in WEATHER_FIELDS if hasattr(x, key)},)))
+
+
+register_carla_types()
+
+_DIGESTS = {}
+
+
+def file_digest(path):
+    """
+    Hash of a file content, recomputed only when its mtime or size changes
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    digest = _DIGESTS.get(key)
+    if digest is None:
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as fp:
+            for chunk in iter(lambda: fp.read(1 << 20), b''):
+                sha1.update(chunk)
+        digest = _DIGESTS[key] = sha1.hexdigest()
+    return digest
+
+
+def _normalize(value):
+    """
+    File paths are replaced by their content hash, so renaming or touching a file does not matter
+    """
+    if isinstance(value, str) and os.path.isfile(value):
+        return ('file', file_digest(value))
+    return value
+
+
+class RouteCache(object):
+
+    """
+    Pickled results of the RouteParser methods.
+
+    Usage:
+    cache = RouteCache()
+    cache.install(RouteParser)
+    RouteParser.parse_routes_file(routes, scenario_file)   # parsed once, then loaded
+    """
+
+    def __init__(self, cache_dir=None):
+        self._cache_dir = cache_dir
+        # key -> pickled result, to skip the disk within a process
+        self._memory = {}
+
+    def _path(self, name, key):
+        file_name = '{}-{}.pickle'.format(name, key)
+        if self._cache_dir:
+            return os.path.join(self._cache_dir, file_name)
+        return cache_path('routes', file_name)
+
+    def _key(self, name, args, kwargs):
+        arguments = (CACHE_VERSION, name, [_normalize(x) for x in args],
+                     sorted((key, _normalize(value)) for key, value in kwargs.items()))
+        return hashlib.sha1(pickle.dumps(arguments, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+
+    def call(self, name, function, *args, **kwargs):
+        """
+        Result of function(*args, **kwargs), from the cache if possible.
+        A fresh copy is returned every time, callers may modify it.
+        """
+        try:
+            key = self._key(name, args, kwargs)
+        except (pickle.PicklingError, TypeError, AttributeError, OSError) as e:
+            print("Route cache disabled for {}: {}".format(name, e))
+            return function(*args, **kwargs)
+
+        data = self._memory.get(key)
+        path = self._path(name, key)
+        if data is None and os.path.isfile(path):
+            try:
+                with open(path, 'rb') as fp:
+                    data = fp.read()
+                result = pickle.loads(data)
+                self._memory[key] = data
+                return result
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+                data = None
+        if data is not None:
+            return pickle.loads(data)
+
+        result = function(*args, **kwargs)
+        try:
+            data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            print("Cannot cache the result of {}: {}".format(name, e))
+            return result
+        self._memory[key] = data
+        try:
+            write_atomic(path, data)
+        except OSError as e:
+            print("Cannot write the route cache: {}".format(e))
+        return pickle.loads(data)
+
+    def install(self, route_parser):
+        """
+        Replace the static methods of the RouteParser class by their cached versions
+        """
+        for name in CACHED_METHODS:
+            function = getattr(route_parser, name, None)
+            if function is None or hasattr(function, '_route_cache'):
+                continue
+
+            def cached(*args, _name=name, _function=function, **kwargs):
+                return self.call(_name, _function, *args, **kwargs)
+
+            cached = functools.wraps(function)(cached)
+            cached._route_cache = self      # pylint: disable=protected-access
+            setattr(route_parser, name, staticmethod(cached))
+
+
+_ROUTE_CACHE = RouteCache()
+
+
+def install_route_cache(route_parser):
+    """
+    Cache the RouteParser results of this process on disk
+    """
+    _ROUTE_CACHE.install(route_parser)
@@ -0,0 +1,48 @@
+"""
+Location and helpers of the on-disk caches of the scenario runner.
+
+Everything lives under $SCENARIO_RUNNER_ROOT/.cache (or $DRIVESIM_CACHE_DIR)
+and is safe to delete at any time.
+"""
+
+import contextlib
+import os
+import tempfile
+
+
+def cache_path(*parts):
+    """
+    Path inside the cache directory, creating the parent folders
+    """
+    root = os.getenv('DRIVESIM_CACHE_DIR',
+                     os.path.join(os.getenv('SCENARIO_RUNNER_ROOT', "./"), '.cache'))
+    path = os.path.join(root, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+@contextlib.contextmanager
+def open_atomic(path, mode='wb', **kwargs):
+    """
+    File object writing to a temporary file that replaces path once
+    closed without error, so concurrent readers never see a partially
+    written file
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, mode, **kwargs) as fp:
+            yield fp
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def write_atomic(path, data):
+    """
+    Write bytes to path through a temporary file and a rename
+    """
+    with open_atomic(path) as fp:
+        fp.write(data)
@@ -0,0 +1,565 @@
+#!/usr/bin/env python
+
+"""
+Long-lived scenario runner service.
+
+Starting scenario_runner.py for every session means re-importing carla
+and srunner, reconnecting the client and re-creating the ScenarioManager.
+The daemon does all of that once and then runs the submitted jobs
+(level / scene / town / agent / weather) on the already connected runner.
+
+Jobs are submitted as JSON lines over a local TCP socket:
+
+    {"op": "submit", "level": "Hard", "scene": "Scene 1", "town": "Town 04"}
+    {"op": "status", "job_id": "..."}
+    {"op": "cancel", "job_id": "..."}
+    {"op": "preload", "town": "Town 04"}
+    {"op": "ping"}
+    {"op": "shutdown"}
+
+Every request gets exactly one JSON line back, with an "ok" field.
+
+A preload loads a town while the driver is still choosing in the
+launcher, so the job that follows only resets it in place. The latest
+preload replaces the pending one, "town": null drops it, and a queued
+job always goes first. A map load that already started cannot be
+interrupted, it completes before the next job. The town of the last job
+is preloaded when the daemon starts.
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import json
+import queue
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+import traceback
+import uuid
+
+import difficulty_profiles
+from runner_cache import cache_path, write_atomic
+
+DEFAULT_LISTEN_HOST = '127.0.0.1'
+DEFAULT_LISTEN_PORT = 2100
+
+
+def town_name(town):
+    """
+    Map name of a launcher town ("Town 04" or its route id 2 -> "Town04")
+    """
+    if town in difficulty_profiles.TOWN_NAMES.values():
+        return town
+    return difficulty_profiles.TOWN_NAMES[difficulty_profiles.town_id(town)]
+
+
+def load_last_town():
+    """
+    Town of the last job run by a daemon on this machine, None if unknown
+    """
+    try:
+        with open(cache_path('daemon', 'last_town.json'), 'r', encoding='utf-8') as fp:
+            return json.load(fp).get('town')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def save_last_town(town):
+    """
+    Remember the town of the last job, for the next daemon start
+    """
+    try:
+        write_atomic(cache_path('daemon', 'last_town.json'), json.dumps({'town': town}).encode('utf-8'))
+    except OSError as e:
+        print("Cannot save the last town: {}".format(e))
+
+
+class RunnerJob(object):
+
+    """
+    A single launch request and its state
+    """
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, level, scene, town, agent, weather, profile_set='launcher'):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.level = level
+        self.scene = scene
+        self.town = town
+        # Only known agents, a request must not be able to run any Python file
+        self.agent = difficulty_profiles.agent_path(agent) if agent else None
+        self.weather = weather
+        self.profile_set = profile_set
+        self.argv = difficulty_profiles.build_runner_arguments(level, scene, town, self.agent, weather, profile_set)
+        self.arguments = None
+
+        self.state = self.QUEUED
+        # Set by a cancel, the job is only cancelled once the runner returned
+        self.cancel_event = threading.Event()
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    def to_dict(self):
+        """
+        JSON friendly representation of the job
+        """
+        return {
+            'job_id': self.job_id,
+            'level': self.level,
+            'scene': self.scene,
+            'town': self.town,
+            'agent': self.agent,
+            'weather': self.weather,
+            'profile_set': self.profile_set,
+            'state': self.state,
+            'cancel_requested': self.cancel_event.is_set(),
+            'result': self.result,
+            'error': self.error,
+            'submitted': self.submitted,
+            'started': self.started,
+            'finished': self.finished,
+        }
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    """
+    One JSON request per line, one JSON response per line
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                response = self.server.daemon.handle_request(json.loads(line.decode('utf-8')))
+            except Exception as e:      # pylint: disable=broad-except
+                response = {'ok': False, 'error': str(e)}
+            self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class RunnerDaemon(object):
+
+    """
+    Keeps one ScenarioRunner (and its CARLA client) alive and feeds it jobs.
+
+    Usage:
+    daemon = RunnerDaemon(base_args)
+    daemon.serve_forever()
+
+    The runner module and the runner factory can be injected, so the
+    daemon can be exercised against a stand-in carla module.
+    """
+
+    history_size = 100  # finished jobs kept for status queries
+
+    def __init__(self, base_argv, listen_host=DEFAULT_LISTEN_HOST, listen_port=DEFAULT_LISTEN_PORT,
+                 max_queued=8, runner_module=None, runner_factory=None, preload_last=True):
+        """
+        base_argv are the scenario_runner.py arguments common to every job
+        (CARLA host, port, timeout, traffic manager port...)
+        """
+        if runner_module is None:
+            import scenario_runner as runner_module   # pylint: disable=import-outside-toplevel
+        self._runner_module = runner_module
+        self._runner_factory = runner_factory or runner_module.ScenarioRunner
+        self._parser = runner_module.build_parser()
+        self._base_argv = list(base_argv)
+
+        self._jobs = collections.OrderedDict()
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._lock = threading.Lock()
+        self._current = None
+        self._runner_job = None     # job the runner was reconfigured for
+        self._stopped = threading.Event()
+        # Latest requested preload, outside of the job queue so that it never takes a job slot
+        self._preload_town = None
+        self._preloading = None
+        self._wakeup = threading.Event()
+
+        self.runner = self._runner_factory(self._parse(self._base_argv))
+
+        self._server = _Server((listen_host, listen_port), _RequestHandler)
+        self._server.daemon = self
+
+        if preload_last and load_last_town():
+            self.preload(load_last_town())
+
+    @property
+    def address(self):
+        """
+        (host, port) the daemon is listening on
+        """
+        return self._server.server_address
+
+    def _parse(self, argv):
+        try:
+            arguments = self._parser.parse_args(argv)
+        except SystemExit:
+            # argparse exits on invalid arguments, which must not take the daemon down
+            raise ValueError("invalid runner arguments: {}".format(' '.join(argv)))
+        return self._runner_module.apply_mode_defaults(arguments)
+
+    def submit(self, level, scene, town, agent=difficulty_profiles.DEFAULT_AGENT,
+               weather=difficulty_profiles.DEFAULT_WEATHER, profile_set='launcher'):
+        """
+        Queue a new job. Raises queue.Full if too many jobs are waiting
+        """
+        job = RunnerJob(level, scene, town, agent, weather, profile_set)
+        job.arguments = self._parse(self._base_argv + job.argv)
+        with self._lock:
+            self._queue.put_nowait(job)
+            self._jobs[job.job_id] = job
+            self._trim_history()
+            # The job loads its own town, a pending preload is obsolete
+            self._preload_town = None
+        self._wakeup.set()
+        return job
+
+    def preload(self, town):
+        """
+        Load this town as soon as no job is waiting, replacing the pending
+        preload. None drops the pending preload.
+        """
+        town = town_name(town) if town not in (None, '') else None
+        with self._lock:
+            # Already loading it, a second request would only find it loaded
+            self._preload_town = town if town != self._preloading else None
+        if town is not None:
+            self._wakeup.set()
+        return self.preload_status()
+
+    def preload_status(self):
+        """
+        Pending, loading and loaded towns
+        """
+        with self._lock:
+            return {'pending': self._preload_town, 'loading': self._preloading,
+                    'loaded': self.runner.loaded_town}
+
+    def _run_preload(self):
+        with self._lock:
+            town, self._preload_town = self._preload_town, None
+            if town is None:
+                return
+            self._preloading = town
+        try:
+            start = time.time()
+            if self.runner.preload_town(town):
+                print("Preloaded {} in {:.1f}s".format(town, time.time() - start))
+        except Exception as e:      # pylint: disable=broad-except
+            print("Cannot preload {}: {}".format(town, e))
+        finally:
+            with self._lock:
+                self._preloading = None
+
+    def status(self, job_id=None):
+        """
+        State of one job, or of the running one if no id is given
+        """
+        with self._lock:
+            job = self._jobs.get(job_id) if job_id else self._current
+        return job.to_dict() if job else None
+
+    def cancel(self, job_id):
+        """
+        Drop a queued job or stop the running one. A running job stays
+        running until the runner returned, and is cancelled then.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            if job.state == RunnerJob.QUEUED:
+                job.state = RunnerJob.CANCELLED
+                job.finished = time.time()
+                return True
+            if job.state != RunnerJob.RUNNING:
+                return False
+            job.cancel_event.set()
+            # Before reconfigure() the runner picks the event up with the job
+            running = self._runner_job is job
+        if running:
+            # Outside of the lock: it waits for the scenario to start, the other
+            # requests must not. The event keeps it from cancelling a later job.
+            self.runner.cancel(job.cancel_event)
+        return True
+
+    def _trim_history(self):
+        finished = [job_id for job_id, job in self._jobs.items()
+                    if job.state not in (RunnerJob.QUEUED, RunnerJob.RUNNING)]
+        for job_id in finished[:max(0, len(finished) - self.history_size)]:
+            del self._jobs[job_id]
+
+    def handle_request(self, request):
+        """
+        Dispatch a decoded protocol request and build its response
+        """
+        op = request.get('op')
+        if op == 'ping':
+            return {'ok': True, 'running': self.status()}
+        if op == 'submit':
+            try:
+                job = self.submit(request['level'], request['scene'], request['town'],
+                                  request.get('agent', difficulty_profiles.DEFAULT_AGENT),
+                                  request.get('weather', difficulty_profiles.DEFAULT_WEATHER),
+                                  request.get('profile_set', 'launcher'))
+            except queue.Full:
+                return {'ok': False, 'error': 'job queue is full'}
+            except (KeyError, ValueError) as e:
+                return {'ok': False, 'error': 'invalid job: {}'.format(e)}
+            return {'ok': True, 'job': job.to_dict()}
+        if op == 'status':
+            job = self.status(request.get('job_id'))
+            return {'ok': job is not None or not request.get('job_id'), 'job': job}
+        if op == 'cancel':
+            return {'ok': self.cancel(request.get('job_id'))}
+        if op == 'preload':
+            try:
+                return {'ok': True, 'preload': self.preload(request.get('town'))}
+            except ValueError as e:
+                return {'ok': False, 'error': str(e)}
+        if op == 'shutdown':
+            self.stop()
+            return {'ok': True}
+        return {'ok': False, 'error': 'unknown op: {}'.format(op)}
+
+    def _run_job(self, job):
+        with self._lock:
+            if job.state == RunnerJob.CANCELLED:
+                return
+            job.state = RunnerJob.RUNNING
+            job.started = time.time()
+            self._current = job
+
+        print("Running job {}: {}".format(job.job_id, ' '.join(job.argv)))
+        try:
+            self.runner.reconfigure(job.arguments, job.cancel_event)
+            with self._lock:
+                self._runner_job = job
+            result = self.runner.run()
+        except Exception as e:      # pylint: disable=broad-except
+            traceback.print_exc()
+            result = False
+            job.error = str(e)
+
+        with self._lock:
+            self._runner_job = None
+            job.result = bool(result)
+            if job.cancel_event.is_set():
+                job.state = RunnerJob.CANCELLED
+            else:
+                job.state = RunnerJob.DONE if job.error is None else RunnerJob.FAILED
+            job.finished = time.time()
+            self._current = None
+        save_last_town(town_name(job.town))
+
+    def serve_forever(self, poll_interval=0.5):
+        """
+        Accept requests in the background and run jobs on the calling thread.
+        The runner stays on the calling (main) thread as it installs signal handlers.
+        """
+        server_thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        server_thread.start()
+        print("Runner daemon listening on {}:{}".format(*self.address))
+        try:
+            while not self._stopped.is_set():
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    # Preloads only run when no job is waiting
+                    if self._preload_town is not None:
+                        self._run_preload()
+                    else:
+                        self._wakeup.wait(poll_interval)
+                        self._wakeup.clear()
+                    continue
+                self._run_job(job)
+                if getattr(self.runner, '_shutdown_requested', False):
+                    break
+        finally:
+            self._server.shutdown()
+            self._server.server_close()
+            self.runner.destroy()
+
+    def stop(self):
+        """
+        Stop after the running job (if any)
+        """
+        self._stopped.set()
+        self._wakeup.set()
+
+
+class RunnerClient(object):
+
+    """
+    Minimal client of the runner daemon, used by the launchers
+    """
+
+    def __init__(self, host=DEFAULT_LISTEN_HOST, port=DEFAULT_LISTEN_PORT, timeout=2.0):
+        self._address = (host, port)
+        self._timeout = timeout
+
+    def request(self, op, **kwargs):
+        """
+        Send one request and return the decoded response
+        """
+        kwargs['op'] = op
+        with socket.create_connection(self._address, timeout=self._timeout) as sock:
+            sock.sendall((json.dumps(kwargs) + '\n').encode('utf-8'))
+            with sock.makefile('rb') as stream:
+                line = stream.readline()
+        if not line:
+            raise ConnectionError("Runner daemon closed the connection")
+        return json.loads(line.decode('utf-8'))
+
+    def is_alive(self):
+        """
+        True if a daemon answers on the configured address
+        """
+        try:
+            return self.request('ping').get('ok', False)
+        except OSError:
+            return False
+
+    def submit(self, level, scene, town, **kwargs):
+        return self.request('submit', level=level, scene=scene, town=town, **kwargs)
+
+    def status(self, job_id=None):
+        return self.request('status', job_id=job_id)
+
+    def cancel(self, job_id):
+        return self.request('cancel', job_id=job_id)
+
+    def preload(self, town):
+        return self.request('preload', town=town)
+
+
+class TownPreloader(object):
+
+    """
+    Sends the launcher's preloads from a background thread, so a missing
+    daemon never blocks the UI. Only the latest town is sent.
+
+    Usage:
+    preloader = TownPreloader(RunnerClient())
+    preloader.request("Town 04")    # hovered or selected
+    preloader.request(None)         # choice abandoned
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._condition = threading.Condition()
+        self._pending = False
+        self._town = None
+        self.available = False
+        threading.Thread(target=self._send, name='town-preloader', daemon=True).start()
+
+    def request(self, town):
+        """
+        Preload this town (None drops the pending preload), returns immediately
+        """
+        with self._condition:
+            self._town = town
+            self._pending = True
+            self._condition.notify()
+
+    def _send(self):
+        self.available = self._client.is_alive()
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                town, self._pending = self._town, False
+            try:
+                self.available = self._client.preload(town).get('ok', False)
+            except (OSError, ValueError):
+                self.available = False
+
+
+def submit_and_wait(client, level, scene, town, poll_interval=1.0):
+    """
+    Run one job on the daemon and wait for it, cancelling it on SIGTERM / SIGINT.
+    Returns the process exit status.
+    """
+    response = client.submit(level, scene, town)
+    if not response.get('ok'):
+        print("Job refused: {}".format(response.get('error')))
+        return 1
+    job_id = response['job']['job_id']
+    print("Job {} submitted".format(job_id))
+
+    def cancel(signum, _):
+        client.cancel(job_id)
+        raise SystemExit(128 + signum)
+
+    signal.signal(signal.SIGTERM, cancel)
+    signal.signal(signal.SIGINT, cancel)
+    state = None
+    while True:
+        job = client.status(job_id).get('job') or {}
+        if job.get('state') != state:
+            state = job.get('state')
+            print("Job {} {}".format(job_id, state))
+        if state not in (RunnerJob.QUEUED, RunnerJob.RUNNING):
+            return 0 if state == RunnerJob.DONE and job.get('result') else 1
+        time.sleep(poll_interval)
+
+
+def main():
+    """
+    Start the daemon
+    """
+    parser = argparse.ArgumentParser(description="Persistent CARLA scenario runner")
+    parser.add_argument('--host', default='127.0.0.1', help='IP of the CARLA server (default: localhost)')
+    parser.add_argument('--port', default='2000', help='TCP port of the CARLA server (default: 2000)')
+    parser.add_argument('--timeout', default='10.0', help='CARLA client timeout in seconds')
+    parser.add_argument('--trafficManagerPort', default='8000', help='Port to use for the TrafficManager')
+    parser.add_argument('--listen', default=DEFAULT_LISTEN_HOST,
+                        help='Address the daemon listens on (default: 127.0.0.1)')
+    parser.add_argument('--listenPort', default=DEFAULT_LISTEN_PORT, type=int,
+                        help='Port the daemon listens on (default: {})'.format(DEFAULT_LISTEN_PORT))
+    parser.add_argument('--maxQueued', default=8, type=int, help='Maximum number of waiting jobs')
+    parser.add_argument('--noPreloadLast', action='store_true',
+                        help='Do not preload the town of the last job at startup')
+    parser.add_argument('--submit', nargs=3, metavar=('LEVEL', 'SCENE', 'TOWN'),
+                        help='Run one job on the running daemon and wait for it, instead of starting a daemon')
+    args = parser.parse_args()
+
+    if args.submit:
+        return submit_and_wait(RunnerClient(args.listen, args.listenPort), *args.submit)
+
+    base_argv = ['--host', args.host, '--port', args.port, '--timeout', args.timeout,
+                 '--trafficManagerPort', args.trafficManagerPort]
+    daemon = RunnerDaemon(base_argv, args.listen, args.listenPort, args.maxQueued,
+                          preload_last=not args.noPreloadLast)
+    try:
+        daemon.serve_forever()
+    except (KeyboardInterrupt, RuntimeError):
+        # The runner turns SIGINT / SIGTERM into a RuntimeError
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
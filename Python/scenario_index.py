@@ -0,0 +1,116 @@
+"""
+Index of the scenario classes.
+
+Looking a scenario class up used to import every module of
+srunner/scenarios until one of them defined it. The index maps class
+names to module files by scanning the sources with the ast module (no
+import), is kept on disk and rescans only the files whose mtime or size
+changed. A lookup then imports exactly one module.
+"""
+
+from __future__ import print_function
+
+import ast
+import importlib
+import json
+import os
+import sys
+
+from runner_cache import cache_path, write_atomic
+
+INDEX_VERSION = 1
+
+
+def scan_classes(path):
+    """
+    Names of the classes defined at the top level of a python file
+    """
+    with open(path, 'rb') as fp:
+        tree = ast.parse(fp.read(), filename=path)
+    return [node.name for node in tree.body if isinstance(node, ast.ClassDef)]
+
+
+def import_file(path):
+    """
+    Import a module given by its file path, the way the scenario runner always did
+    (module name = file name, its folder temporarily added to sys.path)
+    """
+    module_name = os.path.basename(path).split('.')[0]
+    sys.path.insert(0, os.path.dirname(path))
+    try:
+        return importlib.import_module(module_name)
+    finally:
+        sys.path.pop(0)
+
+
+class ScenarioIndex(object):
+
+    """
+    Class name -> scenario module file.
+
+    Usage:
+    index = ScenarioIndex(scenario_files)
+    scenario_class = index.load_class("FollowLeadingVehicle")
+    """
+
+    def __init__(self, files, index_file=None):
+        self._files = [os.path.abspath(x) for x in files if x]
+        self._index_file = index_file or cache_path('scenarios', 'index.json')
+        self._entries = self._load()
+        self.refresh()
+
+    def _load(self):
+        try:
+            with open(self._index_file, 'r', encoding='utf-8') as fp:
+                index = json.load(fp)
+            if index.get('version') == INDEX_VERSION:
+                return index['files']
+        except (OSError, ValueError, KeyError):
+            pass
+        return {}
+
+    def refresh(self):
+        """
+        Rescan the files that changed since the index was written
+        """
+        changed = False
+        entries = {}
+        for path in self._files:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entry = self._entries.get(path)
+            if entry is None or entry['mtime'] != stat.st_mtime or entry['size'] != stat.st_size:
+                try:
+                    classes = scan_classes(path)
+                except (SyntaxError, ValueError) as e:
+                    print("Cannot index {}: {}".format(path, e))
+                    classes = []
+                entry = {'mtime': stat.st_mtime, 'size': stat.st_size, 'classes': classes}
+                changed = True
+            entries[path] = entry
+
+        changed = changed or set(entries) != set(self._entries)
+        self._entries = entries
+        if changed:
+            write_atomic(self._index_file, json.dumps({'version': INDEX_VERSION, 'files': entries}).encode('utf-8'))
+
+    def find(self, class_name):
+        """
+        File defining the class, or None
+        """
+        for path in self._files:
+            entry = self._entries.get(path)
+            if entry and class_name in entry['classes']:
+                return path
+        return None
+
+    def load_class(self, class_name):
+        """
+        The class itself, importing only the module that defines it
+        """
+        path = self.find(class_name)
+        if path is None:
+            return None
+        return getattr(import_file(path), class_name, None)
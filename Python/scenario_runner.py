@@ -20,56 +20,50 @@ import traceback
 import argparse
 from argparse import RawTextHelpFormatter
 from datetime import datetime
-from distutils.version import LooseVersion
 import importlib
 import inspect
 import os
+import re
 import signal
 import sys
+import threading
 import time
-import json
-import pkg_resources
 
 import carla
 
-from srunner.scenarioconfigs.openscenario_configuration import OpenScenarioConfiguration
 from srunner.scenariomanager.carla_data_provider import CarlaDataProvider
 from srunner.scenariomanager.scenario_manager import ScenarioManager
-from srunner.scenarios.open_scenario import OpenScenario
-from srunner.scenarios.route_scenario import RouteScenario
-from srunner.tools.scenario_parser import ScenarioConfigurationParser
-from srunner.tools.route_parser import RouteParser
-from srunner.tools.osc2_helper import OSC2Helper
-from srunner.scenarios.osc2_scenario import OSC2Scenario
-from srunner.scenarioconfigs.osc2_scenario_configuration import OSC2ScenarioConfiguration
+
+# The modules specific to each mode (route, OpenSCENARIO, OpenSCENARIO 2.0,
+# scenario classes, --list) are imported only once that mode is selected.
+# So are the modules that pull numpy, sqlite3 or asyncio in, where the
+# setup step or the option that needs them is handled.
+# pylint: disable=import-outside-toplevel
+
+from actor_setup import ActorSetup
+from blueprint_catalog import BlueprintCatalog
+from ego_discovery import EgoDiscovery
+from phase_timer import PhaseTimer
+from population_manifest import PopulationManifest
+from route_cache import install_route_cache
+from scenario_index import ScenarioIndex, import_file
+from traffic_population import PopulationPlanner, PopulationProfile
+from world_reset import WorldResetter
 
 # Version of scenario_runner
 VERSION = '0.9.13'
 
-def get_actor_blueprints(world, filter_, generation):
-    bps = world.get_blueprint_library().filter(filter_)
-    # bps = list(filter(lambda x: x.id in filter_, bps))
-    
-    if generation.lower() == "all":
-        return bps
-    # print(bps)
-    # If the filter returns only one bp, we assume that this one needed
-    # and therefore, we ignore the generation
-    if len(bps) == 1:
-        return bps
+# criteria_serializer.FORMATS, without importing numpy for the command line
+CRITERIA_FORMATS = ('json', 'npz')
+MINIMUM_CARLA_VERSION = (0, 9, 12)
+
+
+def version_tuple(version):
+    """
+    "0.9.13" or "0.9.13-1-g8854804f4" -> (0, 9, 13)
+    """
+    return tuple(int(x) for x in re.findall(r'\d+', version.split('-')[0])[:3])
 
-    try:
-        int_generation = int(generation)
-        # Check if generation is in available generations
-        if int_generation in [1, 2]:
-            bps = [x for x in bps if int(x.get_attribute('generation')) == int_generation]
-            return bps
-        else:
-            print("   Warning! Actor Generation is not valid. No actor will be spawned.")
-            return []
-    except:
-        print("   Warning! Actor Generation is not valid. No actor will be spawned.")
-        return []
 
 class ScenarioRunner(object):
 
@@ -101,12 +95,34 @@ class ScenarioRunner(object):
     agent_instance = None
     module_agent = None
 
+    _blueprint_catalog = None
+    _npc_vehicle_ids = []
+
+    # Phase timings of the current run, and the time spent connecting (reported by the first run)
+    _phase_timer = None
+    _connect_time = None
+
+    # Store the results are appended to, opened on the first analyzed run
+    _results_store = None
+
+    # Telemetry server of the side screens, started with the first run
+    _telemetry_server = None
+
+    # Set to cancel the current job (runner daemon), and whether its scenario is running
+    _cancel_event = None
+    _scenario_running = False
+
+    # Role name index of the vehicles, while waiting for the ego vehicles (--waitForEgo)
+    _ego_discovery = None
+
     def __init__(self, args):
         """
         Setup CARLA client and world
         Setup ScenarioManager
         """
         self._args = args
+        self._start_wall_time = datetime.now()
+        connect_start = time.perf_counter()
 
         if args.timeout:
             self.client_timeout = float(args.timeout)
@@ -116,28 +132,120 @@ class ScenarioRunner(object):
         # requests in the localhost at port 2000.
         self.client = carla.Client(args.host, int(args.port))
         self.client.set_timeout(self.client_timeout)
-        dist = pkg_resources.get_distribution("carla")
-        if LooseVersion(dist.version) < LooseVersion('0.9.12'):
-            raise ImportError("CARLA version 0.9.12 or newer required. CARLA version found: {}".format(dist))
+        self._world_resetter = WorldResetter(self.client)
+        # The client library knows its own version, no need to scan the installed distributions
+        carla_version = self.client.get_client_version()
+        if version_tuple(carla_version) < MINIMUM_CARLA_VERSION:
+            raise ImportError("CARLA version 0.9.12 or newer required. CARLA version found: {}".format(carla_version))
+        # First round trip to the server, so that connecting is timed on its own
+        self.client.get_server_version()
+        self._connect_time = time.perf_counter() - connect_start
 
         # Load agent if requested via command line args
         # If something goes wrong an exception will be thrown by importlib (ok here)
-        if self._args.agent is not None:
-            module_name = os.path.basename(args.agent).split('.')[0]
-            sys.path.insert(0, os.path.dirname(args.agent))
-            self.module_agent = importlib.import_module(module_name)
+        self._load_agent_module(self._args.agent)
 
         # Create the ScenarioManager
         self.manager = ScenarioManager(self._args.debug, self._args.sync, self._args.timeout)
 
         # Create signal handler for SIGINT
         self._shutdown_requested = False
+        self._cancel_lock = threading.Lock()
+        self._cancel_event = threading.Event()
         if sys.platform != 'win32':
             signal.signal(signal.SIGHUP, self._signal_handler)
         signal.signal(signal.SIGINT, self._signal_handler)
         signal.signal(signal.SIGTERM, self._signal_handler)
 
-        self._start_wall_time = datetime.now()
+    def _load_agent_module(self, agent):
+        """
+        Import the agent module given by its file path (or unload it if None)
+        """
+        if agent is None:
+            self.module_agent = None
+            return
+
+        module_name = os.path.basename(agent).split('.')[0]
+        if self.module_agent is not None and self.module_agent.__name__ == module_name:
+            return
+        sys.path.insert(0, os.path.dirname(agent))
+        self.module_agent = importlib.import_module(module_name)
+
+    @property
+    def loaded_town(self):
+        """
+        Town the runner loaded last, None before the first load
+        """
+        return self._world_resetter.town
+
+    def preload_town(self, town):
+        """
+        Load a town ahead of the job that will run in it (runner daemon preloads).
+        Returns False if it is already loaded.
+        """
+        if self._world_resetter.town == town:
+            return False
+        self.world = self._world_resetter.prepare(town)
+        return True
+
+    def reconfigure(self, args, cancel_event=None):
+        """
+        Prepare an already connected runner for a new set of arguments.
+        The CARLA client (and therefore the loaded world) is kept, which
+        is what makes repeated launches from the runner daemon cheap.
+        Setting cancel_event stops the run at the next phase boundary.
+        """
+        if (args.host, args.port) != (self._args.host, self._args.port):
+            raise ValueError("A runner cannot be reconfigured to another CARLA server")
+
+        self._args = args
+        if args.timeout:
+            self.client_timeout = float(args.timeout)
+            self.client.set_timeout(self.client_timeout)
+
+        self._load_agent_module(args.agent)
+        self.manager = ScenarioManager(args.debug, args.sync, args.timeout)
+        self.finished = False
+        self._shutdown_requested = False
+        self._cancel_event = cancel_event or threading.Event()
+
+    def cancel(self, cancel_event=None):
+        """
+        Cancel the current run from another thread: the remaining phases and
+        configurations are skipped, and a running scenario is stopped.
+        With cancel_event, only the run of that event is cancelled.
+        """
+        with self._cancel_lock:
+            if cancel_event is not None and cancel_event is not self._cancel_event:
+                cancel_event.set()      # that run is over, or not started yet
+                return
+            self._cancel_event.set()
+            running = self._scenario_running
+        # run_scenario() raises its running flag only once started, stopping it before is lost
+        while running and not self.manager.get_running_status():
+            time.sleep(0.01)
+            with self._cancel_lock:
+                running = self._scenario_running
+        if running:
+            self.manager.stop_scenario()
+
+    def _stop_requested(self):
+        """
+        Whether the run is shut down or cancelled
+        """
+        return self._shutdown_requested or self._cancel_event.is_set()
+
+    @property
+    def blueprint_catalog(self):
+        """
+        Blueprint catalog of the connected server, built on first use. It
+        shares the library CarlaDataProvider.set_world() fetched already.
+        """
+        if self._blueprint_catalog is None:
+            def shared_library():
+                return CarlaDataProvider._blueprint_library     # pylint: disable=protected-access
+            self._blueprint_catalog = BlueprintCatalog(self.client, shared_library=shared_library)
+        return self._blueprint_catalog
 
     def destroy(self):
         """
@@ -145,6 +253,12 @@ class ScenarioRunner(object):
         """
 
         self._cleanup()
+        if self._results_store is not None:
+            self._results_store.close()
+            self._results_store = None
+        if self._telemetry_server is not None:
+            self._telemetry_server.close()
+            self._telemetry_server = None
         if self.manager is not None:
             del self.manager
         if self.world is not None:
@@ -173,21 +287,24 @@ class ScenarioRunner(object):
         scenarios_list = glob.glob("{}/srunner/scenarios/*.py".format(os.getenv('SCENARIO_RUNNER_ROOT', "./")))
         scenarios_list.append(self._args.additionalScenario)
 
+        # Import only the module defining the class
+        scenario_class = ScenarioIndex(scenarios_list).load_class(scenario)
+        if scenario_class is not None:
+            return scenario_class
+
+        # Not defined by any file (only imported by one of them), look at every module
         for scenario_file in scenarios_list:
+            if not scenario_file:
+                continue
 
             # Get their module
-            module_name = os.path.basename(scenario_file).split('.')[0]
-            sys.path.insert(0, os.path.dirname(scenario_file))
-            scenario_module = importlib.import_module(module_name)
+            scenario_module = import_file(scenario_file)
 
             # And their members of type class
             for member in inspect.getmembers(scenario_module, inspect.isclass):
                 if scenario in member:
                     return member[1]
 
-            # Remove unused Python paths
-            sys.path.pop(0)
-
         print("Scenario '{}' not supported ... Exiting".format(scenario))
         sys.exit(-1)
 
@@ -199,6 +316,7 @@ class ScenarioRunner(object):
             return
 
         self.finished = True
+        self._phase('cleanup')
 
         # Simulation still running and in synchronous mode?
         if self.world is not None and self._args.sync:
@@ -214,6 +332,10 @@ class ScenarioRunner(object):
 
         self.manager.cleanup()
 
+        if self._ego_discovery is not None:
+            self._ego_discovery.stop()
+            self._ego_discovery = None
+
         CarlaDataProvider.cleanup()
 
         for i, _ in enumerate(self.ego_vehicles):
@@ -244,22 +366,11 @@ class ScenarioRunner(object):
                                                                              color=vehicle.color,
                                                                              actor_category=vehicle.category))
         else:
-            ego_vehicle_missing = True
-            while ego_vehicle_missing:
-                self.ego_vehicles = []
-                ego_vehicle_missing = False
-                for ego_vehicle in ego_vehicles:
-                    ego_vehicle_found = False
-                    carla_vehicles = CarlaDataProvider.get_world().get_actors().filter('vehicle.*')
-                    
-                    for carla_vehicle in carla_vehicles:
-                        if carla_vehicle.attributes['role_name'] == ego_vehicle.rolename:
-                            ego_vehicle_found = True
-                            self.ego_vehicles.append(carla_vehicle)
-                            break
-                    if not ego_vehicle_found:
-                        ego_vehicle_missing = True
-                        break
+            found = self._find_ego_vehicles(ego_vehicles, CarlaDataProvider.get_world())
+            if found is None:
+                raise RuntimeError("The ego vehicles are not ready: {}".format(
+                    ", ".join(x.rolename for x in ego_vehicles)))
+            self.ego_vehicles = found
 
             for i, _ in enumerate(self.ego_vehicles):
                
@@ -299,67 +410,72 @@ class ScenarioRunner(object):
         #     with open(filename, "w") as file:
         #         file.write('\n')
         #         file.close()
-        if not self.manager.analyze_scenario(self._args.output, filename, junit_filename, json_filename):
+        failure = self.manager.analyze_scenario(self._args.output, filename, junit_filename, json_filename)
+        store = self._get_results_store()
+        if store is not None:
+            from results_store import scenario_record
+            store.append(scenario_record(self.manager, config, self._args, not failure))
+        if not failure:
             print("All scenario tests were passed successfully!")
         else:
             print("Not all scenario tests were successful")
             if not (self._args.output or filename or junit_filename):
                 print("Please run with --output for further information")
 
+    def _get_results_store(self):
+        """
+        Results store of the current arguments, None if disabled
+        """
+        from results_store import RESULTS_FILE, ResultsStore
+
+        path = self._args.resultsDb
+        if path is None:
+            path = os.path.join(self._args.outputDir or '.', RESULTS_FILE)
+        if not path:
+            return None
+        if self._results_store is None or self._results_store.path != path:
+            if self._results_store is not None:
+                self._results_store.close()
+            self._results_store = ResultsStore(path)
+        return self._results_store
+
     def _record_criteria(self, criteria, name):
         """
         Filter the JSON serializable attributes of the criterias and
         dumps them into a file. This will be used by the metrics manager,
         in case the user wants specific information about the criterias.
         """
-        file_name = name[:-4] + ".json"
+        from criteria_serializer import write_criteria
 
-        # Filter the attributes that aren't JSON serializable
-        with open('temp.json', 'w', encoding='utf-8') as fp:
-
-            criteria_dict = {}
-            for criterion in criteria:
+        file_format = self._args.criteriaFormat
+        write_criteria(criteria, name[:-4] + "." + file_format, file_format)
+    
+    
+    def _index_recording(self, recorder_name):
+        """
+        Convert the recorder log into columns for the offline metrics.
+        The server writes the log, it is only found if it runs on this machine.
+        """
+        from recorder_index import RecorderFormatError, index_recording
 
-                criterion_dict = criterion.__dict__
-                criteria_dict[criterion.name] = {}
+        if not os.path.isfile(recorder_name):
+            print("Recorder log {} not found, it is not indexed".format(recorder_name))
+            return
+        try:
+            print("Recording indexed in {}".format(index_recording(recorder_name)))
+        except (OSError, RecorderFormatError) as e:
+            print("Cannot index the recorder log: {}".format(e))
 
-                for key in criterion_dict:
-                    if key != "name":
-                        try:
-                            key_dict = {key: criterion_dict[key]}
-                            json.dump(key_dict, fp, sort_keys=False, indent=4)
-                            criteria_dict[criterion.name].update(key_dict)
-                        except TypeError:
-                            pass
+    def set_traffic_light_policy(self, config): #traffic light manager
+        """
+        Apply the traffic light policy of the level and scene
+        """
+        from traffic_lights import TrafficLightIndex, load_policy
 
-        os.remove('temp.json')
+        policy = load_policy(self._args.level, self._args.scene)
+        TrafficLightIndex.for_world(self.world).apply(policy, getattr(config, 'trajectory', None))
 
-        # Save the criteria dictionary into a .json file
-        with open(file_name, 'w', encoding='utf-8') as fp:
-            json.dump(criteria_dict, fp, sort_keys=False, indent=4)
-    
-    
-    def set_traffic_light_time(self, duration=5): #traffic light manager
-        actor_list = self.world.get_actors()
-        for actor_ in actor_list:
-            
-            if isinstance(actor_, carla.TrafficLight):
-                # actor_.set_state(carla.TrafficLightState.Red) 
-                # actor_.set_red_time(1.0)
-                actor_.set_state(carla.TrafficLightState.Green) 
-                actor_.set_green_time(1000.0)
-
-    def set_car_light(self, tm): #traffic light manager
-        actor_list = self.world.get_actors()
-        for actor_ in actor_list:
-            print(actor_)
-            if isinstance(actor_, carla.Vehicle):
-                # actor_.set_state(carla.TrafficLightState.Red) 
-                # actor_.set_red_time(1.0)
-                tm.update_vehicle_lights(actor_, True) 
-                
     def find_weather_presets(self):
-        import re
         rgx = re.compile('.+?(?:(?<=[a-z])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])|$)')
         name = lambda x: ' '.join(m.group(0) for m in rgx.finditer(x))
         presets = [x for x in dir(carla.WeatherParameters) if re.match('[A-Z].+', x)]
@@ -368,36 +484,38 @@ class ScenarioRunner(object):
             presets_dict[name(x)]= getattr(carla.WeatherParameters, x)
         return presets_dict     
 
-    def set_weather_preset(self, weather_name, weather_preset = carla.WeatherParameters.WetCloudySunset):
+    def set_weather_preset(self, weather_name):
         presets_dict = self.find_weather_presets()
         weather_preset = presets_dict[weather_name]
         self.world.set_weather(weather_preset)
         print(self.world.get_weather())
 
+    def _find_ego_vehicles(self, ego_vehicles, world):
+        """
+        Vehicles of the world with the role names of ego_vehicles, waiting for
+        them to be spawned. None on timeout (--waitForEgoTimeout) or shutdown.
+        """
+        if self._ego_discovery is not None and self._ego_discovery.world.id != world.id:
+            self._ego_discovery.stop()
+            self._ego_discovery = None
+        if self._ego_discovery is None:
+            self._ego_discovery = EgoDiscovery(world)
+        return self._ego_discovery.wait([x.rolename for x in ego_vehicles], self._args.waitForEgoTimeout or None,
+                                        self._stop_requested)
+
     def _load_and_wait_for_world(self, town, ego_vehicles=None):
         """
         Load a new CARLA world and provide data to CarlaDataProvider
         """
 
         if self._args.reloadWorld:
-            self.world = self.client.load_world(town)
+            # Only reloads the map if the town changes, otherwise it is reset in place
+            self.world = self._world_resetter.prepare(town, self._args.fullReload)
         else:
             # if the world should not be reloaded, wait at least until all ego vehicles are ready
-            
-            ego_vehicle_found = False
-            if self._args.waitForEgo:
-                while not ego_vehicle_found and not self._shutdown_requested:
-                    vehicles = self.client.get_world().get_actors().filter('vehicle.*')
-                    for ego_vehicle in ego_vehicles:
-                        ego_vehicle_found = False
-                        for vehicle in vehicles:
-                            if vehicle.attributes['role_name'] == ego_vehicle.rolename:
-                                ego_vehicle_found = True
-                                break
-                        if not ego_vehicle_found:
-                            print("Not all ego vehicles ready. Waiting ... ")
-                            time.sleep(1)
-                            break
+            if self._args.waitForEgo and self._find_ego_vehicles(ego_vehicles, self.client.get_world()) is None:
+                print("The ego vehicles are not ready")
+                return False
 
         self.world = self.client.get_world()
 
@@ -426,65 +544,193 @@ class ScenarioRunner(object):
         
         return True
 
-    def spawn_specific_vehicle(self, indic_pat, number_of_vehicles, tm, synchronous_master, spawn_points):
-        
-        SpawnActor = carla.command.SpawnActor
-        SetAutopilot = carla.command.SetAutopilot
-        FutureActor = carla.command.FutureActor
+    def _phase(self, name):
+        """
+        Start a phase of the current run, if it is timed
+        """
+        if self._phase_timer is not None:
+            self._phase_timer.start(name)
 
-        blueprints = get_actor_blueprints(self.world, "vehicle.{}.*".format(indic_pat), "All")
-        
-        number_of_spawn_points = len(spawn_points)
+    def _sim_clock(self):
+        """
+        Current (frame, elapsed simulation seconds), for the phase timer
+        """
+        if self.world is None:
+            return None
+        try:
+            snapshot = self.world.get_snapshot()
+        except RuntimeError:
+            return None
+        return snapshot.frame, snapshot.timestamp.elapsed_seconds
 
-        batch = []
-        vehicles_list = []
-        # number_of_vehicles = self._args.num_vehicles
-        
+    def _load_and_run_scenario(self, config):
+        """
+        Load and run the scenario given by config, timing each of its phases
+        """
+        self._phase_timer = PhaseTimer(self._sim_clock)
+        if self._connect_time is not None:
+            self._phase_timer.add('connect', self._connect_time)
+            self._connect_time = None
 
-        for n, transform in enumerate(spawn_points):
-            if n >= number_of_vehicles:
-                break
-            blueprint = random.choice(blueprints)
-            if blueprint.has_attribute('color'):
-                color = random.choice(blueprint.get_attribute('color').recommended_values)
-                blueprint.set_attribute('color', color)
-            if blueprint.has_attribute('driver_id'):
-                driver_id = random.choice(blueprint.get_attribute('driver_id').recommended_values)
-                blueprint.set_attribute('driver_id', driver_id)
-            
-        
+        result = False
+        try:
+            result = self._run_phases(config)
+        finally:
+            timer, self._phase_timer = self._phase_timer, None
+            timer.stop()
+            print(timer)
+            try:
+                timer.save(self._args.outputDir, scenario=config.name, town=config.town,
+                           level=self._args.level, scene=self._args.scene, agent=self._args.agent,
+                           seed=self._args.trafficManagerSeed, result=bool(result))
+            except OSError as e:
+                print("Cannot save the phase timings: {}".format(e))
+        return result
 
-            # spawn the cars and set their autopilot and light state all together
-            batch.append(SpawnActor(blueprint, transform)
-                .then(SetAutopilot(FutureActor, True, tm.get_port())))
-        
-        spawn_point_left = spawn_points[n + 1:]
+    def _next_phase(self, name):
+        """
+        Start the next phase of the run, False if the run is cancelled or shut down
+        """
+        if self._stop_requested():
+            print("Run stopped before the {} phase".format(name))
+            return False
+        self._phase_timer.start(name)
+        return True
 
-        for response in self.client.apply_batch_sync(batch, synchronous_master):
-            if response.error:
-                print(response.error)
+    def _run_loaded_scenario(self, config):
+        """
+        Run the loaded scenario, False if the run was stopped before
+        """
+        with self._cancel_lock:
+            if self._stop_requested():
+                return False
+            self._scenario_running = True
+        publisher = self._start_telemetry(config)
+        try:
+            if self._args.profileTicks:
+                self._run_profiled(config)
             else:
-                vehicles_list.append(response.actor_id)
-        
-        # if args.car_lights_on:
-        all_vehicle_actors = self.world.get_actors(vehicles_list)
-        for actor in all_vehicle_actors:
-            # print(actor)
-            # actor.set_target_velocity(30)
-            tm.update_vehicle_lights(actor, True) 
-            self.set_car_light(tm)
+                self.manager.run_scenario()
+        finally:
+            with self._cancel_lock:
+                self._scenario_running = False
+            if publisher is not None:
+                publisher.stop()
+        return True
 
-        return spawn_point_left
+    def _run_profiled(self, config):
+        """
+        Run the loaded scenario with the tick profiler, and report its latencies
+        """
+        from tick_profiler import TickProfiler
 
-    def _load_and_run_scenario(self, config):
+        profiler = TickProfiler(self.frame_rate)
+        profiler.install(self.manager)
+        try:
+            self.manager.run_scenario()
+        finally:
+            profiler.uninstall()
+            print(profiler)
+            try:
+                profiler.save(self._args.outputDir, scenario=config.name, town=config.town,
+                              level=self._args.level, scene=self._args.scene, agent=self._args.agent,
+                              sync=self._args.sync)
+            except OSError as e:
+                print("Cannot save the tick profile: {}".format(e))
+
+    def _start_telemetry(self, config):
+        """
+        Publish the ego vehicle telemetry of the loaded scenario, if requested
+        """
+        if not self._args.telemetry or not self.ego_vehicles:
+            return None
+        from telemetry import TelemetryPublisher, TelemetryServer
+
+        if self._telemetry_server is None:
+            server = TelemetryServer(port=self._args.telemetry, max_rate=self._args.telemetryRate)
+            try:
+                server.start()
+            except OSError as e:
+                print("Cannot serve the telemetry: {}".format(e))
+                return None
+            self._telemetry_server = server
+        publisher = TelemetryPublisher(self._telemetry_server, self.world, self.ego_vehicles[0],
+                                       self.manager.scenario.get_criteria(), config.name)
+        publisher.start()
+        return publisher
+
+    def _setup_traffic_manager(self):
+        """
+        Configure the traffic manager, returns it and whether this client is the synchronous master
+        """
+        CarlaDataProvider.set_traffic_manager_port(int(self._args.trafficManagerPort))
+        tm = self.client.get_trafficmanager(int(self._args.trafficManagerPort))
+        tm.set_random_device_seed(int(self._args.trafficManagerSeed))
+
+        if self._args.sync:
+            tm.set_synchronous_mode(True)
+            synchronous_master = True
+        else:
+            synchronous_master = False
+        return tm, synchronous_master
+
+    def _spawn_population(self, config, tm, synchronous_master):
+        """
+        Spawn the whole traffic population of the difficulty profile at once
+        """
+        from navigation_pool import NavigationPool
+        from spawn_allocator import SpawnAllocator
+
+        profile = PopulationProfile.from_args(self._args)
+        if self._args.trafficManagerSeed:
+            self.world.set_pedestrians_seed(0)
+            random.seed(self._args.trafficManagerSeed)
+        ego_locations = [x.get_location() for x in self.ego_vehicles if x]
+        manifest = PopulationManifest(self._args.level, self._args.scene, config.town,
+                                      self._args.trafficManagerSeed, profile, config.name, ego_locations)
+        plan = None if self._args.replanPopulation else manifest.load(self.blueprint_catalog)
+        navigation = None
+        if plan is None and profile.walkers:
+            # A saved plan has its walker locations already, only a new one samples the navigation pool
+            self._phase('walker_setup')
+            navigation = NavigationPool.for_world(self.world, config.town)
+        self._phase('npc_spawn')
+        planner = PopulationPlanner(self.client, self.world, self.blueprint_catalog, tm, synchronous_master,
+                                    navigation)
+        if plan is None:
+            allocator = SpawnAllocator(self.world.get_map(), ego_locations)
+            vehicle_transforms = allocator.allocate(profile.vehicles)
+            print(allocator.report)
+            plan = planner.plan(profile, vehicle_transforms)
+            manifest.save(plan)
+            # Spawn from the saved manifest, so this run matches the next ones exactly
+            plan = manifest.load(self.blueprint_catalog) or plan
+        population = planner.execute(plan, profile)
+        print(population.summary())
+        self._world_resetter.track(population.vehicle_ids + population.walker_ids)
+        self._world_resetter.track(population.controller_ids, controllers=True)
+        self._npc_vehicle_ids = population.vehicle_ids
+
+        # Configure all the new vehicles in one pass
+        actor_setup = ActorSetup()
+        actor_setup.add_rule('vehicle.*', lights_on=True)
+        actor_setup.add_rule('vehicle.indic.auto01', target_speed=20.0)
+        actor_setup.apply(self.client, self.world, tm,
+                          self._npc_vehicle_ids + [x.id for x in self.ego_vehicles if x])
+
+    def _run_phases(self, config):
         """
         Load and run the scenario given by config
         """
         result = False
-        if not self._load_and_wait_for_world(config.town, config.ego_vehicles):
+        timer = self._phase_timer
+        if not self._next_phase('load_world') or not self._load_and_wait_for_world(config.town, config.ego_vehicles):
             self._cleanup()
             return False
 
+        if not self._next_phase('agent_setup'):
+            self._cleanup()
+            return False
         if self._args.agent:
             agent_class_name = self.module_agent.__name__.title().replace('_', '')
             try:
@@ -496,150 +742,35 @@ class ScenarioRunner(object):
                 self._cleanup()
                 return False
 
-        CarlaDataProvider.set_traffic_manager_port(int(self._args.trafficManagerPort))
-        tm = self.client.get_trafficmanager(int(self._args.trafficManagerPort))
-        
-        tm.set_random_device_seed(int(self._args.trafficManagerSeed))
-        
-
-        if self._args.sync:
-            tm.set_synchronous_mode(True)
-            synchronous_master = True
-        else:
-            synchronous_master = False
+        tm, synchronous_master = self._setup_traffic_manager()
 
         # Prepare scenario
         print("Preparing scenario: " + config.name)
         try:
-            
+            if not self._next_phase('ego_spawn'):
+                self._cleanup()
+                return False
             self._prepare_ego_vehicles(config.ego_vehicles)
             
-            SpawnActor = carla.command.SpawnActor
-            SetAutopilot = carla.command.SetAutopilot
-            FutureActor = carla.command.FutureActor
-
-            if self._args.spawn_vehicle:
-                # blueprints = get_actor_blueprints(self.world, ["vehicle.auto02.auto02", "vehicle.bus01.model1"], "All")
-                spawn_points = self.world.get_map().get_spawn_points()
-                if self._args.spawn_vehicle_Indic_HeavyVehicle:
-                    indic_pat = 'indic_heavyvehicle'
-                    spawn_points = self.spawn_specific_vehicle(indic_pat, self._args.num_vehicles_Indic_HeavyVehicle, tm, synchronous_master, spawn_points)
-                if self._args.spawn_vehicle_Indic_ThreeWheeler: 
-                    indic_pat = 'indic_threewheeler'
-                    spawn_points = self.spawn_specific_vehicle(indic_pat, self._args.num_vehicles_Indic_ThreeWheeler, tm, synchronous_master, spawn_points)
-                if self._args.spawn_vehicle_Indic_FourWheeler: 
-                    indic_pat = 'indic_fourwheeler'
-                    spawn_points = self.spawn_specific_vehicle(indic_pat, self._args.num_vehicles_Indic_FourWheeler, tm, synchronous_master, spawn_points)     
-                if self._args.spawn_vehicle_Indic_TwoWheeler: 
-                    indic_pat = 'indic_twowheeler'
-                    spawn_points = self.spawn_specific_vehicle(indic_pat, self._args.num_vehicles_Indic_TwoWheeler, tm, synchronous_master, spawn_points)
-            if self._args.spawn_pedestrians:
-                blueprintsWalkers = get_actor_blueprints(self.world, "walker.pedestrian.*", "All")
-                walkers_list = []
-                all_id = []
-                number_of_walkers = self._args.num_walkers
-
-                percentagePedestriansRunning = 0.0      # how many pedestrians will run
-                percentagePedestriansCrossing = 20.0     # how many pedestrians will walk through the road
-                if self._args.trafficManagerSeed:
-                    self.world.set_pedestrians_seed(0)
-                    random.seed(self._args.trafficManagerSeed)
-                # 1. take all the random locations to spawn
-                spawn_points = []
-                for i in range(number_of_walkers):
-                    spawn_point = carla.Transform()
-                    loc = self.world.get_random_location_from_navigation()
-                    if (loc != None):
-                        spawn_point.location = loc
-                        spawn_points.append(spawn_point)
-                # 2. we spawn the walker object
-                batch = []
-                walker_speed = []
-                for spawn_point in spawn_points:
-                    walker_bp = random.choice(blueprintsWalkers)
-                    # set as not invincible
-                    if walker_bp.has_attribute('is_invincible'):
-                        walker_bp.set_attribute('is_invincible', 'false')
-                    # set the max speed
-                    if walker_bp.has_attribute('speed'):
-                        if (random.random() > percentagePedestriansRunning):
-                            # walking
-                            walker_speed.append(walker_bp.get_attribute('speed').recommended_values[1])
-                        else:
-                            # running
-                            walker_speed.append(walker_bp.get_attribute('speed').recommended_values[2])
-                    else:
-                        print("Walker has no speed")
-                        walker_speed.append(0.0)
-                    batch.append(SpawnActor(walker_bp, spawn_point))
-                results = self.client.apply_batch_sync(batch, True)
-                walker_speed2 = []
-                for i in range(len(results)):
-                    if results[i].error:
-                        print(results[i].error)
-                    else:
-                        walkers_list.append({"id": results[i].actor_id})
-                        walker_speed2.append(walker_speed[i])
-                walker_speed = walker_speed2
-                # 3. we spawn the walker controller
-                batch = []
-                walker_controller_bp = self.world.get_blueprint_library().find('controller.ai.walker')
-                for i in range(len(walkers_list)):
-                    batch.append(SpawnActor(walker_controller_bp, carla.Transform(), walkers_list[i]["id"]))
-                results = self.client.apply_batch_sync(batch, True)
-                for i in range(len(results)):
-                    if results[i].error:
-                        print(results[i].error)
-                    else:
-                        walkers_list[i]["con"] = results[i].actor_id
-                # 4. we put together the walkers and controllers id to get the objects from their id
-                for i in range(len(walkers_list)):
-                    all_id.append(walkers_list[i]["con"])
-                    all_id.append(walkers_list[i]["id"])
-                all_actors = self.world.get_actors(all_id)
-
-                # wait for a tick to ensure client receives the last transform of the walkers we have just created
-                if not synchronous_master:
-                    self.world.wait_for_tick()
-                else:
-                    self.world.tick()
-
-                # 5. initialize each controller and set target to walk to (list is [controler, actor, controller, actor ...])
-                # set how many pedestrians can cross the road
-                self.world.set_pedestrians_cross_factor(percentagePedestriansCrossing)
-                for i in range(0, len(all_id), 2):
-                    # start walker
-                    all_actors[i].start()
-                    # set walk to random point
-                    all_actors[i].go_to_location(self.world.get_random_location_from_navigation())
-                    # max speed
-                    all_actors[i].set_max_speed(float(walker_speed[int(i/2)]))
-
-            actor_list = self.world.get_actors()
-            for actor_ in actor_list.filter('vehicle.indic.auto01'):
-                print(actor_)
-                if isinstance(actor_, carla.Vehicle):
-                    # if actor_.type == 'v:
-                    # actor_.set_state(carla.TrafficLightState.Red) 
-                    # actor_.set_red_time(1.0)
-                    
-                    # actor_.set_target_velocity(30*(actor_.get_transform().get_forward_vector()) )
-                    # actor_.add_force(15*(actor_.get_transform().get_forward_vector()) )
-
-                    actor_.set_target_velocity(20*(actor_.get_transform().get_forward_vector()) )
-
+            self._spawn_population(config, tm, synchronous_master)
 
+            if not self._next_phase('scenario_build'):
+                self._cleanup()
+                return False
             if self._args.openscenario:
+                from srunner.scenarios.open_scenario import OpenScenario
                 scenario = OpenScenario(world=self.world,
                                         ego_vehicles=self.ego_vehicles,
                                         config=config,
                                         config_file=self._args.openscenario,
                                         timeout=100000)
             elif self._args.route:
+                from srunner.scenarios.route_scenario import RouteScenario
                 scenario = RouteScenario(world=self.world,
                                          config=config,
                                          debug_mode=self._args.debug)
             elif self._args.openscenario2:
+                from srunner.scenarios.osc2_scenario import OSC2Scenario
                 scenario = OSC2Scenario(world=self.world,
                                         ego_vehicles=self.ego_vehicles,
                                         config=config,
@@ -659,11 +790,15 @@ class ScenarioRunner(object):
             self._cleanup()
             return False
 
+        if not self._next_phase('world_setup'):
+            scenario.remove_all_actors()
+            self._cleanup()
+            return False
         ########### WEATHER ##############
         self.set_weather_preset(self._args.weather)
         
         ####################### SET TRAFFIC LIGHT ####################
-        self.set_traffic_light_time()
+        self.set_traffic_light_policy(config)
         
         try:
             if self._args.record:
@@ -672,17 +807,27 @@ class ScenarioRunner(object):
                 self.client.start_recorder(recorder_name, True)
 
             # Load scenario and run it
+            timer.start('run')
             self.manager.load_scenario(scenario, self.agent_instance)
-            self.manager.run_scenario()
+            if not self._run_loaded_scenario(config):
+                scenario.remove_all_actors()
+                if self._args.record:
+                    self.client.stop_recorder()
+                self._cleanup()
+                return False
 
             # Provide outputs if required
+            timer.start('analyze')
             self._analyze_scenario(config)
 
             # Remove all actors, stop the recorder and save all criterias (if needed)
+            timer.start('teardown')
             scenario.remove_all_actors()
             if self._args.record:
                 self.client.stop_recorder()
                 self._record_criteria(self.manager.scenario.get_criteria(), recorder_name)
+                if self._args.indexRecording:
+                    self._index_recording(recorder_name)
 
             result = True
 
@@ -698,6 +843,8 @@ class ScenarioRunner(object):
         """
         Run conventional scenarios (e.g. implemented using the Python API of ScenarioRunner)
         """
+        from srunner.tools.scenario_parser import ScenarioConfigurationParser
+
         result = False
 
         # Load the scenario configurations provided in the config file
@@ -710,7 +857,11 @@ class ScenarioRunner(object):
 
         # Execute each configuration
         for config in scenario_configurations:
+            if self._stop_requested():
+                break
             for _ in range(self._args.repetitions):
+                if self._stop_requested():
+                    break
                 self.finished = False
                 result = self._load_and_run_scenario(config)
 
@@ -730,11 +881,17 @@ class ScenarioRunner(object):
             if len(self._args.route) > 2:
                 single_route = self._args.route[2]
 
-        # retrieve routes
+        # retrieve routes, parsed once per content of the route and scenario files
+        from srunner.tools.route_parser import RouteParser
+        install_route_cache(RouteParser)
         route_configurations = RouteParser.parse_routes_file(routes, scenario_file, single_route)
         for config in route_configurations:
+            if self._stop_requested():
+                break
             print(config)
             for _ in range(self._args.repetitions):
+                if self._stop_requested():
+                    break
                 result = self._load_and_run_scenario(config)
 
                 self._cleanup()
@@ -756,6 +913,7 @@ class ScenarioRunner(object):
             for entry in self._args.openscenarioparams.split(','):
                 [key, val] = [m.strip() for m in entry.split(':')]
                 openscenario_params[key] = val
+        from srunner.scenarioconfigs.openscenario_configuration import OpenScenarioConfiguration
         config = OpenScenarioConfiguration(self._args.openscenario, self.client, openscenario_params)
 
         result = self._load_and_run_scenario(config)
@@ -773,6 +931,10 @@ class ScenarioRunner(object):
             self._cleanup()
             return False
 
+        from srunner.tools.osc2_helper import OSC2Helper
+        from srunner.scenarioconfigs.osc2_scenario_configuration import OSC2ScenarioConfiguration
+
+        OSC2Helper.wait_for_ego = self._args.waitForEgo
         config = OSC2ScenarioConfiguration(self._args.openscenario2, self.client)
 
         result = self._load_and_run_scenario(config)
@@ -799,9 +961,9 @@ class ScenarioRunner(object):
         return result
 
 
-def main():
+def build_parser():
     """
-    main function
+    Create the command line parser of the scenario runner
     """
     description = ("CARLA Scenario Runner: Setup, Run and Evaluate scenarios using CARLA\n"
                    "Current version: " + VERSION)
@@ -841,18 +1003,36 @@ def main():
     parser.add_argument('--junit', action="store_true", help='Write results into a junit file')
     parser.add_argument('--json', action="store_true", help='Write results into a JSON file')
     parser.add_argument('--outputDir', default='feedback', help='Directory for output files (default: this directory)')
+    parser.add_argument('--resultsDb', default=None,
+                        help='Results store the runs are appended to (default: <outputDir>/results.sqlite, "" to disable)')
+    parser.add_argument('--driver', default=os.getenv('DRIVESIM_DRIVER', ''),
+                        help='Name of the driver, stored with the results (default: $DRIVESIM_DRIVER)')
 
     parser.add_argument('--configFile', default='', help='Provide an additional scenario configuration file (*.xml)')
     parser.add_argument('--additionalScenario', default='', help='Provide additional scenario implementations (*.py)')
 
     parser.add_argument('--debug', action="store_true", help='Run with debug output')
+    parser.add_argument('--profileTicks', action="store_true",
+                        help='Profile the duration of every tick (agent, behavior tree, world) and report its latencies')
     parser.add_argument('--reloadWorld', action="store_true",
                         help='Reload the CARLA world before starting a scenario (default=True)')
+    parser.add_argument('--fullReload', action="store_true",
+                        help='Always reload the map, even if the requested town is already loaded')
     parser.add_argument('--record', type=str, default='',
                         help='Path were the files will be saved, relative to SCENARIO_RUNNER_ROOT.\nActivates the CARLA recording feature and saves to file all the criteria information.')
+    parser.add_argument('--criteriaFormat', default='json', choices=CRITERIA_FORMATS,
+                        help='Format of the recorded criteria: json, or npz with the long per-frame values as arrays')
+    parser.add_argument('--indexRecording', action="store_true",
+                        help='With --record, also index the recorder log for the offline metrics (recorder_index.py)')
+    parser.add_argument('--telemetry', type=int, default=0, metavar='PORT',
+                        help='Stream the ego vehicle telemetry to the side screens on this WebSocket port (e.g. 2102)')
+    parser.add_argument('--telemetryRate', type=float, default=20.0,
+                        help='Highest telemetry rate a screen can subscribe to, in frames per second (default: 20)')
     parser.add_argument('--randomize', action="store_true", help='Scenario parameters are randomized')
     parser.add_argument('--repetitions', default=1, type=int, help='Number of scenario executions')
     parser.add_argument('--waitForEgo', action="store_true", help='Connect the scenario to an existing ego vehicle')
+    parser.add_argument('--waitForEgoTimeout', default=0.0, type=float,
+                        help='Seconds to wait for the ego vehicles with --waitForEgo (default: 0, no limit)')
     parser.add_argument('--spawn_vehicle', action="store_true", help='Spawn extra vehicles')
     parser.add_argument('--spawn_pedestrians', action="store_true", help='Spawn extra pedestrians')
 
@@ -891,16 +1071,41 @@ def main():
 
 
 
+    parser.add_argument('--level', help='Difficulty level of the launch, used to cache its traffic population')
+    parser.add_argument('--scene', help='Scene of the launch, used to cache its traffic population')
+    parser.add_argument('--replanPopulation', action="store_true",
+                        help='Plan the traffic population again instead of reusing the cached one')
+
     parser.add_argument('--weather', default='Wet Cloudy Sunset',
                         help='Choose a weather preset setting', choices=['Clear Night', 'Clear Noon', 'Clear Sunset', 'Cloudy Night', 'Cloudy Noon', 'Cloudy Sunset', 'Default', 
                         'Hard Rain Night', 'Hard Rain Noon', 'Hard Rain Sunset', 'Mid Rain Sunset', 'Mid Rainy Night', 'Mid Rainy Noon', 
                         'Soft Rain Night', 'Soft Rain Noon', 'Soft Rain Sunset', 'Wet Cloudy Night', 'Wet Cloudy Noon', 'Wet Cloudy Sunset', 'Wet Night', 'Wet Noon', 'Wet Sunset'])
-    arguments = parser.parse_args()
     # pylint: enable=line-too-long
+    return parser
+
+
+def apply_mode_defaults(arguments):
+    """
+    Settings implied by the selected mode
+    """
+    if arguments.route:
+        arguments.reloadWorld = True
+
+    if arguments.agent:
+        arguments.sync = True
+
+    return arguments
 
-    OSC2Helper.wait_for_ego = arguments.waitForEgo
+
+def main():
+    """
+    main function
+    """
+    parser = build_parser()
+    arguments = parser.parse_args()
 
     if arguments.list:
+        from srunner.tools.scenario_parser import ScenarioConfigurationParser
         print("Currently the following scenarios are supported:")
         print(*ScenarioConfigurationParser.get_list_of_scenarios(arguments.configFile), sep='\n')
         return 1
@@ -923,11 +1128,7 @@ def main():
     if arguments.openscenarioparams and not arguments.openscenario:
         print("WARN: Ignoring --openscenarioparams when --openscenario is not specified")
 
-    if arguments.route:
-        arguments.reloadWorld = True
-
-    if arguments.agent:
-        arguments.sync = True
+    apply_mode_defaults(arguments)
 
     scenario_runner = None
     result = True
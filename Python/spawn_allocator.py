@@ -0,0 +1,194 @@
+"""
+Spatially stratified spawn point allocation for the NPC vehicles.
+
+The map spawn points are ordered by farthest point sampling, so any
+number of vehicles is spread evenly over the town instead of clustering
+in map order. When more vehicles are requested than the map has spawn
+points, extra spawn transforms are generated along the driving lane
+waypoints, away from every other spawn point.
+"""
+
+from __future__ import print_function
+
+import random
+
+import numpy as np
+
+import carla
+
+_LANE_WAYPOINTS = {}
+
+
+def farthest_point_order(points, count, start=0):
+    """
+    Indices of `count` points, each one the farthest from the ones before it
+    """
+    count = min(count, len(points))
+    if count == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    order = np.empty(count, dtype=np.int64)
+    order[0] = start
+    distances = np.full(len(points), np.inf)
+    for k in range(1, count):
+        distances = np.minimum(distances, np.sum((points - points[order[k - 1]]) ** 2, axis=1))
+        order[k] = int(np.argmax(distances))
+    return order
+
+
+def _locations(transforms):
+    return np.array([(t.location.x, t.location.y, t.location.z) for t in transforms],
+                    dtype=np.float64).reshape(-1, 3)
+
+
+class AllocationReport(object):
+
+    """
+    Requested against achieved vehicle density
+    """
+
+    def __init__(self, requested, builtin, synthetic, lane_length):
+        self.requested = requested
+        self.builtin = builtin
+        self.synthetic = synthetic
+        self.lane_length = lane_length      # in km
+
+    @property
+    def allocated(self):
+        return self.builtin + self.synthetic
+
+    @property
+    def requested_density(self):
+        return self.requested / self.lane_length if self.lane_length else 0.0
+
+    @property
+    def achieved_density(self):
+        return self.allocated / self.lane_length if self.lane_length else 0.0
+
+    def __repr__(self):
+        return ("Spawn points: {}/{} allocated ({} from the map, {} generated), "
+                "density {:.1f}/{:.1f} vehicles per lane km").format(
+                    self.allocated, self.requested, self.builtin, self.synthetic,
+                    self.achieved_density, self.requested_density)
+
+
+class SpawnAllocator(object):
+
+    """
+    Hands out well spread spawn transforms to the vehicle categories.
+
+    Usage:
+    allocator = SpawnAllocator(world.get_map(), occupied=[ego.get_location()])
+    transforms = allocator.allocate({"Indic_TwoWheeler": 100, "Indic_ThreeWheeler": 1000})
+    print(allocator.report)
+    """
+
+    min_separation = 8.0        # in meters, between two vehicle spawn points
+    waypoint_spacing = 10.0     # in meters, between the lane waypoints used for generated points
+    spawn_height = 0.5          # in meters, above the road for generated points
+
+    def __init__(self, world_map, occupied=()):
+        self._map = world_map
+        self._occupied = np.array([(x.x, x.y, x.z) for x in occupied], dtype=np.float64).reshape(-1, 3)
+        self.report = None
+
+    def _lane_waypoints(self):
+        # The waypoints only depend on the map, keep them for the next runs
+        key = (self._map.name, self.waypoint_spacing)
+        if key not in _LANE_WAYPOINTS:
+            _LANE_WAYPOINTS[key] = self._map.generate_waypoints(self.waypoint_spacing)
+        return _LANE_WAYPOINTS[key]
+
+    def _far_from(self, points, others):
+        """
+        Mask of the points at least min_separation away from all the others
+        """
+        if len(others) == 0 or len(points) == 0:
+            return np.ones(len(points), dtype=bool)
+        keep = np.ones(len(points), dtype=bool)
+        # chunked, to bound the size of the distance matrix
+        for start in range(0, len(points), 1024):
+            chunk = points[start:start + 1024]
+            squared = np.sum((chunk[:, None, :] - others[None, :, :]) ** 2, axis=-1)
+            keep[start:start + 1024] = np.all(squared >= self.min_separation ** 2, axis=1)
+        return keep
+
+    def _thinned(self, points):
+        """
+        Mask of the points kept when each one must be min_separation away from
+        the points kept before it
+        """
+        keep = np.zeros(len(points), dtype=bool)
+        cell_size = self.min_separation
+        cells = {}      # grid cell -> indices of the kept points in it
+        for index, point in enumerate(points):
+            cell = tuple(np.floor(point[:2] / cell_size).astype(np.int64))
+            neighbours = [i for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                          for i in cells.get((cell[0] + dx, cell[1] + dy), ())]
+            if neighbours and np.min(np.sum((points[neighbours] - point) ** 2, axis=1)) < cell_size ** 2:
+                continue
+            keep[index] = True
+            cells.setdefault(cell, []).append(index)
+        return keep
+
+    def _synthetic(self, builtin_points):
+        """
+        Spawn transforms on the driving lanes, away from junctions, from the map
+        spawn points and from each other
+        """
+        waypoints = [x for x in self._lane_waypoints()
+                     if not x.is_junction and x.lane_type == carla.LaneType.Driving]
+        transforms = []
+        for waypoint in waypoints:
+            transform = waypoint.transform
+            transforms.append(carla.Transform(
+                carla.Location(transform.location.x, transform.location.y,
+                               transform.location.z + self.spawn_height),
+                transform.rotation))
+        points = _locations(transforms)
+        keep = self._far_from(points, np.concatenate([builtin_points, self._occupied]))
+        keep[keep] = self._thinned(points[keep])
+        return [t for t, k in zip(transforms, keep) if k], points[keep]
+
+    def allocate(self, requests):
+        """
+        category -> count  =>  category -> list of transforms
+        """
+        requested = sum(requests.values())
+        allocation = {category: [] for category in requests}
+        if requested == 0:
+            self.report = AllocationReport(0, 0, 0, 0.0)
+            return allocation
+
+        builtin = list(self._map.get_spawn_points())
+        builtin_points = _locations(builtin)
+        keep = self._far_from(builtin_points, self._occupied)
+        builtin = [t for t, k in zip(builtin, keep) if k]
+        builtin_points = builtin_points[keep]
+
+        synthetic = []
+        candidates, points = builtin, builtin_points
+        if requested > len(builtin):
+            synthetic, synthetic_points = self._synthetic(builtin_points)
+            candidates = builtin + synthetic
+            points = np.concatenate([builtin_points, synthetic_points])
+
+        # Map spawn points first, generated ones only for the surplus
+        if requested <= len(builtin):
+            order = farthest_point_order(points, requested, random.randrange(len(points)) if len(points) else 0)
+        else:
+            extra = farthest_point_order(points[len(builtin):], requested - len(builtin),
+                                         random.randrange(len(synthetic)) if synthetic else 0)
+            order = np.concatenate([farthest_point_order(builtin_points, len(builtin)), extra + len(builtin)])
+
+        # Interleave the categories over the ordering, so that each of them is spread as well
+        assigned = {category: 0 for category in requests}
+        for k, index in enumerate(order):
+            category = max(requests, key=lambda c: requests[c] * (k + 1) / float(requested) - assigned[c])
+            allocation[category].append(candidates[index])
+            assigned[category] += 1
+
+        used_builtin = int(np.sum(order < len(builtin)))
+        lane_length = len(self._lane_waypoints()) * self.waypoint_spacing / 1000.0
+        self.report = AllocationReport(requested, used_builtin, len(order) - used_builtin, lane_length)
+        return allocation
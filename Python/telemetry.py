@@ -0,0 +1,469 @@
+#!/usr/bin/env python
+
+"""
+Live telemetry of the ego vehicle for the side screens.
+
+The publisher samples the ego vehicle from world.on_tick(), on the CARLA
+client thread, so the scenario tick loop does not wait for it. Every
+frame is packed once into a small binary message and handed to a local
+WebSocket server running its own asyncio loop in a background thread.
+
+Every subscriber picks a rate (ws://127.0.0.1:2102/?rate=10, capped by
+the server) and has a short queue: frames above its rate are skipped, and
+when it reads too slowly the oldest queued frames are dropped, so a slow
+screen never holds the others or the runner back.
+
+Messages:
+
+- text, JSON, sent on connection and when a scenario starts:
+  {"type": "scenario", "name": ..., "criteria": [names], "statuses": [...]}
+- binary, one per frame, little endian (see TICK):
+  version u8, frame u32, simulation time f64, speed f32 (m/s), throttle f32,
+  brake f32, steer f32, gear i8, route progress f32 (0-1, NaN if unknown),
+  frame time f32 (ms), criteria count u8, then one status code u8 per criterion
+
+Run as a script to serve a synthetic drive, to work on the screens
+without a simulator:
+
+    python3 telemetry.py --fake
+"""
+
+from __future__ import print_function
+
+import argparse
+import asyncio
+import base64
+import collections
+import hashlib
+import json
+import math
+import struct
+import sys
+import threading
+import time
+import types
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_LISTEN_HOST = '127.0.0.1'
+DEFAULT_LISTEN_PORT = 2102
+
+TICK_VERSION = 1
+TICK = struct.Struct('<BIdffffbffB')
+
+# Criterion test_status -> status code of the binary frames
+STATUSES = ('INIT', 'RUNNING', 'SUCCESS', 'FAILURE', 'ACCEPTABLE')
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+UNKNOWN_STATUS = 255
+
+_WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+_TEXT = 0x1
+_BINARY = 0x2
+_CLOSE = 0x8
+_PING = 0x9
+_PONG = 0xA
+
+
+def pack_tick(frame, sim_time, speed, throttle, brake, steer, gear, progress, frame_ms, statuses):
+    """
+    Binary message of one frame
+    """
+    statuses = bytes(statuses)
+    return TICK.pack(TICK_VERSION, frame, sim_time, speed, throttle, brake, steer, gear, progress,
+                     frame_ms, len(statuses)) + statuses
+
+
+def unpack_tick(data):
+    """
+    Dictionary of a binary frame message
+    """
+    (version, frame, sim_time, speed, throttle, brake, steer, gear, progress, frame_ms,
+     count) = TICK.unpack_from(data)
+    if version != TICK_VERSION:
+        raise ValueError("unsupported telemetry version {}".format(version))
+    return {'frame': frame, 'time': sim_time, 'speed': speed, 'throttle': throttle, 'brake': brake,
+            'steer': steer, 'gear': gear, 'progress': progress, 'frame_ms': frame_ms,
+            'statuses': list(data[TICK.size:TICK.size + count])}
+
+
+def _websocket_frame(opcode, payload):
+    header = bytes([0x80 | opcode])
+    length = len(payload)
+    if length < 126:
+        header += bytes([length])
+    elif length < 1 << 16:
+        header += bytes([126]) + struct.pack('>H', length)
+    else:
+        header += bytes([127]) + struct.pack('>Q', length)
+    return header + payload
+
+
+class _Subscriber(object):
+
+    """
+    Rate limited, drop-oldest queue of one connection
+    """
+
+    def __init__(self, writer, rate, queue_size):
+        self.writer = writer
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.frames = collections.deque(maxlen=queue_size)
+        self.ready = asyncio.Event()
+        self.next_time = 0.0
+        self.dropped = 0
+
+    def offer(self, message, now, limited=True):
+        if limited:
+            if now < self.next_time:
+                return
+            self.next_time = now + self.interval
+        if len(self.frames) == self.frames.maxlen:
+            self.dropped += 1
+        self.frames.append(message)
+        self.ready.set()
+
+
+class TelemetryServer(object):
+
+    """
+    WebSocket server of the telemetry, on its own thread.
+
+    Usage:
+    server = TelemetryServer(port=2102)
+    server.start()
+    server.publish(pack_tick(...))     # from any thread, returns at once
+    server.close()
+    """
+
+    def __init__(self, host=DEFAULT_LISTEN_HOST, port=DEFAULT_LISTEN_PORT, max_rate=20.0, queue_size=4):
+        self.host = host
+        self.port = port
+        self.max_rate = max_rate
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._scenario = None
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self.address = None
+
+    @property
+    def has_subscribers(self):
+        """
+        Whether anybody listens, the publisher skips the sampling otherwise
+        """
+        return bool(self._subscribers)
+
+    def start(self):
+        """
+        Start serving in a background thread, returns once listening
+        """
+        ready = threading.Event()
+        errors = []
+
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            try:
+                self._server = self._loop.run_until_complete(
+                    asyncio.start_server(self._handle, self.host, self.port))
+            except OSError as e:
+                errors.append(e)
+                ready.set()
+                return
+            self.address = self._server.sockets[0].getsockname()[:2]
+            ready.set()
+            self._loop.run_forever()
+            self._server.close()
+            tasks = asyncio.all_tasks(self._loop)
+            for task in tasks:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.close()
+
+        self._thread = threading.Thread(target=serve, name='telemetry', daemon=True)
+        self._thread.start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+        print("Telemetry on ws://{}:{}".format(*self.address))
+
+    def publish(self, message):
+        """
+        Send a binary frame message to the subscribers
+        """
+        if self._subscribers and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._broadcast, (_BINARY, message), True)
+
+    def announce(self, **scenario):
+        """
+        Send the scenario description, also to the later subscribers
+        """
+        message = (_TEXT, json.dumps(dict(scenario, type='scenario')).encode('utf-8'))
+        self._scenario = message
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._broadcast, message, False)
+
+    def _broadcast(self, message, limited):
+        now = time.monotonic()
+        for subscriber in self._subscribers:
+            subscriber.offer(message, now, limited)
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1').strip()
+                if not line:
+                    break
+                key, _, value = line.partition(':')
+                headers[key.strip().lower()] = value.strip()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            writer.close()
+            return
+
+        key = headers.get('sec-websocket-key')
+        if len(request_line) < 2 or headers.get('upgrade', '').lower() != 'websocket' or not key:
+            writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            writer.close()
+            return
+        accept = base64.b64encode(hashlib.sha1((key + _WEBSOCKET_GUID).encode('ascii')).digest()).decode('ascii')
+        writer.write(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                      'Sec-WebSocket-Accept: {}\r\n\r\n').format(accept).encode('latin-1'))
+
+        try:
+            rate = float(parse_qs(urlparse(request_line[1]).query).get('rate', [self.max_rate])[0])
+        except ValueError:
+            rate = self.max_rate
+        subscriber = _Subscriber(writer, min(max(rate, 0.1), self.max_rate), self.queue_size)
+        if self._scenario is not None:
+            subscriber.offer(self._scenario, 0.0, False)
+        self._subscribers.add(subscriber)
+        sender = asyncio.ensure_future(self._send(subscriber))
+        try:
+            await self._receive(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._subscribers.discard(subscriber)
+            sender.cancel()
+            writer.close()
+
+    @staticmethod
+    async def _send(subscriber):
+        try:
+            while True:
+                await subscriber.ready.wait()
+                subscriber.ready.clear()
+                while subscriber.frames:
+                    opcode, payload = subscriber.frames.popleft()
+                    subscriber.writer.write(_websocket_frame(opcode, payload))
+                    # While the client reads slowly the queue fills up and drops its oldest frames
+                    await subscriber.writer.drain()
+        except ConnectionError:
+            pass
+
+    @staticmethod
+    async def _receive(reader, writer):
+        # Client frames are only read for close and ping
+        while True:
+            first, second = await reader.readexactly(2)
+            opcode = first & 0x0F
+            length = second & 0x7F
+            if length == 126:
+                length, = struct.unpack('>H', await reader.readexactly(2))
+            elif length == 127:
+                length, = struct.unpack('>Q', await reader.readexactly(8))
+            mask = await reader.readexactly(4) if second & 0x80 else b'\0\0\0\0'
+            payload = bytes(x ^ mask[i % 4] for i, x in enumerate(await reader.readexactly(length)))
+            if opcode == _CLOSE:
+                writer.write(_websocket_frame(_CLOSE, payload[:2]))
+                return
+            if opcode == _PING:
+                writer.write(_websocket_frame(_PONG, payload))
+
+    def close(self):
+        """
+        Stop the server and drop the subscribers
+        """
+        if self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(2.0)
+        self._loop = None
+
+
+class TelemetryPublisher(object):
+
+    """
+    Publishes the ego vehicle state on every world tick.
+
+    Usage:
+    publisher = TelemetryPublisher(server, world, ego_vehicle, scenario.get_criteria(), name)
+    publisher.start()
+    manager.run_scenario()
+    publisher.stop()
+    """
+
+    def __init__(self, server, world, ego, criteria, name=None):
+        self.server = server
+        self.world = world
+        self.ego = ego
+        self.criteria = list(criteria)
+        self.name = name
+        # RouteCompletionTest keeps the completed percentage of the route
+        self._route_completion = next((x for x in self.criteria if hasattr(x, '_percentage_route_completed')), None)
+        self._callback_id = None
+        self._last_tick = None
+
+    def _statuses(self):
+        return [STATUS_CODES.get(getattr(x, 'test_status', None), UNKNOWN_STATUS) for x in self.criteria]
+
+    def start(self):
+        """
+        Announce the scenario and start sampling
+        """
+        self.stop()     # at most one callback, when started again
+        self.server.announce(name=self.name, criteria=[x.name for x in self.criteria],
+                             statuses=list(STATUSES))
+        self._callback_id = self.world.on_tick(self._on_tick)
+
+    def stop(self):
+        """
+        Stop sampling
+        """
+        if self._callback_id is not None:
+            self.world.remove_on_tick(self._callback_id)
+            self._callback_id = None
+
+    def _on_tick(self, snapshot):
+        now = time.perf_counter()
+        frame_ms = 0.0 if self._last_tick is None else (now - self._last_tick) * 1000.0
+        self._last_tick = now
+        if not self.server.has_subscribers:
+            return
+        try:
+            actor = snapshot.find(self.ego.id)
+            if actor is None:
+                return
+            velocity = actor.get_velocity()
+            control = self.ego.get_control()
+        except RuntimeError:
+            return      # the ego vehicle is gone
+        progress = float('nan')
+        if self._route_completion is not None:
+            progress = self._route_completion._percentage_route_completed / 100.0  # pylint: disable=protected-access
+        self.server.publish(pack_tick(
+            snapshot.frame, snapshot.timestamp.elapsed_seconds,
+            math.sqrt(velocity.x ** 2 + velocity.y ** 2 + velocity.z ** 2),
+            control.throttle, control.brake, control.steer, control.gear, progress, frame_ms, self._statuses()))
+
+
+class FakeTickSource(object):
+
+    """
+    Stand-in world that ticks a synthetic drive, for the screens and tests.
+    It has the on_tick / remove_on_tick of carla.World, an ego vehicle and
+    route criteria.
+
+    Usage:
+    world = FakeTickSource(frame_rate=20.0)
+    publisher = TelemetryPublisher(server, world, world.ego, world.criteria, "Fake drive")
+    publisher.start()
+    world.run(duration=60.0)
+    """
+
+    def __init__(self, frame_rate=20.0, route_length=60.0):
+        self.frame_rate = frame_rate
+        self.route_length = route_length
+        self.frame = 0
+        self.elapsed = 0.0
+        self._callbacks = {}
+        self._next_callback_id = 1
+        self._speed = 0.0
+        self._control = types.SimpleNamespace(throttle=0.0, brake=0.0, steer=0.0, gear=1)
+        self.ego = types.SimpleNamespace(id=1, get_control=lambda: self._control)
+        completion = types.SimpleNamespace(name='RouteCompletionTest', test_status='RUNNING',
+                                           _percentage_route_completed=0.0)
+        collision = types.SimpleNamespace(name='CollisionTest', test_status='SUCCESS')
+        red_light = types.SimpleNamespace(name='RunningRedLightTest', test_status='SUCCESS')
+        self.criteria = [completion, collision, red_light]
+
+    def on_tick(self, callback):
+        callback_id = self._next_callback_id
+        self._next_callback_id += 1
+        self._callbacks[callback_id] = callback
+        return callback_id
+
+    def remove_on_tick(self, callback_id):
+        self._callbacks.pop(callback_id, None)
+
+    def tick(self):
+        """
+        Advance the drive by one frame and call the tick callbacks
+        """
+        delta = 1.0 / self.frame_rate
+        self.frame += 1
+        self.elapsed += delta
+        target = 8.0 + 6.0 * math.sin(self.elapsed / 5.0)
+        self._control.throttle = max(0.0, min(1.0, (target - self._speed) / 4.0))
+        self._control.brake = max(0.0, min(1.0, (self._speed - target) / 4.0))
+        self._control.steer = 0.3 * math.sin(self.elapsed / 3.0)
+        self._control.gear = 1 + int(self._speed // 5.0)
+        self._speed += (self._control.throttle * 3.0 - self._control.brake * 6.0) * delta
+        completion = self.criteria[0]
+        completion._percentage_route_completed = min(100.0, 100.0 * self.elapsed / self.route_length)
+        if completion._percentage_route_completed >= 100.0:
+            completion.test_status = 'SUCCESS'
+
+        velocity = types.SimpleNamespace(x=self._speed, y=0.0, z=0.0)
+        actor = types.SimpleNamespace(get_velocity=lambda: velocity)
+        snapshot = types.SimpleNamespace(frame=self.frame, timestamp=types.SimpleNamespace(elapsed_seconds=self.elapsed),
+                                         find=lambda actor_id: actor if actor_id == self.ego.id else None)
+        for callback in list(self._callbacks.values()):
+            callback(snapshot)
+
+    def run(self, duration=None):
+        """
+        Tick in real time, for duration seconds or forever
+        """
+        start = time.perf_counter()
+        while duration is None or self.elapsed < duration:
+            self.tick()
+            time.sleep(max(0.0, start + self.elapsed - time.perf_counter()))
+
+
+def main():
+    """
+    Serve a synthetic drive
+    """
+    parser = argparse.ArgumentParser(description="Telemetry server fed by a synthetic drive")
+    parser.add_argument('--fake', action='store_true', required=True, help='Publish a synthetic drive')
+    parser.add_argument('--host', default=DEFAULT_LISTEN_HOST, help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', default=DEFAULT_LISTEN_PORT, type=int,
+                        help='Port to listen on (default: {})'.format(DEFAULT_LISTEN_PORT))
+    parser.add_argument('--frameRate', default=20.0, type=float, help='Ticks per second of the drive')
+    parser.add_argument('--maxRate', default=20.0, type=float, help='Highest rate a subscriber can ask for')
+    args = parser.parse_args()
+
+    server = TelemetryServer(args.host, args.port, max_rate=args.maxRate)
+    server.start()
+    world = FakeTickSource(args.frameRate)
+    publisher = TelemetryPublisher(server, world, world.ego, world.criteria, "Fake drive")
+    publisher.start()
+    try:
+        while True:
+            world.run(duration=world.elapsed + world.route_length)
+            world.criteria[0].test_status = 'RUNNING'
+            world.elapsed = 0.0
+            # A new lap is a new scenario for the screens
+            publisher.stop()
+            publisher.start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        publisher.stop()
+        server.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Batch sweeps over stand-in servers. This module is the runner module of
+the spawned workers as well (build_parser / apply_mode_defaults /
+ScenarioRunner): port DEAD_PORT has no server, and the "Broken" scenario
+raises like a scenario with a missing file.
+
+Run from the scenario runner root:
+
+    python3 -m unittest discover -s tests
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import unittest
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(TESTS)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, TESTS)
+
+from batch_runner import (  # noqa: E402  pylint: disable=wrong-import-position
+    BatchRunner, Endpoint, scenario_jobs, sweep_jobs)
+
+DEAD_PORT = 2999
+
+
+def build_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host')
+    parser.add_argument('--port', type=int)
+    parser.add_argument('--trafficManagerPort')
+    parser.add_argument('--scenario')
+    parser.add_argument('--repetitions')
+    parser.add_argument('--outputDir')
+    parser.add_argument('--resultsDb')
+    return parser
+
+
+def apply_mode_defaults(args):
+    return args
+
+
+class StandInClient(object):
+
+    def get_server_version(self):
+        return '0.9.15'
+
+
+class ScenarioRunner(object):
+
+    """
+    Connects to the stand-in server of its port, and runs the scenarios
+    """
+
+    def __init__(self, args):
+        if args.port == DEAD_PORT:
+            raise RuntimeError('time-out while waiting for the simulator')
+        self.client = StandInClient()
+        self.args = args
+
+    def reconfigure(self, args):
+        self.args = args
+
+    def run(self):
+        if self.args.scenario == 'Broken':
+            raise IOError('no such file: Broken.json')
+        return True
+
+    def destroy(self):
+        pass
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self._output = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._output.cleanup()
+
+    def batch(self, *ports):
+        return BatchRunner([Endpoint('127.0.0.1', port) for port in ports], runner_module='test_batch_runner',
+                           output_dir=self._output.name, max_retries=5, retry_delay=0.01)
+
+    def test_job_errors_keep_the_endpoint(self):
+        jobs = scenario_jobs(['Broken'] * 5 + ['Good'] * 2)
+        results = self.batch(2000).run(jobs)
+        self.assertEqual([x['result'] for x in results], [False] * 5 + [True] * 2)
+        self.assertEqual({x['attempts'] for x in results}, {1})
+        self.assertEqual({x['endpoint'] for x in results}, {'127.0.0.1:2000'})
+        self.assertIn('Broken.json', results[0]['error'])
+
+    def test_lost_endpoint_retires(self):
+        results = self.batch(DEAD_PORT, 2000).run(scenario_jobs(['Good'] * 4))
+        self.assertEqual([x['result'] for x in results], [True] * 4)
+        self.assertEqual({x['endpoint'] for x in results}, {'127.0.0.1:2000'})
+
+
+class SweepJobsTest(unittest.TestCase):
+
+    def test_launcher_scenes_only(self):
+        jobs = sweep_jobs(['easy', 'intermediate', 'hard'], None, [0])
+        labels = [x['label'] for x in jobs]
+        self.assertEqual(len(labels), 8)
+        self.assertNotIn('easy scene 3 Town02', labels)
+
+    def test_scenes_filter(self):
+        labels = [x['label'] for x in sweep_jobs(['easy', 'hard'], ['3'], [0, 1])]
+        self.assertEqual(labels, ['hard scene 3 Town02', 'hard scene 3 Town03'])
+
+
+if __name__ == '__main__':
+    unittest.main()
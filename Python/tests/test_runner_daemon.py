@@ -0,0 +1,168 @@
+"""
+Cancelling jobs and preloading towns on the runner daemon, against a
+stand-in runner.
+
+Run from the scenario runner root:
+
+    python3 -m unittest discover -s tests
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from runner_daemon import RunnerDaemon, RunnerJob  # noqa: E402  pylint: disable=wrong-import-position
+
+ROUTES = 3
+PHASES = ('load_world', 'agent_setup', 'ego_spawn', 'scenario_build', 'world_setup', 'run')
+PHASE_TIME = 0.2
+
+
+class FakeRunner(object):
+
+    """
+    ScenarioRunner stand-in: every route goes through the setup phases,
+    and the cancel event is checked at each phase boundary
+    """
+
+    loaded_town = None
+    cancel_delay = 0.0
+
+    def __init__(self, args):
+        self.args = args
+        self.manager = None
+        self.phases = []
+        self.preloads = []
+        self.setup_started = threading.Event()
+        self._cancel_event = threading.Event()
+
+    def reconfigure(self, args, cancel_event=None):
+        self.args = args
+        self._cancel_event = cancel_event or threading.Event()
+
+    def cancel(self, cancel_event=None):
+        (cancel_event or self._cancel_event).set()
+        # Like ScenarioRunner.cancel() waiting for the scenario to start
+        time.sleep(self.cancel_delay)
+
+    def run(self):
+        for route in range(ROUTES):
+            for phase in PHASES:
+                if self._cancel_event.is_set():
+                    return False
+                self.phases.append((route, phase))
+                self.setup_started.set()
+                time.sleep(PHASE_TIME)
+        return True
+
+    def preload_town(self, town):
+        self.preloads.append(town)
+        time.sleep(PHASE_TIME)
+        return True
+
+    def destroy(self):
+        pass
+
+
+def fake_runner_module():
+    parser = types.SimpleNamespace(parse_args=lambda argv: argparse.Namespace(argv=argv))
+    return types.SimpleNamespace(build_parser=lambda: parser, apply_mode_defaults=lambda args: args,
+                                 ScenarioRunner=FakeRunner)
+
+
+class DaemonTest(unittest.TestCase):
+
+    def setUp(self):
+        self._cache = tempfile.TemporaryDirectory()
+        os.environ['DRIVESIM_CACHE_DIR'] = self._cache.name
+        self.daemon = RunnerDaemon([], listen_port=0, runner_module=fake_runner_module(), preload_last=False)
+        self._thread = threading.Thread(target=self.daemon.serve_forever, kwargs={'poll_interval': 0.05})
+        self._thread.start()
+
+    def tearDown(self):
+        self.daemon.stop()
+        self._thread.join(5.0)
+        del os.environ['DRIVESIM_CACHE_DIR']
+        self._cache.cleanup()
+
+    def wait_finished(self, job, timeout=5.0):
+        deadline = time.time() + timeout
+        while job.state in (RunnerJob.QUEUED, RunnerJob.RUNNING) and time.time() < deadline:
+            time.sleep(0.02)
+        return job.state
+
+
+class CancelTest(DaemonTest):
+
+    def test_cancel_during_setup(self):
+        job = self.daemon.submit('Hard', 'Scene 1', 'Town 04')
+        self.assertTrue(self.daemon.runner.setup_started.wait(5.0))
+
+        self.assertTrue(self.daemon.cancel(job.job_id))
+        # Still running until the runner returned
+        status = self.daemon.status(job.job_id)
+        self.assertEqual(status['state'], RunnerJob.RUNNING)
+        self.assertTrue(status['cancel_requested'])
+
+        self.assertEqual(self.wait_finished(job), RunnerJob.CANCELLED)
+        phases = self.daemon.runner.phases
+        self.assertLess(len(phases), len(PHASES))
+        self.assertNotIn('run', [phase for _, phase in phases])
+        self.assertEqual({route for route, _ in phases}, {0})
+
+    def test_cancel_does_not_block_requests(self):
+        job = self.daemon.submit('Hard', 'Scene 1', 'Town 04')
+        self.assertTrue(self.daemon.runner.setup_started.wait(5.0))
+        self.daemon.runner.cancel_delay = 1.0
+        canceller = threading.Thread(target=self.daemon.cancel, args=(job.job_id,))
+        canceller.start()
+        time.sleep(0.1)
+        start = time.time()
+        self.assertTrue(self.daemon.status(job.job_id)['cancel_requested'])
+        self.assertLess(time.time() - start, 0.5)
+        canceller.join()
+        self.assertEqual(self.wait_finished(job), RunnerJob.CANCELLED)
+
+    def test_cancel_queued(self):
+        first = self.daemon.submit('Easy', 'Scene 1', 'Town 02')
+        second = self.daemon.submit('Easy', 'Scene 2', 'Town 03')
+        self.assertTrue(self.daemon.cancel(second.job_id))
+        self.assertEqual(second.state, RunnerJob.CANCELLED)
+        self.assertTrue(self.daemon.cancel(first.job_id))
+        self.assertEqual(self.wait_finished(first), RunnerJob.CANCELLED)
+        time.sleep(0.2)
+        self.assertIsNone(second.started)
+
+    def test_unknown_job(self):
+        self.assertFalse(self.daemon.cancel('unknown'))
+
+
+class PreloadTest(DaemonTest):
+
+    def test_preloads_take_no_job_slot(self):
+        for _ in range(3 * 8):
+            self.daemon.preload('Town 04')
+            self.daemon.preload('Town 05')
+        job = self.daemon.submit('Easy', 'Scene 1', 'Town 02')
+        self.assertEqual(self.wait_finished(job), RunnerJob.DONE)
+
+    def test_repeated_preloads_collapse(self):
+        for _ in range(20):
+            self.daemon.preload('Town 04')
+        deadline = time.time() + 5.0
+        while self.daemon.preload_status()['pending'] is not None or self.daemon.preload_status()['loading']:
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.02)
+        self.assertEqual(self.daemon.runner.preloads, ['Town04'])
+
+
+if __name__ == '__main__':
+    unittest.main()
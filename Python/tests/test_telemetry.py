@@ -0,0 +1,120 @@
+"""
+Binary telemetry frames against the decoder of the right screen
+(right-screen.js), and the synthetic drive of telemetry.py --fake.
+
+Run from the scenario runner root:
+
+    python3 -m unittest discover -s tests
+"""
+
+import os
+import re
+import struct
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import telemetry  # noqa: E402  pylint: disable=wrong-import-position
+
+RIGHT_SCREEN = os.path.join(os.path.dirname(ROOT), 'right-screen.js')
+
+# unpack_tick key -> (field of the JS decoder, struct format of the field)
+FIELDS = {'frame': ('frame', '<I'), 'time': ('time', '<d'), 'speed': ('speed', '<f'),
+          'throttle': ('throttle', '<f'), 'brake': ('brake', '<f'), 'steer': ('steer', '<f'),
+          'gear': ('gear', '<b'), 'progress': ('progress', '<f'), 'frame_ms': ('frameMs', '<f')}
+JS_TYPES = {'Uint8': 'B', 'Int8': 'b', 'Uint32': 'I', 'Float32': 'f', 'Float64': 'd'}
+
+
+def js_layout():
+    """
+    Header size and field -> (offset, struct type) of the decoder of the right screen
+    """
+    with open(RIGHT_SCREEN) as fd:
+        source = fd.read()
+    header_size = int(re.search(r'TELEMETRY_HEADER_SIZE\s*=\s*(\d+)', source).group(1))
+    fields = {name: (int(offset), JS_TYPES[kind]) for name, kind, offset in
+              re.findall(r'(\w+):\s*view\.get(\w+)\((\d+)', source)}
+    version = re.search(r'view\.getUint8\((\d+)\)\s*!==\s*TELEMETRY_VERSION', source).group(1)
+    count = re.search(r'count\s*=\s*view\.getUint8\((\d+)\)', source).group(1)
+    return header_size, int(version), int(count), fields
+
+
+def offsets():
+    """
+    Offset of every field of telemetry.TICK, in packing order
+    """
+    result, offset = [], 0
+    for code in telemetry.TICK.format.lstrip('<'):
+        result.append((offset, code))
+        offset += struct.calcsize('<' + code)
+    return result
+
+
+class TickLayoutTest(unittest.TestCase):
+
+    def test_header_size(self):
+        header_size, _, _, _ = js_layout()
+        self.assertEqual(telemetry.TICK.size, header_size)
+
+    def test_field_offsets(self):
+        _, version, count, fields = js_layout()
+        layout = offsets()
+        self.assertEqual(layout[0], (version, 'B'))
+        self.assertEqual(layout[-1], (count, 'B'))
+        packed = dict(zip(['frame', 'time', 'speed', 'throttle', 'brake', 'steer', 'gear', 'progress',
+                           'frame_ms'], layout[1:-1]))
+        for key, (js_name, fmt) in FIELDS.items():
+            self.assertEqual(fields[js_name], (packed[key][0], fmt[1]), key)
+
+    def test_round_trip(self):
+        data = telemetry.pack_tick(12345, 67.5, 8.25, 0.5, 0.0, -0.25, 3, 0.75, 16.5, [1, 2, 255])
+        self.assertEqual(len(data), telemetry.TICK.size + 3)
+        self.assertEqual(telemetry.unpack_tick(data),
+                         {'frame': 12345, 'time': 67.5, 'speed': 8.25, 'throttle': 0.5, 'brake': 0.0,
+                          'steer': -0.25, 'gear': 3, 'progress': 0.75, 'frame_ms': 16.5,
+                          'statuses': [1, 2, 255]})
+
+    def test_decoder_offsets(self):
+        # Read the frame back the way the right screen does
+        _, _, count_offset, fields = js_layout()
+        data = telemetry.pack_tick(7, 1.5, 2.5, 0.25, 0.125, 0.5, -1, 0.5, 50.0, [2, 3])
+        decoded = {name: struct.unpack_from('<' + code, data, offset)[0] for name, (offset, code) in fields.items()}
+        self.assertEqual(decoded, {'frame': 7, 'time': 1.5, 'speed': 2.5, 'throttle': 0.25, 'brake': 0.125,
+                                   'steer': 0.5, 'gear': -1, 'progress': 0.5, 'frameMs': 50.0})
+        self.assertEqual(data[count_offset], 2)
+
+
+class FakeDriveTest(unittest.TestCase):
+
+    class Server(object):
+
+        has_subscribers = True
+
+        def __init__(self):
+            self.frames = []
+
+        def announce(self, **_):
+            pass
+
+        def publish(self, data):
+            self.frames.append(data)
+
+    def test_restart_keeps_one_callback(self):
+        server = self.Server()
+        world = telemetry.FakeTickSource()
+        publisher = telemetry.TelemetryPublisher(server, world, world.ego, world.criteria, "Fake drive")
+        for _ in range(3):
+            publisher.stop()
+            publisher.start()
+        publisher.start()
+        world.tick()
+        self.assertEqual(len(server.frames), 1)
+        publisher.stop()
+        world.tick()
+        self.assertEqual(len(server.frames), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
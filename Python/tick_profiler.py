@@ -0,0 +1,211 @@
+"""
+Latency profiler of the scenario tick loop.
+
+ScenarioManager.run_scenario() calls _tick_scenario() once per
+simulation frame, which steps the agent, ticks the behavior tree (and
+with it the criteria) and, in synchronous mode, ticks the world. The
+profiler wraps these calls on one manager instance and records, for
+every frame:
+
+- period: wall time since the previous frame
+- total: duration of _tick_scenario()
+- agent: the agent step
+- tree: the behavior tree tick
+- world: the rest (world tick, CarlaDataProvider update, ego control)
+
+The samples go to a preallocated ring buffer, so a long scenario costs
+no allocation per tick and keeps its last `capacity` frames.
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import time
+
+import numpy as np
+
+PROFILES_FILE = 'tick_profiles.jsonl'
+
+COLUMNS = ('period', 'total', 'agent', 'tree', 'world')
+
+# Histogram bin edges of the tick durations, in milliseconds
+HISTOGRAM_EDGES_MS = (0, 5, 10, 20, 30, 40, 50, 75, 100, 150, 250, 500, np.inf)
+
+
+class _TimedAgent(object):
+
+    """
+    Agent wrapper proxy that times its calls
+    """
+
+    def __init__(self, agent, profiler):
+        self._agent = agent
+        self._profiler = profiler
+
+    def __call__(self):
+        start = time.perf_counter()
+        try:
+            return self._agent()
+        finally:
+            self._profiler.agent_time += time.perf_counter() - start
+
+    def __getattr__(self, name):
+        return getattr(self._agent, name)
+
+
+class TickProfiler(object):
+
+    """
+    Per tick durations of a scenario run.
+
+    Usage:
+    profiler = TickProfiler(frame_rate=20.0)
+    profiler.install(manager)    # after manager.load_scenario()
+    try:
+        manager.run_scenario()
+    finally:
+        profiler.uninstall()
+    print(profiler)
+    """
+
+    def __init__(self, frame_rate=20.0, capacity=1 << 16):
+        self.budget = 1.0 / frame_rate
+        self.capacity = capacity
+        self._samples = np.zeros((capacity, len(COLUMNS)), dtype=np.float64)
+        self.count = 0
+        self.agent_time = 0.0
+        self._tree_time = 0.0
+        self._tree_ticked = False
+        self._last_tick = None
+        self._manager = None
+        self._tree = None
+
+    def install(self, manager):
+        """
+        Wrap the tick, agent and behavior tree of a manager with a loaded scenario
+        """
+        self._manager = manager
+        tick_scenario = manager._tick_scenario          # pylint: disable=protected-access
+        tick_once = manager.scenario_tree.tick_once
+
+        def timed_tick_scenario(timestamp):
+            self.agent_time = 0.0
+            self._tree_time = 0.0
+            self._tree_ticked = False
+            start = time.perf_counter()
+            tick_scenario(timestamp)
+            end = time.perf_counter()
+            # In asynchronous mode the loop spins until a new frame arrives, only count the real ticks
+            if self._tree_ticked:
+                period = 0.0 if self._last_tick is None else start - self._last_tick
+                self._last_tick = start
+                self._record(period, end - start)
+
+        def timed_tick_once(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return tick_once(*args, **kwargs)
+            finally:
+                self._tree_time += time.perf_counter() - start
+                self._tree_ticked = True
+
+        self._tree = manager.scenario_tree
+        self._tree.tick_once = timed_tick_once
+        manager._tick_scenario = timed_tick_scenario    # pylint: disable=protected-access
+        if manager._agent is not None:                  # pylint: disable=protected-access
+            manager._agent = _TimedAgent(manager._agent, self)  # pylint: disable=protected-access
+
+    def uninstall(self):
+        """
+        Give the manager its own methods back
+        """
+        manager, self._manager = self._manager, None
+        if manager is None:
+            return
+        manager.__dict__.pop('_tick_scenario', None)
+        self._tree.__dict__.pop('tick_once', None)
+        self._tree = None
+        if isinstance(manager._agent, _TimedAgent):     # pylint: disable=protected-access
+            manager._agent = manager._agent._agent      # pylint: disable=protected-access
+
+    def _record(self, period, total):
+        row = self._samples[self.count % self.capacity]
+        row[0] = period
+        row[1] = total
+        row[2] = self.agent_time
+        row[3] = self._tree_time
+        row[4] = total - self.agent_time - self._tree_time
+        self.count += 1
+
+    @property
+    def samples(self):
+        """
+        The recorded samples (in seconds), oldest first
+        """
+        if self.count <= self.capacity:
+            return self._samples[:self.count]
+        start = self.count % self.capacity
+        return np.concatenate([self._samples[start:], self._samples[:start]])
+
+    def report(self):
+        """
+        Percentiles (in ms) of every column, histogram of the tick durations
+        and the frames that broke the real time budget
+        """
+        samples = self.samples * 1000.0
+        report = {'ticks': self.count, 'kept': len(samples), 'budget_ms': self.budget * 1000.0}
+        if len(samples) == 0:
+            return report
+
+        for i, column in enumerate(COLUMNS):
+            values = samples[1:, i] if column == 'period' else samples[:, i]
+            if len(values) == 0:
+                continue
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            report[column] = {'mean': float(values.mean()), 'p50': float(p50), 'p95': float(p95),
+                              'p99': float(p99), 'max': float(values.max())}
+
+        counts, _ = np.histogram(samples[:, 1], bins=np.array(HISTOGRAM_EDGES_MS, dtype=np.float64))
+        report['histogram'] = {'edges_ms': [float(x) for x in HISTOGRAM_EDGES_MS[:-1]],
+                               'counts': counts.tolist()}
+        over = samples[:, 1] > self.budget * 1000.0
+        report['over_budget'] = int(over.sum())
+        report['over_budget_ratio'] = float(over.mean())
+        if len(samples) > 1:
+            # Simulated time / wall time, below 1 the loop is slower than real time
+            report['realtime_factor'] = float(self.budget * 1000.0 / max(samples[1:, 0].mean(), 1e-9))
+        return report
+
+    def save(self, output_dir, **fields):
+        """
+        Append the report, with the given fields, to the profiles file of the output directory
+        """
+        output_dir = output_dir or '.'
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, PROFILES_FILE)
+        record = dict(fields)
+        record.update(self.report())
+        with open(path, 'a', encoding='utf-8') as fp:
+            fp.write(json.dumps(record, separators=(',', ':')) + '\n')
+        return path
+
+    def __str__(self):
+        report = self.report()
+        lines = ["Tick profile: {} ticks, {} over the {:.1f} ms budget".format(
+            report['ticks'], report.get('over_budget', 0), report['budget_ms'])]
+        if 'realtime_factor' in report:
+            lines[0] += ", {:.2f}x real time".format(report['realtime_factor'])
+        lines.append("  {:<8}{:>10}{:>10}{:>10}{:>10}{:>10}".format("ms", "mean", "p50", "p95", "p99", "max"))
+        for column in COLUMNS:
+            if column in report:
+                stats = report[column]
+                lines.append("  {:<8}{:>10.2f}{:>10.2f}{:>10.2f}{:>10.2f}{:>10.2f}".format(
+                    column, stats['mean'], stats['p50'], stats['p95'], stats['p99'], stats['max']))
+        if 'histogram' in report:
+            edges = report['histogram']['edges_ms']
+            for i, count in enumerate(report['histogram']['counts']):
+                if count:
+                    upper = "{:g}".format(edges[i + 1]) if i + 1 < len(edges) else "inf"
+                    lines.append("  {:>5g}-{:<5} ms {:>7}".format(edges[i], upper, count))
+        return "\n".join(lines)
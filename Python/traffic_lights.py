@@ -0,0 +1,145 @@
+"""
+Traffic light policies.
+
+The traffic lights of a map are indexed once (actors and locations)
+and the policy of the level / scene is applied to
+them in one pass:
+
+- all_green: every light is green and frozen
+- realistic: the regular cycles, with the configured timings
+- green_wave: the lights along the route turn green in sequence, timed
+  for a driver going at `wave_speed`, the others follow regular cycles
+
+The policies come from traffic_light_policies.json, looked up by
+"<level>-<scene>", then "<level>", then "default".
+"""
+
+from __future__ import print_function
+
+import json
+import os
+
+import numpy as np
+
+import carla
+
+POLICIES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'traffic_light_policies.json')
+
+DEFAULT_POLICY = {'policy': 'all_green'}
+
+_INDEXES = {}
+
+
+def load_policy(level=None, scene=None, policies_file=POLICIES_FILE):
+    """
+    Policy of a level and scene
+    """
+    policies = {}
+    if os.path.isfile(policies_file):
+        with open(policies_file, 'r', encoding='utf-8') as fp:
+            policies = json.load(fp)
+
+    keys = []
+    if level and scene:
+        keys.append('{}-{}'.format(level, scene).lower())
+    if level:
+        keys.append(level.lower())
+    keys.append('default')
+    for key in keys:
+        if key in policies:
+            return policies[key]
+    return DEFAULT_POLICY
+
+
+class TrafficLightIndex(object):
+
+    """
+    Traffic lights of one loaded map.
+
+    Usage:
+    index = TrafficLightIndex.for_world(world)
+    index.apply(load_policy(level, scene), route)
+    """
+
+    route_radius = 30.0     # in meters, lights closer than this to the route are on the route
+
+    def __init__(self, world):
+        self._world = world
+        self.lights = list(world.get_actors().filter('traffic.traffic_light'))
+        self.locations = np.array([(x.get_location().x, x.get_location().y) for x in self.lights],
+                                  dtype=np.float64).reshape(-1, 2)
+        # light id -> (green, yellow, red), to skip the timings that are already set
+        self._timings = {}
+
+    @classmethod
+    def for_world(cls, world):
+        """
+        Index of the loaded map, built once per episode
+        """
+        index = _INDEXES.get(world.id)
+        if index is None:
+            _INDEXES.clear()
+            index = _INDEXES[world.id] = cls(world)
+        return index
+
+    def _set_timings(self, light, green, yellow, red):
+        timings = (green, yellow, red)
+        if self._timings.get(light.id) == timings:
+            return
+        light.set_green_time(green)
+        light.set_yellow_time(yellow)
+        light.set_red_time(red)
+        self._timings[light.id] = timings
+
+    def _route_lights(self, route):
+        """
+        (distance along the route, light) of the lights next to the route, in route order
+        """
+        points = np.array([(x.x, x.y) for x in route], dtype=np.float64).reshape(-1, 2)
+        if len(points) == 0 or len(self.lights) == 0:
+            return []
+        along = np.concatenate([[0.0], np.cumsum(np.linalg.norm(np.diff(points, axis=0), axis=1))])
+        squared = np.sum((self.locations[:, None, :] - points[None, :, :]) ** 2, axis=-1)
+        closest = np.argmin(squared, axis=1)
+        near = np.min(squared, axis=1) <= self.route_radius ** 2
+        return sorted((along[closest[i]], self.lights[i]) for i in np.flatnonzero(near))
+
+    def all_green(self):
+        self._world.freeze_all_traffic_lights(False)
+        for light in self.lights:
+            light.set_state(carla.TrafficLightState.Green)
+        self._world.freeze_all_traffic_lights(True)
+
+    def realistic(self, green=10.0, yellow=3.0, red=2.0):
+        self._world.freeze_all_traffic_lights(False)
+        for light in self.lights:
+            self._set_timings(light, green, yellow, red)
+        self._world.reset_all_traffic_lights()
+
+    def green_wave(self, route, wave_speed=8.0, green=10.0, yellow=3.0, red=2.0):
+        self.realistic(green, yellow, red)
+        for distance, light in self._route_lights(route):
+            # Green from now until a driver at wave_speed has gone through
+            light.set_state(carla.TrafficLightState.Green)
+            light.set_green_time(green + distance / wave_speed)
+            self._timings.pop(light.id, None)
+
+    def apply(self, policy, route=None):
+        """
+        Apply a policy dictionary, as stored in the policies file
+        """
+        name = policy.get('policy', 'all_green')
+        timings = {key: float(policy[key]) for key in ('green', 'yellow', 'red') if key in policy}
+        if name == 'all_green':
+            self.all_green()
+        elif name == 'realistic':
+            self.realistic(**timings)
+        elif name == 'green_wave':
+            if not route:
+                print("No route to build a green wave on, using realistic cycles")
+                self.realistic(**timings)
+            else:
+                self.green_wave(route, float(policy.get('wave_speed', 8.0)), **timings)
+        else:
+            raise ValueError("Unknown traffic light policy: {}".format(name))
+        print("Traffic lights: {} policy on {} lights".format(name, len(self.lights)))
@@ -0,0 +1,335 @@
+"""
+Traffic population planner.
+
+The whole difficulty profile (Indic vehicle categories and walkers) is
+turned into one spawn plan. Vehicles and walkers are spawned by a single
+batch, the walker AI controllers by a second one, as they need the ids
+of their walkers. With a navigation pool, walkers get well separated
+spawn points and the few that still fail are retried once.
+"""
+
+from __future__ import print_function
+
+import random
+
+import carla
+
+import difficulty_profiles
+
+PERCENTAGE_PEDESTRIANS_RUNNING = 0.0      # how many pedestrians will run
+PERCENTAGE_PEDESTRIANS_CROSSING = 20.0    # how many pedestrians will walk through the road
+
+
+class PopulationProfile(object):
+
+    """
+    Requested number of vehicles per category and of walkers
+    """
+
+    def __init__(self, vehicles=None, walkers=0):
+        # category -> count, in spawn order
+        self.vehicles = vehicles or {}
+        self.walkers = walkers
+
+    @staticmethod
+    def from_args(args):
+        """
+        Build the profile from the scenario_runner.py arguments
+        """
+        vehicles = {}
+        if args.spawn_vehicle:
+            for category in difficulty_profiles.VEHICLE_CATEGORIES:
+                if getattr(args, 'spawn_vehicle_{}'.format(category)):
+                    vehicles[category] = getattr(args, 'num_vehicles_{}'.format(category))
+        walkers = args.num_walkers if args.spawn_pedestrians else 0
+        return PopulationProfile(vehicles, walkers)
+
+    @staticmethod
+    def blueprint_pattern(category):
+        """
+        Blueprint filter of a vehicle category ("Indic_TwoWheeler" -> "vehicle.indic_twowheeler.*")
+        """
+        return "vehicle.{}.*".format(category.lower())
+
+
+class CategoryResult(object):
+
+    """
+    Spawn outcome of one category
+    """
+
+    def __init__(self, category, requested):
+        self.category = category
+        self.requested = requested
+        self.planned = 0
+        self.spawned = 0
+        self.failed = 0
+
+    def __repr__(self):
+        return "{}: {}/{} spawned, {} failed".format(self.category, self.spawned, self.requested, self.failed)
+
+
+class PopulationResult(object):
+
+    """
+    Spawn outcome of a whole profile
+    """
+
+    def __init__(self):
+        self.categories = {}
+        self.vehicle_ids = []
+        self.walker_ids = []
+        self.controller_ids = []
+        self.batches = 0
+
+    def category(self, name, requested=0):
+        if name not in self.categories:
+            self.categories[name] = CategoryResult(name, requested)
+        return self.categories[name]
+
+    @property
+    def spawned(self):
+        return sum(x.spawned for x in self.categories.values())
+
+    @property
+    def failed(self):
+        return sum(x.failed for x in self.categories.values())
+
+    def summary(self):
+        return "Population: {} spawned, {} failed in {} batches ({})".format(
+            self.spawned, self.failed, self.batches,
+            ", ".join(repr(x) for x in self.categories.values()))
+
+
+class SpawnPlan(object):
+
+    """
+    Resolved spawn requests, ready to be submitted
+    """
+
+    def __init__(self):
+        # (category, blueprint, attributes, transform)
+        self.vehicles = []
+        # (blueprint, attributes, transform, max speed, target location)
+        self.walkers = []
+
+
+class PopulationPlanner(object):
+
+    """
+    Plans and spawns the traffic population of a profile.
+
+    Usage:
+    planner = PopulationPlanner(client, world, catalog, traffic_manager, synchronous_master, navigation)
+    result = planner.populate(profile, allocator.allocate(profile.vehicles))
+    """
+
+    WALKERS = 'walkers'
+
+    def __init__(self, client, world, catalog, traffic_manager, synchronous_master, navigation=None):
+        self._client = client
+        self._world = world
+        self._catalog = catalog
+        self._tm = traffic_manager
+        self._synchronous_master = synchronous_master
+        self._navigation = navigation
+
+    def _walker_locations(self, number):
+        if self._navigation is not None:
+            return self._navigation.spawn_locations(number)
+        locations = [self._world.get_random_location_from_navigation() for _ in range(number)]
+        return [x for x in locations if x is not None]
+
+    def _walker_targets(self, number):
+        if self._navigation is not None:
+            return self._navigation.targets(number)
+        return [self._world.get_random_location_from_navigation() for _ in range(number)]
+
+    def plan(self, profile, vehicle_transforms):
+        """
+        Pick blueprints, attributes and transforms for every requested actor.
+        vehicle_transforms maps each category to its allocated spawn transforms.
+        """
+        plan = SpawnPlan()
+
+        for category, number in profile.vehicles.items():
+            blueprints = self._catalog.filter(PopulationProfile.blueprint_pattern(category), "All")
+            if not blueprints:
+                print("No blueprints found for {}".format(category))
+                continue
+            for transform in vehicle_transforms.get(category, [])[:number]:
+                blueprint = random.choice(blueprints)
+                attributes = {}
+                if blueprint.has_attribute('color'):
+                    attributes['color'] = random.choice(blueprint.get_attribute('color').recommended_values)
+                if blueprint.has_attribute('driver_id'):
+                    attributes['driver_id'] = random.choice(blueprint.get_attribute('driver_id').recommended_values)
+                plan.vehicles.append((category, blueprint, attributes, transform))
+
+        if profile.walkers:
+            blueprints = self._catalog.filter("walker.pedestrian.*", "All")
+            locations = self._walker_locations(profile.walkers)
+            for location, target in zip(locations, self._walker_targets(len(locations))):
+                walker_bp = random.choice(blueprints)
+                attributes = {}
+                # set as not invincible
+                if walker_bp.has_attribute('is_invincible'):
+                    attributes['is_invincible'] = 'false'
+                # set the max speed
+                if walker_bp.has_attribute('speed'):
+                    if random.random() > PERCENTAGE_PEDESTRIANS_RUNNING:
+                        # walking
+                        speed = walker_bp.get_attribute('speed').recommended_values[1]
+                    else:
+                        # running
+                        speed = walker_bp.get_attribute('speed').recommended_values[2]
+                else:
+                    print("Walker has no speed")
+                    speed = 0.0
+                plan.walkers.append((walker_bp, attributes, carla.Transform(location), float(speed), target))
+
+        return plan
+
+    def execute(self, plan, profile):
+        """
+        Submit a plan with the fewest possible batches
+        """
+        SpawnActor = carla.command.SpawnActor
+        SetAutopilot = carla.command.SetAutopilot
+        FutureActor = carla.command.FutureActor
+
+        result = PopulationResult()
+        for category, number in profile.vehicles.items():
+            result.category(category, number)
+        if profile.walkers:
+            result.category(self.WALKERS, profile.walkers)
+
+        # 1. vehicles (with their autopilot) and walkers together.
+        # Blueprints are shared, so their attributes are set right before
+        # each command is created, as the command copies them.
+        batch = []
+        for category, blueprint, attributes, transform in plan.vehicles:
+            result.category(category).planned += 1
+            for key, value in attributes.items():
+                blueprint.set_attribute(key, value)
+            batch.append(SpawnActor(blueprint, transform).then(SetAutopilot(FutureActor, True, self._tm.get_port())))
+        for blueprint, attributes, transform, _, _ in plan.walkers:
+            result.category(self.WALKERS).planned += 1
+            for key, value in attributes.items():
+                blueprint.set_attribute(key, value)
+            batch.append(SpawnActor(blueprint, transform))
+        if not batch:
+            return result
+
+        responses = self._client.apply_batch_sync(batch, self._synchronous_master)
+        result.batches += 1
+
+        walker_params = []
+        failed_walkers = []
+        for i, response in enumerate(responses):
+            if i < len(plan.vehicles):
+                category_result = result.category(plan.vehicles[i][0])
+            else:
+                category_result = result.category(self.WALKERS)
+            if response.error:
+                print(response.error)
+                category_result.failed += 1
+                if i >= len(plan.vehicles):
+                    failed_walkers.append(plan.walkers[i - len(plan.vehicles)])
+                continue
+            category_result.spawned += 1
+            if i < len(plan.vehicles):
+                result.vehicle_ids.append(response.actor_id)
+            else:
+                result.walker_ids.append(response.actor_id)
+                walker_params.append(plan.walkers[i - len(plan.vehicles)][3:])
+
+        if failed_walkers and self._navigation is not None:
+            walker_params += self._retry_walkers(failed_walkers, result)
+
+        for category_result in result.categories.values():
+            category_result.failed += category_result.requested - category_result.planned
+
+        if result.walker_ids:
+            self._start_walkers(result, walker_params)
+
+        return result
+
+    def _retry_walkers(self, failed_walkers, result):
+        """
+        Spawn the walkers that collided once more, on fresh locations
+        """
+        SpawnActor = carla.command.SpawnActor
+
+        batch = []
+        params = []
+        for (blueprint, attributes, _, speed, target), location in zip(
+                failed_walkers, self._walker_locations(len(failed_walkers))):
+            for key, value in attributes.items():
+                blueprint.set_attribute(key, value)
+            batch.append(SpawnActor(blueprint, carla.Transform(location)))
+            params.append((speed, target))
+        if not batch:
+            return []
+
+        responses = self._client.apply_batch_sync(batch, self._synchronous_master)
+        result.batches += 1
+
+        walkers = result.category(self.WALKERS)
+        spawned_params = []
+        for response, param in zip(responses, params):
+            if response.error:
+                print(response.error)
+                continue
+            walkers.failed -= 1
+            walkers.spawned += 1
+            result.walker_ids.append(response.actor_id)
+            spawned_params.append(param)
+        return spawned_params
+
+    def _start_walkers(self, result, walker_params):
+        """
+        walker_params holds the (max speed, target) of each spawned walker
+        """
+        SpawnActor = carla.command.SpawnActor
+
+        # 2. the walker controllers
+        walker_controller_bp = self._catalog.find('controller.ai.walker')
+        batch = [SpawnActor(walker_controller_bp, carla.Transform(), x) for x in result.walker_ids]
+        responses = self._client.apply_batch_sync(batch, self._synchronous_master)
+        result.batches += 1
+
+        controllers = []
+        for response, param in zip(responses, walker_params):
+            if response.error:
+                print(response.error)
+            else:
+                controllers.append((response.actor_id,) + tuple(param))
+        result.controller_ids = [x[0] for x in controllers]
+
+        # wait for a tick to ensure client receives the last transform of the walkers we have just created
+        if not self._synchronous_master:
+            self._world.wait_for_tick()
+        else:
+            self._world.tick()
+
+        # 3. initialize each controller and set target to walk to
+        # set how many pedestrians can cross the road
+        self._world.set_pedestrians_cross_factor(PERCENTAGE_PEDESTRIANS_CROSSING)
+        actors = {x.id: x for x in self._world.get_actors(result.controller_ids)}
+        for controller_id, speed, target in controllers:
+            controller = actors[controller_id]
+            # start walker
+            controller.start()
+            # set walk to random point
+            controller.go_to_location(target)
+            # max speed
+            controller.set_max_speed(speed)
+
+    def populate(self, profile, vehicle_transforms):
+        """
+        Plan and spawn a profile
+        """
+        result = self.execute(self.plan(profile, vehicle_transforms), profile)
+        print(result.summary())
+        return result
@@ -0,0 +1,100 @@
+"""
+In-place world reset between routes and repetitions.
+
+client.load_world() takes tens of seconds. When the requested town is
+already loaded, it is enough to destroy the actors the runner spawned
+and to restore the settings, traffic lights and weather the map had
+right after it was loaded.
+"""
+
+from __future__ import print_function
+
+import carla
+
+
+def map_name(world):
+    """
+    Short name of the loaded map ("Carla/Maps/Town04" -> "Town04")
+    """
+    return world.get_map().name.split('/')[-1]
+
+
+class WorldResetter(object):
+
+    """
+    Hands out a clean world for a town, reloading the map only if needed.
+
+    Usage:
+    resetter = WorldResetter(client)
+    world = resetter.prepare("Town04")
+    resetter.track(spawned_actor_ids)
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._town = None
+        self._settings = None
+        self._weather = None
+        self._actor_ids = []
+        self._controller_ids = []
+
+    @property
+    def town(self):
+        """
+        Town of the current baseline, None before the first load
+        """
+        return self._town
+
+    def track(self, actor_ids, controllers=False):
+        """
+        Remember actors spawned by the runner so the next reset removes them.
+        AI walker controllers are passed with controllers=True, as they are
+        stopped before being destroyed.
+        """
+        if controllers:
+            self._controller_ids.extend(actor_ids)
+        else:
+            self._actor_ids.extend(actor_ids)
+
+    def prepare(self, town, force_reload=False):
+        """
+        Return a world with the given town in its freshly loaded state
+        """
+        world = self._client.get_world()
+        if force_reload or self._town != town or map_name(world) != town:
+            return self._load(town)
+
+        self._reset(world)
+        return world
+
+    def _load(self, town):
+        world = self._client.load_world(town)
+        self._town = town
+        self._settings = world.get_settings()
+        self._weather = world.get_weather()
+        self._actor_ids = []
+        self._controller_ids = []
+        return world
+
+    def _reset(self, world):
+        print("Town {} already loaded, resetting it in place".format(self._town))
+
+        if self._controller_ids:
+            for controller in world.get_actors(self._controller_ids):
+                controller.stop()
+
+        actor_ids = self._controller_ids + self._actor_ids
+        if actor_ids:
+            self._client.apply_batch_sync([carla.command.DestroyActor(x) for x in actor_ids])
+        self._actor_ids = []
+        self._controller_ids = []
+
+        world.apply_settings(self._settings)
+        world.reset_all_traffic_lights()
+        world.set_weather(self._weather)
+
+        # Let the destruction and the new settings reach the server
+        if self._settings.synchronous_mode:
+            world.tick()
+        else:
+            world.wait_for_tick()
@@ -2,4 +2,92 @@ window.addEventListener('message', function(event) {
     if (event.data.type === 'updateInfo') {
         document.getElementById('infoDisplay').textContent = event.data.content;
     }
-});
\ No newline at end of file
+});
+
+// Live ego telemetry of the running scenario (scenario_runner.py --telemetry 2102), see Python/telemetry.py
+const TELEMETRY_URL = 'ws://127.0.0.1:2102/?rate=10';
+const TELEMETRY_VERSION = 1;
+const TELEMETRY_HEADER_SIZE = 39;
+const TELEMETRY_RETRY_MAX = 10000;
+const CRITERIA_COLORS = {INIT: 'text-gray-500', RUNNING: 'text-blue-600', SUCCESS: 'text-green-600',
+                         FAILURE: 'text-red-600', ACCEPTABLE: 'text-yellow-600'};
+
+let telemetryScenario = {criteria: [], statuses: []};
+let telemetryRetry = 1000;
+
+function connectTelemetry() {
+    const socket = new WebSocket(TELEMETRY_URL);
+    socket.binaryType = 'arraybuffer';
+    socket.onopen = () => { telemetryRetry = 1000; };
+    socket.onmessage = (event) => {
+        if (typeof event.data === 'string') {
+            showTelemetryScenario(JSON.parse(event.data));
+        } else {
+            showTelemetryFrame(decodeTelemetry(event.data));
+        }
+    };
+    socket.onclose = () => {
+        document.getElementById('telemetry').classList.add('hidden');
+        // The runner is not always up, retry less and less often
+        setTimeout(connectTelemetry, telemetryRetry);
+        telemetryRetry = Math.min(telemetryRetry * 2, TELEMETRY_RETRY_MAX);
+    };
+}
+
+function decodeTelemetry(buffer) {
+    const view = new DataView(buffer);
+    if (view.getUint8(0) !== TELEMETRY_VERSION) {
+        return null;
+    }
+    const count = view.getUint8(38);
+    return {
+        frame: view.getUint32(1, true),
+        time: view.getFloat64(5, true),
+        speed: view.getFloat32(13, true),
+        throttle: view.getFloat32(17, true),
+        brake: view.getFloat32(21, true),
+        steer: view.getFloat32(25, true),
+        gear: view.getInt8(29),
+        progress: view.getFloat32(30, true),
+        frameMs: view.getFloat32(34, true),
+        statuses: Array.from(new Uint8Array(buffer, TELEMETRY_HEADER_SIZE, count)),
+    };
+}
+
+function showTelemetryScenario(scenario) {
+    telemetryScenario = scenario;
+    document.getElementById('telemetryScenario').textContent = scenario.name || '';
+    const list = document.getElementById('telemetryCriteria');
+    list.innerHTML = '';
+    scenario.criteria.forEach((name) => {
+        const item = document.createElement('li');
+        item.textContent = name;
+        list.appendChild(item);
+    });
+}
+
+function showTelemetryFrame(frame) {
+    if (!frame) {
+        return;
+    }
+    document.getElementById('telemetry').classList.remove('hidden');
+    document.getElementById('telemetrySpeed').textContent = Math.round(frame.speed * 3.6);
+    document.getElementById('telemetryGear').textContent = frame.gear < 0 ? 'R' : (frame.gear === 0 ? 'N' : frame.gear);
+
+    const known = !Number.isNaN(frame.progress);
+    const percent = known ? Math.round(frame.progress * 100) : 0;
+    document.getElementById('telemetryProgress').style.width = `${percent}%`;
+    document.getElementById('telemetryProgressText').textContent = known ? `${percent}%` : '-';
+
+    const items = document.getElementById('telemetryCriteria').children;
+    frame.statuses.forEach((code, i) => {
+        if (i < items.length) {
+            const status = telemetryScenario.statuses[code] || 'UNKNOWN';
+            items[i].className = CRITERIA_COLORS[status] || 'text-gray-500';
+            items[i].textContent = `${telemetryScenario.criteria[i]}: ${status}`;
+        }
+    });
+    document.getElementById('telemetryFrameTime').textContent = `Frame ${frame.frame}, ${frame.frameMs.toFixed(1)} ms`;
+}
+
+connectTelemetry();
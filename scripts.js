@@ -1,5 +1,10 @@
 let leftWindow, rightWindow;
 
+// Local job API (Python/job_api.py), it runs the scenarios and reports their state
+const JOB_API = 'http://127.0.0.1:2101';
+const WEB_AGENT = 'srunner/autoagents/human_agent.py';
+const JOB_POLL_INTERVAL = 2000;
+
 function deployScreens() {
     leftWindow = window.open('left.html', 'leftScreen', 'width=1920,height=1080,left=0,top=0',);
     rightWindow = window.open('right.html', 'rightScreen', 'width=1920,height=1080,left=0,top=0');
@@ -40,10 +45,46 @@ function closeApp() {
     window.close();
 }
 
+function submitJob(job, label) {
+    fetch(`${JOB_API}/jobs`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(job)
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.error) {
+            updateRightScreen(`${label}: ${data.error}`);
+            return;
+        }
+        watchJob(data.job.job_id, label);
+    })
+    .catch(error => updateRightScreen(`${label}: job API not reachable (${error})`));
+}
+
+function watchJob(jobId, label) {
+    fetch(`${JOB_API}/jobs/${jobId}`)
+    .then(response => response.json())
+    .then(data => {
+        const job = data.job;
+        const position = job.state === 'queued' ? ` (${job.position} ahead)` : '';
+        updateRightScreen(`${label}: ${job.state}${position}`);
+        if (job.state === 'queued' || job.state === 'running') {
+            setTimeout(() => watchJob(jobId, label), JOB_POLL_INTERVAL);
+        }
+    })
+    .catch(error => console.log(error));
+}
+
+function updateRightScreen(content) {
+    console.log(content);
+    if (rightWindow) {
+        rightWindow.postMessage({ type: 'updateInfo', content }, '*');
+    }
+}
+
 function runPracticeCommand() {
-    fetch('run_script.php?action=runPracticeCommand', { method: 'GET' })
-    .then(response => response.text())
-    .then(data => console.log(data));
+    submitJob({ practice: true }, 'Practice');
 }
 
 function openScenesPage(level) {
@@ -115,17 +156,8 @@ function openTownPage(level, scene) {
 }
 
 function openTerminals(level, scene, town) {
-    fetch('PHP/run_script.php', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ level, scene, town })
-    })
-    .then(response => response.text())
-    .then(data => console.log(data));  
-
-    if (rightWindow) {
-        rightWindow.postMessage({ type: 'updateInfo', content: `Opening ${town} in ${scene} (${level} difficulty)` }, '*');
-    }
+    updateRightScreen(`Opening ${town} in ${scene} (${level} difficulty)`);
+    submitJob({ level, scene, town, agent: WEB_AGENT }, `${town} in ${scene} (${level} difficulty)`);
 }
 
 // Initially show the landing frame